@@ -0,0 +1,66 @@
+"""Benchmark suites for impromptu.
+
+Run from the repository root, eg.::
+
+    python -m benchmarks.widgets --output widgets.json
+
+Every suite stores its results as JSON (tagged with the current git
+revision) so runs can be compared between commits with ``--compare``.
+
+"""
+import json
+import platform
+import subprocess
+import time
+
+
+def percentile(samples, p):
+    """Returns the p-th percentile (0-100) of the samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(path, suite, params, results):
+    report = {
+        "suite": suite,
+        "revision": revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def compare(path, results, keys, metric):
+    """Prints the ratio of metric between a saved report and results.
+
+    Rows are matched on the values of ``keys``; ratios above 1.0 mean
+    the current run is slower than the saved one.
+    """
+    with open(path) as f:
+        previous = json.load(f)
+    index = {tuple(r.get(k) for k in keys): r for r in previous["results"]}
+    print(f"\ncompared to {previous.get('revision')} ({path}):")
+    for r in results:
+        old = index.get(tuple(r.get(k) for k in keys))
+        if old is None or not old.get(metric) or not r.get(metric):
+            continue
+        ratio = r[metric] / old[metric]
+        flag = "  <-- regression" if ratio > 1.25 else ""
+        label = " ".join(str(r.get(k)) for k in keys)
+        print(f"  {label:<40} {metric} x{ratio:.2f}{flag}")
@@ -0,0 +1,280 @@
+"""Scaling benchmarks for the Registrar flow operations.
+
+For every graph size the suite registers that many questions and times
+put, get, insert, branch, merge and skip on it, plus a full traversal of
+StaticMessages through Impromptu.prompt on a Headless cli. Each row holds
+the time per operation and the memory the operation left allocated (the
+registry itself for put), per node and per operation, so the curves over
+10^2..10^5 nodes show how each operation scales.
+
+Example::
+
+    python -m benchmarks.registrar --sizes 100 1000 10000 100000 \\
+        --output registrar.json
+
+"""
+import argparse
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks import compare, save
+from impromptu import Impromptu, fields
+from impromptu.utils.headless import Headless
+from impromptu.utils.registrar import Registrar
+
+
+def questions(n, prefix="q"):
+    # the registrar only needs the name of a question
+    return [SimpleNamespace(name=f"{prefix}{i}") for i in range(n)]
+
+
+def registered(n):
+    r = Registrar()
+    for q in questions(n):
+        r.put(q)
+    return r
+
+
+def ahead(r, steps):
+    # key of the node steps after the running one, None past the end
+    key = r.subsequent()
+    for _ in range(steps - 1):
+        if key is None:
+            break
+        key = r.registry[key]["next"]
+    return key
+
+
+def to_middle(r, n):
+    for _ in range(n // 2):
+        r.get()
+
+
+class Meter(object):
+    """Samples the time, or the traced memory, taken by each operation."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.samples = []
+
+    def start(self):
+        if self.memory:
+            return tracemalloc.get_traced_memory()[0]
+        return time.perf_counter()
+
+    def stop(self, mark):
+        if self.memory:
+            self.samples.append(tracemalloc.get_traced_memory()[0] - mark)
+        else:
+            self.samples.append(time.perf_counter() - mark)
+
+
+def metered(bench, n, ops):
+    """Runs bench timed, then again from scratch under tracemalloc.
+
+    bench(n, ops, memory) returns the count of operations and one Meter
+    per kind of operation. Returns the count and a (seconds, bytes) pair
+    per kind.
+    """
+    count, timed = bench(n, ops, False)
+    tracemalloc.start()
+    try:
+        _, traced = bench(n, ops, True)
+    finally:
+        tracemalloc.stop()
+    return count, [(sum(t.samples), sum(m.samples))
+                   for t, m in zip(timed, traced)]
+
+
+def measure(setup):
+    """Times setup()() then runs a fresh setup()() under tracemalloc.
+
+    Returns (seconds, bytes left allocated); tracing slows allocations
+    down too much to time the same run.
+    """
+    fn = setup()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    fn = setup()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    fn()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, after - before
+
+
+def bench_put(n, ops):
+    def setup():
+        r = Registrar()
+        qs = questions(n)
+
+        def run():
+            for q in qs:
+                r.put(q)
+        return run
+    return n, measure(setup)
+
+
+def bench_get(n, ops):
+    def setup():
+        r = registered(n)
+
+        def run():
+            while r.get() is not None:
+                pass
+        return run
+    return n, measure(setup)
+
+
+def bench_insert(n, ops, memory):
+    r = registered(n)
+    to_middle(r, n)
+    qs = questions(ops, "i")
+    inserts = Meter(memory)
+    for q in qs:
+        mark = inserts.start()
+        r.insert(q)
+        inserts.stop(mark)
+        r.get()
+    return ops, [inserts]
+
+
+def bench_branch_merge(n, ops, memory):
+    r = registered(n)
+    to_middle(r, n)
+    qs = questions(ops, "b")
+    branches, merges = Meter(memory), Meter(memory)
+    for q in qs:
+        mark = branches.start()
+        r.branch(q)
+        branches.stop(mark)
+        origin = r.running
+        r.get()
+        # merge back one question into the chain that was cut off
+        first = r.branched[origin][0]
+        target = r.registry[first]["next"]
+        mark = merges.start()
+        r.merge(target)
+        merges.stop(mark)
+        r.get()
+    return ops, [branches, merges]
+
+
+def bench_skip(n, ops, memory):
+    r = registered(n)
+    to_middle(r, n)
+    skips = Meter(memory)
+    for _ in range(ops):
+        target = ahead(r, 2)
+        mark = skips.start()
+        r.skip(target)
+        skips.stop(mark)
+        r.get()
+    return ops, [skips]
+
+
+def bench_traverse(n, ops):
+    def setup():
+        instance = Impromptu()
+        for i in range(n):
+            instance.register(fields.StaticMessage(f"s{i}", "Note:"))
+        cli = Headless(80, 24, events=Headless.script(*["Enter"] * n))
+        return lambda: instance.prompt(cli, instance.registrar)
+    return n, measure(setup)
+
+
+def row(op, n, count, seconds, memory=None):
+    result = {
+        "op": op,
+        "n": n,
+        "ops": count,
+        "total_ms": round(seconds * 1e3, 3),
+        "per_op_us": round(seconds * 1e6 / max(count, 1), 3),
+    }
+    if memory is not None:
+        result["mem_bytes"] = memory
+        result["mem_per_node"] = round(memory / max(n, 1), 1)
+        result["mem_per_op"] = round(memory / max(count, 1), 1)
+    return result
+
+
+def run_size(n, ops, traverse):
+    ops = max(1, min(ops, n // 4))
+    results = []
+
+    def attempt(names, bench):
+        # a failing operation is recorded instead of ending the run, so
+        # revisions where it is broken can still be compared
+        try:
+            results.extend(bench())
+        except Exception as err:
+            results.extend({"op": op, "n": n, "error": repr(err)}
+                           for op in names)
+
+    def put():
+        count, (seconds, memory) = bench_put(n, ops)
+        return [row("put", n, count, seconds, memory)]
+
+    def get():
+        count, (seconds, memory) = bench_get(n, ops)
+        return [row("get", n, count, seconds, memory)]
+
+    def insert():
+        count, [inserts] = metered(bench_insert, n, ops)
+        return [row("insert", n, count, *inserts)]
+
+    def branch_merge():
+        count, [branches, merges] = metered(bench_branch_merge, n, ops)
+        return [row("branch", n, count, *branches),
+                row("merge", n, count, *merges)]
+
+    def skip():
+        count, [skips] = metered(bench_skip, n, ops)
+        return [row("skip", n, count, *skips)]
+
+    def traversal():
+        count, (seconds, memory) = bench_traverse(n, ops)
+        return [row("traverse", n, count, seconds, memory)]
+
+    attempt(["put"], put)
+    attempt(["get"], get)
+    attempt(["insert"], insert)
+    attempt(["branch", "merge"], branch_merge)
+    attempt(["skip"], skip)
+    if traverse:
+        attempt(["traverse"], traversal)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[100, 1000, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=1000,
+                        help="operations timed per size (at most n/4)")
+    parser.add_argument("--no-traverse", action="store_true")
+    parser.add_argument("--output", default="registrar.json")
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args(argv)
+
+    results = []
+    for n in args.sizes:
+        for r in run_size(n, args.ops, not args.no_traverse):
+            results.append(r)
+            if "error" in r:
+                print(f"{r['op']:<9}{r['n']:>8}  failed: {r['error']}")
+                continue
+            print(f"{r['op']:<9}{r['n']:>8}  ops {r['ops']:>7}  "
+                  f"{r['per_op_us']:>12.2f}us/op  "
+                  f"mem/node {r.get('mem_per_node', '-')}  "
+                  f"mem/op {r.get('mem_per_op', '-')}")
+    save(args.output, "registrar", vars(args), results)
+    if args.compare:
+        compare(args.compare, results, ("op", "n"), "per_op_us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Time spent validating a TextInput on the prompt thread while typing.
+
+Runes are typed one at a time, --gap milliseconds apart. Every mode
+validates the text with the same regex conditions, and all but "regex"
+add a slow check (eg. a DNS lookup against a local resolver stand-in)
+that takes --cost milliseconds:
+
+* regex: only regex conditions;
+* blocking: the slow check runs on the prompt thread;
+* background: the slow check runs on the shared thread pool;
+* debounced: the slow check runs in the background once typing pauses;
+* async: the slow check is a coroutine awaited on the shared loop.
+
+Example::
+
+    python -m benchmarks.validation --events 100 --gap 5 --cost 20 \\
+        --output validation.json
+
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks import compare, percentile, save
+from impromptu import fields
+from impromptu.utils.headless import Headless
+
+MODES = ("regex", "blocking", "background", "debounced", "async")
+REGEXES = (r"\s", r"^[^@]*$", r"@.*@", r"\.\.")
+TYPED = "ada.lovelace@analytical-engine.example "
+
+
+class Typist(Headless):
+    """A Headless cli that hands out its events gap seconds apart."""
+
+    def __init__(self, gap, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gap = gap
+
+    def poll_event(self):
+        time.sleep(self.gap)
+        return super().poll_event()
+
+
+def build(mode, cost, samples):
+    class Timed(fields.TextInput):
+        __slots__ = ()
+
+        def _handle_validations(self):
+            start = time.perf_counter()
+            super()._handle_validations()
+            samples.append(time.perf_counter() - start)
+
+    def resolve(self):
+        time.sleep(cost)
+        return self._text.endswith(".invalid")
+
+    async def resolve_async(self):
+        await asyncio.sleep(cost)
+        return self._text.endswith(".invalid")
+
+    q = Timed("email", "Email:")
+    for regex in REGEXES:
+        q.validate(regex)(lambda self: None)
+    if mode == "blocking":
+        q.validate(resolve)(lambda self: None)
+    elif mode == "background":
+        q.validate(resolve, background=True)(lambda self: None)
+    elif mode == "debounced":
+        q.validate(resolve, debounce=0.2,
+                   background=True)(lambda self: None)
+    elif mode == "async":
+        q.validate(resolve_async)(lambda self: None)
+    return q
+
+
+def bench(mode, events, gap, cost):
+    typed = (TYPED * (events // len(TYPED) + 1))[:events]
+    cli = Typist(gap, 80, 24, events=Headless.script(typed, "Enter"))
+    samples = []
+    q = build(mode, cost, samples)
+    q.cli = cli
+    start = time.perf_counter()
+    q.ask()
+    elapsed = time.perf_counter() - start
+    spent = [s * 1e6 for s in samples]
+    return {
+        "mode": mode,
+        "events": events,
+        "cost_ms": cost * 1e3,
+        "p50_us": round(percentile(spent, 50), 2),
+        "p99_us": round(percentile(spent, 99), 2),
+        "blocked_ms": round(sum(spent) / 1e3, 2),
+        "total_ms": round(elapsed * 1e3, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--gap", type=float, default=5.0,
+                        help="milliseconds between two typed runes")
+    parser.add_argument("--cost", type=float, default=20.0,
+                        help="milliseconds taken by the slow check")
+    parser.add_argument("--output", default="validation.json")
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args(argv)
+
+    results = []
+    for mode in args.modes:
+        r = bench(mode, args.events, args.gap / 1e3, args.cost / 1e3)
+        results.append(r)
+        print(f"{r['mode']:<11}p50 {r['p50_us']:>10.1f}us  "
+              f"p99 {r['p99_us']:>10.1f}us  "
+              f"blocked {r['blocked_ms']:>9.1f}ms  "
+              f"total {r['total_ms']:>9.1f}ms")
+    save(args.output, "validation", vars(args), results)
+    if args.compare:
+        compare(args.compare, results, ("mode",), "p50_us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Per-keystroke latency benchmarks for every widget.
+
+Each widget is driven through ask()/_main() on a Headless cli with a
+synthetic key stream. For every event the suite records the time until
+the next event is picked up (handling, validations and redraw), the
+number of cells that reached the backend and, in a separate pass under
+tracemalloc, the peak bytes allocated while handling it.
+
+Example::
+
+    python -m benchmarks.widgets --sizes 80x24 --text-lengths 1 1000 \\
+        --choice-counts 10 100000 --output widgets.json
+
+"""
+import argparse
+import time
+import tracemalloc
+from itertools import cycle, islice
+
+from benchmarks import compare, percentile, save
+from impromptu import fields
+from impromptu.utils.framebuffer import FrameBuffer
+from impromptu.utils.headless import Headless
+
+
+TEXT_STREAM = ["x", "ArrowLeft", "ArrowRight", "Backspace",
+               "Home", "y", "Delete", "End"]
+CHOICE_STREAM = ["ArrowDown", "ArrowDown", "ArrowDown", "ArrowUp"]
+MULTI_STREAM = ["ArrowDown", "Space", "ArrowDown", "ArrowUp", "Space"]
+TYPEAHEAD_STREAM = ["4", "2", "7", "Backspace", "1", "ArrowDown",
+                    "Backspace", "Backspace", "Backspace", "c", "e",
+                    "Backspace", "Backspace"]
+STATIC_STREAM = ["a"]
+
+
+class Recorder(object):
+    """Marks the start of every handled event on a Headless cli."""
+
+    def __init__(self, cli, trace=False):
+        self.cli = cli
+        self.trace = trace
+        self.times = []
+        self.writes = []
+        self.allocs = []
+        self.index = None
+        self._base = 0
+
+    def mark(self):
+        self.times.append(time.perf_counter())
+        self.writes.append(self.cli.writes)
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            self.allocs.append(peak - self._base)
+            tracemalloc.reset_peak()
+            self._base = current
+
+    def deltas(self, values):
+        return [b - a for a, b in zip(values, values[1:])]
+
+
+def instrument(cls, recorder):
+    """Subclasses a widget so that each handled event gets marked."""
+    def _handle_events(self, *args, **kwargs):
+        recorder.mark()
+        return cls._handle_events(self, *args, **kwargs)
+    return type("Timed" + cls.__name__, (cls,),
+                {"__slots__": (), "_handle_events": _handle_events})
+
+
+def build(widget, length):
+    if widget in ("text", "password"):
+        cls = fields.TextInput if widget == "text" else fields.PasswordInput
+        return cls, {"name": widget, "query": "Type something:"}
+    if widget in ("choice", "multi", "typeahead"):
+        cls = fields.MultiSelect if widget == "multi" else \
+            fields.ChoiceSelect
+        choices = [f"choice-{i}" for i in range(length)]
+        return cls, {"name": widget, "query": "Pick one:",
+                     "choices": choices}
+    return fields.StaticMessage, {"name": widget, "query": "Note:",
+                                  "message": "lorem ipsum " * 20}
+
+
+def stream(widget, events):
+    steps = {
+        "text": TEXT_STREAM, "password": TEXT_STREAM,
+        "choice": CHOICE_STREAM, "multi": MULTI_STREAM,
+        "typeahead": TYPEAHEAD_STREAM,
+    }.get(widget, STATIC_STREAM)
+    return Headless.script(*islice(cycle(steps), events), "Enter")
+
+
+def run_once(widget, size, length, events, trace):
+    w, h = size
+    cli = Headless(w, h, events=stream(widget, events))
+    recorder = Recorder(cli, trace)
+    cls, kwargs = build(widget, length)
+    q = instrument(cls, recorder)(**kwargs)
+    q.cli = FrameBuffer(cli)
+    if widget in ("text", "password"):
+        words = "lorem ipsum dolor sit amet "
+        q._text = (words * (length // len(words) + 1))[:length]
+        q._move_to_end()
+    built = None
+    if trace:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    if widget == "typeahead":
+        q.setup(typeahead=True)
+        # the index is built while the question is asked; charge the time
+        # until it is ready, even if the stream is done before that
+        built = q._build_index()
+        built.add_done_callback(
+            lambda f: setattr(recorder, "index", time.perf_counter() - start))
+    try:
+        q.ask()
+    finally:
+        recorder.mark()
+        if trace:
+            tracemalloc.stop()
+    if built is not None:
+        built.result()
+    return recorder
+
+
+def bench(widget, size, length, events, allocations=True):
+    recorder = run_once(widget, size, length, events, trace=False)
+    latency = [d * 1e6 for d in recorder.deltas(recorder.times)]
+    writes = recorder.deltas(recorder.writes)
+    result = {
+        "widget": widget,
+        "size": f"{size[0]}x{size[1]}",
+        "length": length,
+        "events": len(latency),
+        "p50_us": round(percentile(latency, 50), 2),
+        "p99_us": round(percentile(latency, 99), 2),
+        "writes_per_event": round(sum(writes) / max(len(writes), 1), 2),
+    }
+    if recorder.index is not None:
+        result["index_ms"] = round(recorder.index * 1e3, 2)
+    if allocations:
+        traced = run_once(widget, size, length, events, trace=True)
+        allocs = traced.allocs[1:]
+        result["alloc_p50_bytes"] = percentile(allocs, 50)
+        result["alloc_p99_bytes"] = percentile(allocs, 99)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--widgets", nargs="+",
+                        default=["text", "password", "choice", "multi",
+                                 "typeahead", "static"])
+    parser.add_argument("--sizes", nargs="+", default=["80x24", "300x90"])
+    parser.add_argument("--text-lengths", nargs="+", type=int,
+                        default=[1, 100, 10000, 100000])
+    parser.add_argument("--choice-counts", nargs="+", type=int,
+                        default=[10, 1000, 100000, 1000000])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--no-allocations", action="store_true")
+    parser.add_argument("--output", default="widgets.json")
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(n) for n in s.split("x")) for s in args.sizes]
+    results = []
+    for widget in args.widgets:
+        if widget in ("text", "password"):
+            lengths = args.text_lengths
+        elif widget in ("choice", "multi", "typeahead"):
+            lengths = args.choice_counts
+        else:
+            lengths = [0]
+        for size in sizes:
+            for length in lengths:
+                r = bench(widget, size, length, args.events,
+                          not args.no_allocations)
+                results.append(r)
+                print(f"{r['widget']:<9}{r['size']:>8}{r['length']:>9}  "
+                      f"p50 {r['p50_us']:>10.1f}us  "
+                      f"p99 {r['p99_us']:>10.1f}us  "
+                      f"writes {r['writes_per_event']:>8.1f}  "
+                      f"alloc p50 {r.get('alloc_p50_bytes', '-')}  "
+                      f"index ms {r.get('index_ms', '-')}")
+    save(args.output, "widgets", vars(args), results)
+    if args.compare:
+        compare(args.compare, results, ("widget", "size", "length"),
+                "p50_us")
+
+
+if __name__ == "__main__":
+    main()
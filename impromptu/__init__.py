@@ -1,5 +1,13 @@
+import asyncio
+from functools import partial
 from intermezzo import Intermezzo as mzo
 from impromptu.utils.registrar import Registrar
+from impromptu.utils.framebuffer import FrameBuffer
+from impromptu.utils.eventloop import EventLoop
+from impromptu.utils.executor import shared_pool
+from impromptu.utils.prefetch import Prefetcher
+from impromptu.utils.sinks import as_sink
+from impromptu.utils import checkpoint
 
 
 class Impromptu(object):
@@ -8,12 +16,24 @@ class Impromptu(object):
     Attributes:
         index (int): The current index of the Question being asked.
         questions (list(Question)): The internal collection of Questions.
+        prefetch (int): How many of the upcoming Questions get their
+            mount() started on a worker while the current one is asked.
+            Defaults to 0 (off); only enable it for mounts that do not
+            depend on the answers to the Questions before them.
+        prefetcher (Prefetcher): The prefetcher of the running prompt.
+        responses (dict): name -> answer of every Question asked so far,
+            filled in as each one is closed.
+        sinks (list): Response sinks every answer is emitted to.
 
     """
 
-    def __init__(self):
+    def __init__(self, prefetch=0, sinks=()):
         self.responses = {}
+        self.sinks = [as_sink(s) for s in sinks]
         self.registrar = Registrar()
+        self.loop = None
+        self.prefetch = prefetch
+        self.prefetcher = None
 
     def register(self, question):
         """
@@ -24,44 +44,285 @@ class Impromptu(object):
         """
         self.registrar.put(question)
 
+    def spawn(self):
+        """
+        Return a new run of this form that shares its Question definitions
+
+        Every registered Question is spawned (see Question.spawn), and so
+        is any Question a logic jump adds to the new run, so runs of the
+        same form can go on concurrently. Hooks should read answers
+        through the registrar (q.registrar.lookup(name).data.result), the
+        Questions they close over are the shared definitions.
+        """
+        other = Impromptu(prefetch=self.prefetch)
+        other.registrar.adopt = _adopt
+        key = self.registrar.entry
+        while key is not None:
+            node = self.registrar.registry[key]
+            other.registrar.put(node.data)
+            key = node.next
+        return other
+
+    def add_sink(self, sink):
+        """
+        Emit every answer to sink as soon as its Question is closed
+
+        Args:
+            sink: A Sink (see impromptu.utils.sinks) or a function called
+                with the name and the answer of each Question.
+        """
+        sink = as_sink(sink)
+        self.sinks.append(sink)
+        return sink
+
+    def checkpoint(self, path, every=1):
+        """
+        Checkpoint the form to path every few answers
+
+        Args:
+            path (str): The append-only checkpoint file.
+            every (int): How many answers to take between checkpoints.
+        """
+        sink = checkpoint.Checkpointer(path, self.registrar, self.responses,
+                                       every)
+        return self.add_sink(sink)
+
+    def resume(self, path, questions=(), every=1):
+        """
+        Continue the form checkpointed to path, then keep checkpointing it
+
+        Call it after registering the Questions of the form, before
+        start(). Questions answered before the checkpoint get their answer
+        back and are not asked again. Starts from scratch if path holds no
+        checkpoint yet.
+
+        Args:
+            path (str): The checkpoint file.
+            questions (iterable(Question)): Questions that logic jumps
+                insert into the flow; registered ones are found by name.
+            every (int): How many answers to take between checkpoints.
+        """
+        sink = checkpoint.Checkpointer(path, self.registrar, self.responses,
+                                       every)
+        state = checkpoint.load(path)
+        if state is not None:
+            known = {name: node.data
+                     for name, node in self.registrar.names.items()}
+            known.update((q.name, q) for q in questions)
+            checkpoint.restore(self.registrar, state, known)
+            for name, answer in state["answers"].items():
+                known[name].result = answer
+                self.responses[name] = answer
+            cursor = self.registrar.registry.get(self.registrar.cursor)
+            if cursor is not None:
+                # the screen starts out empty again
+                cursor.data.linenum = 0
+        # start over from a single checkpoint, dropping any torn line
+        sink.compact()
+        return self.add_sink(sink)
+
+    def _respond(self, query):
+        self.responses[query.name] = query.result
+        for sink in self.sinks:
+            sink.emit(query.name, query.result)
+
+    def _bind(self, query, cli, registrar):
+        query.cli = cli
+        query.loop = self.loop
+        query.registrar = registrar
+
+    def _open(self, cli, registrar):
+        # returns the framed cli and the prefetcher of a prompt
+        if not isinstance(cli, FrameBuffer):
+            # draw through a shadow frame so only changed cells hit the cli
+            cli = FrameBuffer(cli)
+        self.loop = EventLoop(cli)
+        prefetcher = None
+        if self.prefetch:
+            # prefetched mounts see the same cli, loop and registrar
+            prefetcher = Prefetcher(registrar, self.prefetch,
+                                    prepare=lambda q: self._bind(q, cli,
+                                                                 registrar))
+        self.prefetcher = prefetcher
+        return cli, prefetcher
+
+    def _close(self, prefetcher):
+        if prefetcher is not None:
+            prefetcher.close()
+        self.loop.close()
+
+    def _unmounted(self, query, did_unmount):
+        if did_unmount is False:
+            query.reset()
+            query.restart()
+        else:
+            query.close()
+            self._respond(query)
+
     def prompt(self, cli, registrar):
-        while True:
-            # prepare query variables
-            query = registrar.get()
-            if query is None:
-                break
-            query.cli = cli
-            query.registrar = registrar
-            # handle query lifecycle
-            should_mount = query.mount()
-            if should_mount is not False:
-                query.clear_below()
-                query.ask()
-                did_unmount = query.unmount()
-                if did_unmount is False:
-                    query.reset()
-                    query.restart()
+        cli, prefetcher = self._open(cli, registrar)
+        try:
+            while True:
+                # prepare query variables
+                query = registrar.get()
+                if query is None:
+                    break
+                self._bind(query, cli, registrar)
+                # handle query lifecycle
+                if prefetcher is not None:
+                    should_mount = prefetcher.mount(registrar.running, query)
+                else:
+                    should_mount = query.mount()
+                if should_mount is not False:
+                    query.clear_below()
+                    if prefetcher is not None:
+                        # mount what comes next while this one is answered
+                        prefetcher.schedule()
+                    query.ask()
+                    self._unmounted(query, query.unmount())
                 else:
                     query.close()
-            else:
-                query.close()
+        finally:
+            self._close(prefetcher)
 
-    def start(self):
+    def answer(self, answers):
         """
-        TODO: ...
+        Run the form with answers instead of a terminal
+
+        Goes through the same lifecycle as start() (mount, validations,
+        unmount and its logic jumps) without rendering anything, so mount
+        and unmount must not draw. Questions missing from answers are
+        submitted as they come. Stops at the first answer an unmount
+        rejects, since it would be rejected again, and at the first that
+        is not one of the choices of its Question.
+
+        Args:
+            answers (dict): Question name -> answer; a str for inputs, a
+                choice for a ChoiceSelect, a list of them for a
+                MultiSelect.
+
+        Returns:
+            dict: Question name -> the conditions of the validations that
+                failed, ["unmount"] if the answer was rejected, or
+                ["choice"] if it is not one of the choices.
+        """
+        registrar = self.registrar
+        errors = {}
+        try:
+            while True:
+                query = registrar.get()
+                if query is None:
+                    break
+                self._bind(query, None, registrar)
+                if query.mount() is False:
+                    continue
+                failed = query.answer(answers.get(query.name))
+                if failed:
+                    errors[query.name] = failed
+                if "choice" in failed:
+                    # the question has no answer to respond with
+                    break
+                if query.unmount() is False:
+                    errors.setdefault(query.name, []).append("unmount")
+                    break
+                self._respond(query)
+        finally:
+            for sink in self.sinks:
+                sink.close()
+        return errors
+
+    async def prompt_async(self, cli, registrar):
+        """Same as prompt(), on the running asyncio loop.
+
+        Questions await their input instead of blocking a thread, so one
+        loop can prompt many forms at once. Mount and unmount hooks may
+        block (eg. download a file), so they run on the shared thread
+        pool.
         """
-        # initialize Intermezzo
-        err = mzo.init()
+        cli, prefetcher = self._open(cli, registrar)
+        try:
+            while True:
+                query = registrar.get()
+                if query is None:
+                    break
+                self._bind(query, cli, registrar)
+                if prefetcher is not None:
+                    mount = partial(prefetcher.mount, registrar.running,
+                                    query)
+                else:
+                    mount = query.mount
+                should_mount = await _hook(query, "mount", mount)
+                if should_mount is not False:
+                    query.clear_below()
+                    if prefetcher is not None:
+                        prefetcher.schedule()
+                    await query.ask_async()
+                    did_unmount = await _hook(query, "unmount",
+                                              query.unmount)
+                    self._unmounted(query, did_unmount)
+                else:
+                    query.close()
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        finally:
+            self._close(prefetcher)
+
+    def cancel(self):
+        """Stops a running prompt; the waiting Question raises EOFError."""
+        if self.loop is not None:
+            self.loop.close()
+
+    def _init(self, cli):
+        # initialize the backend
+        if cli is None:
+            cli = mzo
+        err = cli.init()
         if err:
             raise(Exception(err))
         # TODO: set mzo settings on init
-        mzo.set_input_mode(mzo.input("Esc"))
-        mzo.set_output_mode(mzo.output("256"))
+        cli.set_input_mode(cli.input("Esc"))
+        cli.set_output_mode(cli.output("256"))
+        return cli
+
+    def _finish(self, cli):
+        cli.close()
+        for sink in self.sinks:
+            sink.close()
+
+    def start(self, cli=None):
+        """Runs the registered Questions until the flow is exhausted.
+
+        Args:
+            cli: The terminal backend to render to. Defaults to Intermezzo;
+                pass a Headless instance to run without a TTY.
+        """
+        cli = self._init(cli)
+        try:
+            self.prompt(cli, self.registrar)
+        finally:
+            self._finish(cli)
+
+    async def start_async(self, cli=None):
+        """Same as start(), awaitable from within an asyncio application.
 
+        Runs on the running loop, see prompt_async().
+        """
+        cli = self._init(cli)
         try:
-            self.prompt(mzo, self.registrar)
+            await self.prompt_async(cli, self.registrar)
         finally:
-            mzo.close()
-            for o in self.registrar.registry.values():
-                q = o["data"]
-                self.responses[q.name] = q.result
+            self._finish(cli)
+
+
+async def _hook(query, name, fn):
+    # runs a lifecycle hook of query off the asyncio loop, if it has one
+    if query.lifecycle[name] is None:
+        return fn()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(shared_pool("thread"), fn)
+
+
+def _adopt(question):
+    # definitions are spawned, copies already spawned are kept
+    return question if question.definition is not None else question.spawn()
@@ -1,9 +1,15 @@
-import threading
+import copy
 from functools import wraps
 from functools import partial
-from collections import deque
 from intermezzo import Intermezzo as mzo
 from impromptu.utils.multimethod import configure
+from impromptu.utils.eventloop import EventLoop
+from impromptu.utils.executor import HandlerExecutor
+from impromptu.utils.events import EventRing
+from impromptu.utils.framebuffer import FrameBuffer
+from impromptu.utils.keymap import Keymap
+from impromptu.utils.theme import PLAIN, styled
+from ._template import StateField, Template, freeze, state_fields, uniform
 
 
 class Question(object):
@@ -27,16 +33,22 @@ class Question(object):
         widget (str): The Question component used.
         name (str): A name to use when storing the responses to each Question.
         query (str): The content of the question for prompting.
+        colormap (tuple): The colormap of the query.
         default (str): The default answer. Defaults to "".
+        template (Template): The shared config, hooks and keymap.
+        definition (Question): The Question this one was spawned from,
+            None for definitions.
         result (str): The value of the response to the query.
-        config (dict): Dict holding rendering details specific to each key.
+        config (mapping): Read-only rendering details specific to each key,
+            changed through setup().
+        theme (Theme): The config compiled into Styles and StyledTexts,
+            which is what the widgets draw with.
         linenum (int): The line number to which the Question is being rendered
 
     Note:
         Config keys include:
         * icon (tuple): The prefix added to each querystring. Default: [?],
     ? is Green.
-        * query (tuple): The querystring. Configured on init.
         * prompt (tuple): Symbol for the start of a textbox. Default: », Red.
     (Text/Password only)
 
@@ -48,6 +60,8 @@ class Question(object):
     (Multi only)
         * inputs (triplet): Color for the user inputted text.
     (Text/Password only)
+        * ghost (triplet): Color for the completion shown after the cursor.
+    Default: bold Black. (Text only)
         * active (triplet): Color state for choice text when the cursor is on
     top of a choice. Default: Cyan. (Choice/Multi only)
         * inactive (triplet): Color state for choice text when the cursor is
@@ -55,17 +69,48 @@ class Question(object):
         * linespace (int): Set the number of vertical space to occupy between
     Questions.
 
+        Everything that changes while a Question is asked (result, linenum,
+        the input text, the selection, ...) is kept in a State with
+        __slots__, made when the Question is reached; see _template.
+
     Todo:
         * loaders and spinners
         * tooltips/help messages
-        * autocomplete
 
     """
+    __slots__ = ("name", "query", "colormap", "default", "template",
+                 "definition", "_state")
+
+    # key name (or chord) -> name of the method handling it
+    KEYMAP = {}
+    widget = ""
+
+    class State(object):
+        """What changes while the Question is asked."""
+        __slots__ = ("cli", "loop", "registrar", "executor", "result",
+                     "linenum", "end_signal", "evt_stream", "_chord",
+                     "_evt_mutex", "_key_event", "_error_event")
+
+        def __init__(self):
+            self.cli = None
+            self.loop = None
+            self.registrar = None
+            self.executor = None
+            self.result = ""
+            self.linenum = 0
+            self.end_signal = False
+            self.evt_stream = EventRing(20)
+            self._chord = None
+            self._evt_mutex = True
+            self._key_event = None
+            self._error_event = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        state_fields(cls)
 
     def __init__(self, name, query, default="",
                  color=None, colormap=None):
-        self._threads = []
-        self._keys_in_use = []
         # set variables sent through initialization
         self.name = name
         self.query = query
@@ -73,31 +118,64 @@ class Question(object):
         if color is None:
             color = (0, 0, 0)
         if colormap is None:
-            query_colormap = [color for _ in query]
+            self.colormap = uniform(tuple(color), len(query))
         else:
-            query_colormap = colormap
-        # set variables pass through the main prompt loop
-        self.cli = None
-        self.loop = None
-        self.registrar = None
-        # set configuration variables
-        self.widget = ""
-        self.result = ""
-        self.linenum = 0
-        self.config = {}
-        self.config["linespace"] = 2
-        self.config["icon"] = ("[?]", [(0, 0, 0), (3, 0, 0), (0, 0, 0)])
-        self.config["query"] = (query, query_colormap)
-        self.config["refresh"] = False
-        self.config["result"] = (4, 0, 0)
-        self.lifecycle = {}
-        self.lifecycle["mount"] = None
-        self.lifecycle["unmount"] = None
-        self.lifecycle["updates"] = {}
-        self.lifecycle["validations"] = {}
-        self.evt_mutex = True
-        self.evt_stream = deque(maxlen=20)
-        self.end_signal = False
+            self.colormap = freeze(colormap)
+        self.definition = None
+        self._state = None
+        self.template = self._class_template()
+
+    @classmethod
+    def _defaults(cls):
+        # the config every Question of the class starts with
+        return {
+            "linespace": 2,
+            "icon": ("[?]", [(0, 0, 0), (3, 0, 0), (0, 0, 0)]),
+            "refresh": False,
+            "result": (4, 0, 0),
+        }
+
+    @classmethod
+    def _class_template(cls):
+        # made once per widget class and shared by its instances
+        template = cls.__dict__.get("_template")
+        if template is None:
+            template = Template.make(cls._defaults(), cls._class_keymap())
+            cls._template = template
+        return template
+
+    def __getattr__(self, name):
+        # only called for the fields of a State not made yet
+        if isinstance(getattr(type(self), name, None), StateField) and \
+                self._state is None:
+            return getattr(self._new_state(), name)
+        raise AttributeError(
+            f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def _new_state(self):
+        self._state = self.State()
+        self._init_state()
+        return self._state
+
+    def _init_state(self):
+        # the parts of a new State that depend on the Question
+        pass
+
+    @property
+    def config(self):
+        return self.template.config
+
+    @property
+    def lifecycle(self):
+        return self.template.lifecycle
+
+    @property
+    def keymap(self):
+        return self.template.keymap
+
+    @property
+    def theme(self):
+        return self.template.theme
 
     def _partial(self, f):
         # TODO: update to account for self-less functions passed in or
@@ -112,15 +190,53 @@ class Question(object):
                 return True
         return f
 
-    def _poll_event(self):
-        e = self.cli.poll_event()
-        self.evt_stream.append(e)
+    @property
+    def evt_mutex(self):
+        return self._evt_mutex
+
+    @evt_mutex.setter
+    def evt_mutex(self, value):
+        # handing the input back wakes the loop up to process queued events
+        self._evt_mutex = value
+        if value and self.loop is not None:
+            self.loop.post()
+
+    @classmethod
+    def _class_keymap(cls):
+        # compiled once per widget class and shared by its instances
+        keymap = cls.__dict__.get("_keymap")
+        if keymap is None:
+            keymap = Keymap(cls.KEYMAP, mzo.key)
+            cls._keymap = keymap
+        return keymap
+
+    def _wake(self):
+        # let the loop redraw whatever a finished handler changed
+        if self.loop is not None:
+            self.loop.post()
+
+    def set_executor(self, pool=None, limit=4, policy="coalesce"):
+        """Configures how update and validation handlers are run.
+
+        Args:
+            pool: A concurrent.futures thread pool, or "thread" for the
+                shared one (the default). Handlers get the Question, which
+                cannot be pickled, so process pools are refused.
+            limit (int): Handlers of this Question allowed to run at once.
+            policy (str): How repeated triggers of a handler are treated,
+                see HandlerExecutor.
+        """
+        self.executor = HandlerExecutor(pool, limit, policy, self._wake)
+        return self
+
+    def _submit_handler(self, key, fn, policy=None):
+        if self.executor is None:
+            self.set_executor()
+        self.executor.submit(key, fn, policy=policy)
 
     def _clean_threads(self):
-        is_alive = [t for t in self._threads if t.is_alive()]
-        for t in is_alive:
-            t.join()
-        self._threads = []
+        if self.executor is not None:
+            self.executor.join()
 
     def mount(self):
         """Use to set up everything necessary for the Question.
@@ -161,9 +277,9 @@ class Question(object):
         return f
 
     def close(self):
+        # make sure no handler is still drawing over the closed question
+        self._clean_threads()
         # render with result
-        x, y = 0, self.linenum
-        icon, query = self.config["icon"], self.config["query"]
         result = self.result
         if type(result) is list:
             count = len(result)
@@ -171,37 +287,28 @@ class Question(object):
         if self.widget == "password":
             count = len(result)
             result = "".join(["*" for _ in range(count)])
-        result_cm = [self.config["result"] for _ in result]
-        prompt = f"{icon[0]} {query[0]}  {result}"
-        colormap = icon[1] + [(0, 0, 0)] + query[1]  # [(0,0,0)] for the nbsp;
-        colormap = colormap + [(0, 0, 0,), (0, 0, 0)] + result_cm
-        for ch, colors in zip(prompt, colormap):
-            fg, attr, bg = colors
-            self.cli.set_cell(x, y, ch, fg | attr, bg)
-            x += 1
+        x = PLAIN.write(self.cli, self._draw_query(), self.linenum, "  ")
+        self.theme["result"].write(self.cli, x, self.linenum, result)
         # update line spacing of next question
         nq_key = self.registrar.subsequent()
         if nq_key:
-            nq = self.registrar.registry[nq_key]["data"]
+            nq = self.registrar.registry[nq_key].data
             if self.config["refresh"]:
                 nq.linenum = 0
                 self.cli.clear(0, 0)
             else:
                 nq.linenum = self.config["linespace"] + self.linenum
-                w, h = self.cli.size()
-                for y in range(self.linenum + 1, h + 1):
-                    for x in range(w):
-                        self.cli.set_cell(x, y, " ", 0, 0)
+                self.cli.clear_lines(self.linenum + 1)
+
+    def _draw_query(self):
+        # the icon, a plain space and the query; returns the column after
+        y = self.linenum
+        x = self.theme["icon"].draw(self.cli, 0, y)
+        x = PLAIN.write(self.cli, x, y, " ")
+        return styled(self.query, self.colormap).draw(self.cli, x, y)
 
     def render(self):
-        x, y = 0, self.linenum
-        icon, query = self.config["icon"], self.config["query"]
-        prompt = f"{icon[0]} {query[0]}"
-        colormap = icon[1] + [(0, 0, 0)] + query[1]  # [(0,0,0)] for the nbsp;
-        for ch, colors in zip(prompt, colormap):
-            fg, attr, bg = colors
-            self.cli.set_cell(x, y, ch, fg | attr, bg)
-            x += 1
+        self._draw_query()
 
     def redraw_all(self):
         """Updates the render loop to account for any changes to the Widget"""
@@ -211,6 +318,20 @@ class Question(object):
         self.result = ""
         self.end_signal = False
 
+    def spawn(self):
+        """Returns a copy of the Question for another run of the form.
+
+        The definition (query, template, choices) is shared with this
+        Question and the copy starts without a State, so serving a form to
+        many sessions does not copy every Question. Configure the Question
+        before spawning it.
+        """
+        other = copy.copy(self)
+        other.definition = self if self.definition is None else \
+            self.definition
+        other._state = None
+        return other
+
     def restart(self):
         self.registrar.cursor = self.registrar.running
         self.end_signal = False
@@ -223,100 +344,195 @@ class Question(object):
         Single/MultiSelect types will configure cursor, active, selected,
         unselected, and custom colors for each specified choice.
         """
+        changes = {}
         for k, v in kwargs.items():
             args = self._set_config(k, v)
             if not v or args is None:
                 # skip the parameters that have not been passed
                 # for some reason, if _set_config returns None
                 continue
-            self.config[k] = configure(*args)
+            changes[k] = configure(*args)
+        if changes:
+            self.template = self.template.with_config(**changes)
         return self
 
     def on_mount(self, fn, *args, **kwargs):
         if callable(fn):
-            self.lifecycle["mount"] = partial(fn, *args, **kwargs)
+            self.template = self.template.with_hook(
+                "mount", fn, *args, **kwargs)
 
     def on_unmount(self, fn, *args, **kwargs):
         if callable(fn):
-            self.lifecycle["unmount"] = partial(fn, *args, *kwargs)
+            self.template = self.template.with_hook(
+                "unmount", fn, *args, **kwargs)
 
     def clear_below(self):
-        w, h = self.cli.size()
-        for i in range(h):
-            y = i + self.linenum + 1
-            for x in range(w):
-                self.cli.set_cell(x, y, " ", 0, 0)
+        self.cli.clear_lines(self.linenum + 1)
         self.cli.flush()
 
     def _main(self):
         """Execute the main processes for the field at hand.
 
+        Blocks on the event loop until input arrives, a timer is due or
+        a handler finishes, and only redraws in response to one of those.
         Each widget/field will be implemented differently
         """
-        while True:
-            if self.end_signal:
-                break
-            if self.evt_mutex:
-                self._handle_validations()
-                self._poll_event()
-                self._handle_events()
-                self._handle_updates()
-                self.redraw_all()
-        self._clean_threads()
+        owns_loop = self._open_loop()
+        try:
+            self._handle_validations()
+            while not self.end_signal:
+                self._step(self.loop.wait(self.evt_mutex))
+            self._take_result()
+        finally:
+            self._clean_threads()
+            self._close_loop(owns_loop)
+
+    async def _main_async(self):
+        """Same as _main(), awaiting the event loop instead of blocking."""
+        owns_loop = self._open_loop()
+        try:
+            self._handle_validations()
+            while not self.end_signal:
+                self._step(await self.loop.wait_async(self.evt_mutex))
+            self._take_result()
+        finally:
+            # each handler that finishes wakes the loop up
+            while self.executor is not None and self.executor.active and \
+                    not self.loop.closed:
+                await self.loop.wait_async(False)
+            self._clean_threads()
+            self._close_loop(owns_loop)
+
+    def _open_loop(self):
+        # returns whether the Question made its own loop
+        self._key_event = self.cli.event("Key")
+        self._error_event = self.cli.event("Error")
+        owns_loop = self.loop is None or self.loop.closed
+        if owns_loop:
+            self.loop = EventLoop(self.cli)
+        return owns_loop
+
+    def _close_loop(self, owns_loop):
+        if owns_loop:
+            self.loop.close()
+            self.loop = None
+
+    def _step(self, e):
+        # handles what the loop woke up for
+        if e is None:
+            # woken up by a timer or a finished handler
+            self.redraw_all()
+            return
+        self.evt_stream.append(e)
+        self._handle_events()
+        self.redraw_all()
+        if not self.end_signal:
+            self._handle_validations()
 
-    def _handle_updates(self):
-        e = self.pull_events()[0]
-        if e["Type"] == self.cli.event("Key"):
-            fn = self.lifecycle["updates"].get(e["Key"], None)
-            if fn:
-                t = threading.Thread(target=fn)
-                self._threads.append(t)
-                t.start()
+    def _take_result(self):
+        # sets result from the input once the Question is submitted
+        pass
+
+    def _handle_events(self):
+        evt = self.evt_stream.latest()
+        if evt.type == self._key_event:
+            # from GoDoc for termbox-go: 'Ch' is invalid
+            # if it is 0 when the EventType is 'Key'
+            if evt.ch != 0:
+                self._chord = None
+                self._on_rune(chr(evt.ch))
+            else:
+                self._dispatch(evt.key)
+        elif evt.type == self._error_event:
+            # EventError
+            raise(Exception(evt.err))
+        return None
+
+    def _dispatch(self, code):
+        node = self.keymap.lookup(code, self._chord)
+        if node is None and self._chord is not None:
+            # the chord was abandoned, treat the key on its own
+            node = self.keymap.lookup(code)
+        if isinstance(node, dict):
+            # wait for the rest of the chord
+            self._chord = node
+            return
+        self._chord = None
+        if node is None:
+            return
+        if isinstance(node, str):
+            getattr(self, node)()
+        else:
+            # handlers are kept unbound so spawned copies share the keymap
+            self._submit_handler(node, partial(node, self))
+
+    def _on_rune(self, r):
+        pass
+
+    def _submit(self):
+        self.end_signal = True
 
     def _handle_validations(self):
         pass
 
     def pull_events(self, cache=5):
-        """Handler that returns the last cached key events from the deque.
+        """Returns copies of the latest cached events, newest first.
 
-        Primarily to separate the event stream from usage of the event stream.
-        By returning the values from the latest event stream, each function
-        that might need events can operate without fear of mutation. Only grab
+        Kept for handlers that want a snapshot of the recent history; the
+        widgets themselves read self.evt_stream.latest() (or a cursor from
+        self.evt_stream.cursor()) which doesn't copy anything. Only grab
         the latest cached events up to the last 20.
         """
-        evts = self.evt_stream.copy()
-        length = len(evts)
-        if length == 0:
-            return [{"Type": 7}]
-        if length < cache:
-            evt_log = [evts.pop() for _ in range(length)]
-        elif length >= 20:
-            evt_log = [evts.pop() for _ in range(20)]
-        else:
-            evt_log = [evts.pop() for _ in range(cache)]
-        return evt_log
-
-    def _is_update_valid(self, key):
-        if key in self.lifecycle["updates"].keys():
-            return False
-        if key in self._keys_in_use:
-            return False
-        return True
+        count = min(len(self.evt_stream), cache, 20)
+        if count == 0:
+            return [self.evt_stream.latest().copy()]
+        seq = self.evt_stream.seq
+        return [self.evt_stream.get(seq - i).copy() for i in range(count)]
 
     def update(self, k):
+        """Binds a handler to a key, or to a chord such as "CtrlX CtrlS".
+
+        Raises if the key is unknown or clashes with a key the widget (or
+        another update) already uses.
+        """
         def wrapper(self, fn):
             @wraps(fn)
             def register(k):
-                if not self._is_update_valid(k):
-                    raise Exception("This update key is already in use.")
-                if mzo.key(k) is None:
-                    raise Exception("This update key is not valid " +
-                                    "or is unsupported.")
-                self.lifecycle["updates"][mzo.key(k)] = partial(fn, self)
+                # keymaps may be shared, bind on a copy
+                keymap = self.keymap.copy()
+                keymap.bind(k, fn)
+                self.template = self.template.with_keymap(keymap)
             register(k)
         return partial(wrapper, self)
 
     def ask(self):
+        self._begin()
+        self._main()
+
+    async def ask_async(self):
+        """Same as ask(), awaiting input on the running asyncio loop."""
+        self._begin()
+        await self._main_async()
+
+    def _begin(self):
+        # draws the Question before it waits for input
+        if not isinstance(self.cli, FrameBuffer):
+            # asked on a bare backend, not through Impromptu.prompt()
+            self.cli = FrameBuffer(self.cli)
         self.render()
         self.redraw_all()
-        self._main()
+
+    def answer(self, value=None):
+        """Takes value as the answer without rendering or waiting for input.
+
+        Used instead of ask() by batch runs; a None value answers as if
+        the question was submitted right away. Returns the conditions of
+        the validations that fail on the answer, or ["choice"] if value
+        cannot be an answer at all (eg. not one of the choices), in which
+        case it is not taken.
+        """
+        self.result = ""
+        return []
+
+
+state_fields(Question)
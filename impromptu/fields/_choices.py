@@ -1,30 +1,77 @@
+from concurrent.futures import Future
 from platform import system
 from ._base import Question
+from impromptu.utils.bitset import BitSet
+from impromptu.utils.executor import shared_pool
+from impromptu.utils.search import SearchIndex
+from impromptu.utils.theme import draw
+
+
+def _searchable(choices):
+    # typeahead indexes every label, so only choices held in memory
+    return isinstance(choices, (list, tuple))
 
 
 class ChoiceSelect(Question):
+    """Pick one of the choices.
+
+    Choices can be a list or any sequence-like object with __len__ and
+    __getitem__ (eg. a PagedSource); only the visible rows are looked up.
+    With setup(typeahead=True) typed runes filter the choices; the rows
+    are then ranks in the Matches of the query, mapped back to the
+    indexes of the original choices. Typeahead indexes every choice, so
+    it needs them in a list or tuple: setup() refuses it for a lazy
+    source (eg. a PagedSource), and runes typed while the choices are
+    lazy (eg. swapped by mount) do not filter. The index is built on the
+    shared thread pool as soon as the question is asked; if a rune is typed
+    before it is ready, the rune is drawn and the keys after it wait.
+    """
+    __slots__ = ("choices", "size", "_index")
+
+    class State(Question.State):
+        __slots__ = ("choice_index", "cursor_index", "_query", "_typed",
+                     "_filter_width", "BOTTOM", "overflow", "PADDING")
+
+        def __init__(self):
+            super().__init__()
+            # the typeahead query, None until a rune is typed
+            self._query = None
+            # the rune typed while the index was still being built
+            self._typed = ""
+            self._filter_width = 0
+
+    KEYMAP = {
+        "Enter": "_submit",
+        "ArrowUp": "_move_up",
+        "ArrowDown": "_move_down",
+        "Backspace": "_erase_filter",
+        "Backspace2": "_erase_filter",
+        "Space": "_filter_space",
+    }
+    widget = "choice"
+
     def __init__(self, name, query, choices=None, size=7,
                  default="", color=None, colormap=None):
         super().__init__(name, query, default, color, colormap)
-        self._keys_in_use = [
-            "Enter", "ArrowUp", "ArrowDown"
-        ]
-        self.widget = "choice"
         self.size = size
-        self.choice_index = 0
-        self.cursor_index = 0
-        if choices is None:
-            self.choices = []
-            self.BOTTOM = 0
-        else:
-            self.choices = choices
-            self.BOTTOM = len(choices) - 1
-        self.overflow = len(choices) <= size
-        self.PADDING = 0 if self.overflow else size // 2
+        self.choices = [] if choices is None else choices
+        # the typeahead search index, shared with spawned copies; the
+        # definition holds the Future of it while it is being built
+        self._index = None
+
+    @classmethod
+    def _defaults(cls):
+        config = super()._defaults()
         cursor_colormap = [(0, 0, 0), (7, 0, 0), (0, 0, 0), (0, 0, 0)]
-        self.config["cursor"] = (" ›  ", cursor_colormap)
-        self.config["active"] = (7, 0, 0)
-        self.config["inactive"] = (0, 0, 0)
+        config["cursor"] = (" ›  ", cursor_colormap)
+        config["active"] = (7, 0, 0)
+        config["inactive"] = (0, 0, 0)
+        config["typeahead"] = False
+        return config
+
+    def _init_state(self):
+        super()._init_state()
+        self._layout()
 
     def _set_config(self, n, c):
         default = self.config[n]
@@ -36,10 +83,11 @@ class ChoiceSelect(Question):
             "linespace": (c, default),
             "result": (c, default),
             "refresh": (c, default),
+            "typeahead": (c, default),
         }.get(n, None)
 
     def setup(self, icon=False, cursor=False, active=False, inactive=False,
-              linespace=False, result=False, refresh=False):
+              linespace=False, result=False, refresh=False, typeahead=False):
         kwargs = {
             "icon": icon,
             "cursor": cursor,
@@ -48,132 +96,275 @@ class ChoiceSelect(Question):
             "linespace": linespace,
             "result": result,
             "refresh": refresh,
+            "typeahead": typeahead,
         }
+        if typeahead and not _searchable(self.choices):
+            # indexing would fetch every label of the source
+            # TODO: refine error messaging
+            raise Exception("Typeahead needs the choices in a list or "
+                            "tuple!")
         super().setup(**kwargs)
 
+    def _length(self):
+        if self._query is None or not self._query.text:
+            return len(self.choices)
+        return len(self._query.matches())
+
+    def _original(self, i):
+        # index in self.choices of the i-th row
+        if self._query is None or not self._query.text:
+            return i
+        return self._query.matches()[i]
+
+    def _layout(self):
+        length = self._length()
+        self.choice_index = 0
+        self.cursor_index = 0
+        self.BOTTOM = max(length - 1, 0)
+        self.overflow = length <= self.size
+        self.PADDING = 0 if self.overflow else self.size // 2
+
+    def _segment_start(self):
+        if self._length() <= self.size:
+            return 0
+        return self.choice_index - self.cursor_index
+
     def _segment_choices(self):
-        segment = []
-        length = len(self.choices)
-        if (length <= self.size):
-            segment = self.choices
-        else:
-            start = self.choice_index - self.cursor_index
-            finish = self.size + start
-            segment = self.choices[start:finish]
-        return segment
+        # only the visible window is ever read from the choices
+        start = self._segment_start()
+        finish = min(start + self.size, self._length())
+        return [self.choices[self._original(i)] for i in range(start, finish)]
+
+    def _typeahead(self):
+        return self.config["typeahead"] and _searchable(self.choices)
+
+    def _build_index(self):
+        # built once per definition, for every spawned copy
+        owner = self.definition or self
+        if owner._index is None:
+            owner._index = shared_pool("thread").submit(SearchIndex,
+                                                        self.choices)
+        index = owner._index
+        if isinstance(index, Future):
+            index.add_done_callback(self._index_built)
+        return index
+
+    def _ready_index(self, wait=False):
+        # the SearchIndex, None while it is still being built
+        owner = self.definition or self
+        index = owner._index
+        if index is None:
+            index = self._build_index()
+        if isinstance(index, Future):
+            if not wait and not index.done():
+                return None
+            index = owner._index = index.result()
+        self._index = index
+        return index
+
+    def _index_built(self, future):
+        # called on the thread that built the index
+        loop = self.loop
+        if loop is not None:
+            loop.post(self._catch_up)
+
+    def _catch_up(self):
+        # filters by the rune typed before the index was ready
+        if self.end_signal or not self._typed:
+            return
+        # without a loop nothing would apply the rune later, so wait
+        index = self._ready_index(wait=self.loop is None)
+        if index is None:
+            return
+        query = index.query()
+        for r in self._typed:
+            query = query.extend(r)
+        self._typed = ""
+        self._query = query
+        self._layout()
+        self.evt_mutex = True
+
+    def _begin(self):
+        if self._typeahead():
+            # index while the question is drawn and the first runes typed
+            self._build_index()
+        super()._begin()
+
+    def _on_rune(self, r):
+        if not self._typeahead():
+            return
+        if self._query is None:
+            # keys after the first rune wait for the index to filter them
+            self._typed += r
+            self.evt_mutex = False
+            self._catch_up()
+            return
+        # each rune narrows the matches of the previous query
+        self._query = self._query.extend(r)
+        self._layout()
+
+    def _filter_space(self):
+        self._on_rune(' ')
+
+    def _erase_filter(self):
+        if self._query is not None and self._query.text:
+            self._query = self._query.parent
+            self._layout()
+
+    def _draw_filter(self):
+        if not self.config["typeahead"]:
+            return
+        icon = self.config["icon"]
+        x = len(f"{icon[0]} {self.query}  ")
+        text = self._query.text if self._query is not None else \
+            self._typed
+        # blank whatever is left of a longer filter drawn before
+        padding = " " * max(self._filter_width - len(text), 0)
+        self.theme["result"].write(self.cli, x, self.linenum, text + padding)
+        self._filter_width = len(text)
 
     def _prepare_choices(self):
-        active = self.config["active"]
-        inactive = self.config["inactive"]
-        segment = self._segment_choices()
-        choices = [(c, [inactive for _ in c]) for c in segment]
-        cursor, cursor_cm = self.config["cursor"]
-        blanks = ''.join([" " for _ in cursor])
-        blanks_cm = [inactive for _ in cursor_cm]
+        """Returns the (text, Style) spans of every visible row."""
+        theme = self.theme
+        active, inactive = theme["active"], theme["inactive"]
+        cursor = theme["cursor"]
+        blanks = " " * len(cursor)
         render_list = []
-        for i, c in enumerate(choices):
-            render = None
-            choice, choice_cm = c
+        for i, choice in enumerate(self._segment_choices()):
             if i == self.cursor_index:
-                choice_cm = [active for _ in choice]
-                render = (cursor + choice, cursor_cm + choice_cm)
+                render = cursor.spans + ((choice, active),)
             else:
-                render = (blanks + choice, blanks_cm + choice_cm)
+                render = ((blanks + choice, inactive),)
             render_list.append(render)
         return render_list
 
     def _draw_widget(self):
-        x, y = 0, self.linenum + 1
-        renderable = self._prepare_choices()
-        for choice in renderable:
-            c, cm = choice
-            for ch, colors in zip(c, cm):
-                fg, attr, bg = colors
-                self.cli.set_cell(x, y, ch, fg | attr, bg)
-                x += 1
+        y = self.linenum + 1
+        for spans in self._prepare_choices():
+            draw(self.cli, 0, y, spans)
             y += 1
-            x = 0
         return None
 
     def _clear_widget(self):
-        w, h = self.cli.size()
-        h = self.size
-        for i in range(h):
-            y = i + self.linenum + 1
-            for x in range(w):
-                self.cli.set_cell(x, y, " ", 0, 0)
+        self.cli.clear_lines(self.linenum + 1, self.size)
         return None
 
     def redraw_all(self):
         self._clear_widget()
+        self._draw_filter()
         self._draw_widget()
         self.cli.hide_cursor()
         self.cli.flush()
 
     def reset(self):
         super().reset()
-        self.choice_index = 0
-        self.cursor_index = 0
+        if self._typed:
+            self._typed = ""
+            self.evt_mutex = True
+        if self._query is not None:
+            self._query = self._index.query()
+        self._layout()
+
+    def _submit(self):
+        # nothing to pick while the filter matches no choice
+        if self._query is None or not self._query.text or self._length():
+            super()._submit()
+
+    def _take_result(self):
+        self.result = self.choices[self._original(self.choice_index)]
 
-    def _main(self):
-        super()._main()
-        self.result = self.choices[self.choice_index]
+    def _position(self, value):
+        # index of value in the choices, which may not have an index();
+        # None if value is not one of them
+        try:
+            return self.choices.index(value)
+        except AttributeError:
+            for i, choice in enumerate(self.choices):
+                if choice == value:
+                    return i
+        except ValueError:
+            pass
         return None
 
-    def _handle_events(self):
-        evt = self.pull_events()[0]
-        if evt["Type"] == self.cli.event("Key"):
-            k = evt["Key"]
-            if k == self.cli.key("Enter"):
-                self.end_signal = True
-            elif k == self.cli.key("ArrowUp"):
-                if self.cursor_index > self.PADDING:
-                    self.cursor_index -= 1
-                    self.choice_index -= 1
-                elif self.choice_index > self.PADDING:
-                    self.choice_index -= 1
-                elif self.choice_index <= self.PADDING:
-                    if self.choice_index > 0:
-                        self.choice_index -= 1
-                        self.cursor_index -= 1
-                    else:
-                        self.cursor_index = 0
-            elif k == self.cli.key("ArrowDown"):
-                if self.cursor_index < self.PADDING:
-                    self.cursor_index += 1
-                    self.choice_index += 1
-                elif self.choice_index < self.BOTTOM - self.PADDING:
-                    if self.overflow:
-                        self.cursor_index += 1
-                    self.choice_index += 1
-                elif self.choice_index >= self.BOTTOM - self.PADDING:
-                    if self.choice_index < self.BOTTOM:
-                        self.choice_index += 1
-                        self.cursor_index += 1
-                    else:
-                        self.choice_index = self.BOTTOM
+    def answer(self, value=None):
+        if value is not None:
+            position = self._position(value)
+            if position is None:
+                # not taken, see Question.answer()
+                return ["choice"]
+            self._query = None
+            self._layout()
+            self.choice_index = position
+        self.result = self.choices[self._original(self.choice_index)]
+        return []
+
+    def _move_up(self):
+        if self.cursor_index > self.PADDING:
+            self.cursor_index -= 1
+            self.choice_index -= 1
+        elif self.choice_index > self.PADDING:
+            self.choice_index -= 1
+        elif self.choice_index <= self.PADDING:
+            if self.choice_index > 0:
+                self.choice_index -= 1
+                self.cursor_index -= 1
             else:
-                pass
-        elif evt["Type"] == self.cli.event("Error"):
-            # EventError
-            raise(Exception(evt["Err"]))
-        return None
+                self.cursor_index = 0
+
+    def _move_down(self):
+        if self.cursor_index < self.PADDING:
+            self.cursor_index += 1
+            self.choice_index += 1
+        elif self.choice_index < self.BOTTOM - self.PADDING:
+            if self.overflow:
+                self.cursor_index += 1
+            self.choice_index += 1
+        elif self.choice_index >= self.BOTTOM - self.PADDING:
+            if self.choice_index < self.BOTTOM:
+                self.choice_index += 1
+                self.cursor_index += 1
+            else:
+                self.choice_index = self.BOTTOM
 
 
 class MultiSelect(ChoiceSelect):
-    def __init__(self, name, query, choices=None, size=7,
-                 default="", color=None, colormap=None):
-        super().__init__(name, query, choices, size, default, color, colormap)
-        self._keys_in_use = [
-            "Enter", "ArrowLeft", "ArrowUp",
-            "ArrowRight", "ArrowDown", "Space",
-        ]
-        self.widget = "multi-choice"
-        self.choices = [(c, False) for c in choices]
+    """Pick any number of the choices.
+
+    The selection is a BitSet of choice indexes. CtrlA, CtrlU and CtrlR
+    select all, none or invert the rows shown (the matches while
+    filtering). Since terminals do not report shift+arrows, CtrlSpace
+    drops an anchor instead: moving then selects every row between the
+    anchor and the cursor, and CtrlSpace again lifts it.
+    """
+    __slots__ = ()
+
+    class State(ChoiceSelect.State):
+        __slots__ = ("selected", "_anchor", "_before_range")
+
+    KEYMAP = {
+        **ChoiceSelect.KEYMAP,
+        "ArrowRight": "_select",
+        "ArrowLeft": "_deselect",
+        "Space": "_toggle",
+        "CtrlA": "_select_all",
+        "CtrlU": "_select_none",
+        "CtrlR": "_invert",
+        "CtrlSpace": "_anchor_range",
+    }
+    widget = "multi-choice"
+
+    @classmethod
+    def _defaults(cls):
+        config = super()._defaults()
         cursor_colormap = [(0, 0, 0), (7, 0, 0), (0, 0, 0)]
-        self.config["cursor"] = (" › ", cursor_colormap)
-        self.config["selected"] = "► " if system() == "Windows" else "◉ "
-        self.config["unselected"] = '○ '
+        config["cursor"] = (" › ", cursor_colormap)
+        config["selected"] = "► " if system() == "Windows" else "◉ "
+        config["unselected"] = '○ '
+        return config
+
+    def _init_state(self):
+        super()._init_state()
+        self.selected = BitSet(len(self.choices))
 
     def _set_config(self, n, c):
         default = self.config[n]
@@ -187,11 +378,12 @@ class MultiSelect(ChoiceSelect):
             "linespace": (c, default),
             "result": (c, default),
             "refresh": (c, default),
+            "typeahead": (c, default),
         }.get(n, None)
 
     def setup(self, icon=False, cursor=False, selected=False, unselected=False,
               active=False, inactive=False, linespace=False, result=False,
-              refresh=False):
+              refresh=False, typeahead=False):
         kwargs = {
             "icon": icon,
             "cursor": cursor,
@@ -202,6 +394,7 @@ class MultiSelect(ChoiceSelect):
             "linespace": linespace,
             "result": result,
             "refresh": refresh,
+            "typeahead": typeahead,
         }
         # have to call the base Question class
         # since MultiSelect extends ChoiceSelect
@@ -210,91 +403,115 @@ class MultiSelect(ChoiceSelect):
         super(ChoiceSelect, self).setup(**kwargs)
 
     def _prepare_choices(self):
-        active = self.config["active"]
-        inactive = self.config["inactive"]
-        cursor, cursor_cm = self.config["cursor"]
-        selected = self.config["selected"]
-        unselected = self.config["unselected"]
+        theme = self.theme
+        active, inactive = theme["active"], theme["inactive"]
+        cursor = theme["cursor"].text
+        selected = theme["selected"]
+        unselected = theme["unselected"]
+        start = self._segment_start()
         choices = self._segment_choices()
-        blanks = ''.join([" " for _ in cursor])
-        # blanks_cm = [inactive for _ in blanks]  # TODO: confirm usage
+        blanks = " " * len(cursor)
         render_list = []
-        for i, c in enumerate(choices):
-            render = None
-            choice, is_checked = c
+        for i, choice in enumerate(choices):
+            is_checked = self._original(start + i) in self.selected
+            mark = selected if is_checked else unselected
+            # the whole row takes a single style
             if i == self.cursor_index:
-                if is_checked:
-                    text = cursor + selected + choice
-                else:
-                    text = cursor + unselected + choice
-                colormap = [active for _ in text]
-                render = (text, colormap)
+                render = ((cursor + mark + choice, active),)
+            elif is_checked:
+                render = ((blanks + mark + choice, active),)
             else:
-                if is_checked:
-                    text = blanks + selected + choice
-                    colormap = [active for _ in text]
-                else:
-                    text = blanks + unselected + choice
-                    colormap = [inactive for _ in text]
-                render = (text, colormap)
+                render = ((blanks + mark + choice, inactive),)
             render_list.append(render)
         return render_list
 
+    def _layout(self):
+        super()._layout()
+        # the rows the anchor refers to are gone once the view changes
+        self._anchor = None
+        self._before_range = None
+
     def reset(self):
         super().reset()
-        reset_choices = []
-        for c, _ in self.choices:
-            reset_choices.append(c, False)
-        self.choices = reset_choices
-
-    def _main(self):
-        super()._main()
-        self.result = [ch for ch, s in self.choices if s]
-
-    def _handle_events(self):
-        evt = self.pull_events()[0]
-        if evt["Type"] == self.cli.event("Key"):
-            k = evt["Key"]
-            if k == self.cli.key("Enter"):
-                self.end_signal = True
-            elif k == self.cli.key("ArrowUp"):
-                if self.cursor_index > self.PADDING:
-                    self.cursor_index -= 1
-                    self.choice_index -= 1
-                elif self.choice_index > self.PADDING:
-                    self.choice_index -= 1
-                elif self.choice_index <= self.PADDING:
-                    if self.choice_index > 0:
-                        self.choice_index -= 1
-                        self.cursor_index -= 1
-                    else:
-                        self.cursor_index = 0
-            elif k == self.cli.key("ArrowDown"):
-                if self.cursor_index < self.PADDING:
-                    self.cursor_index += 1
-                    self.choice_index += 1
-                elif self.choice_index < self.BOTTOM - self.PADDING:
-                    if self.overflow:
-                        self.cursor_index += 1
-                    self.choice_index += 1
-                elif self.choice_index >= self.BOTTOM - self.PADDING:
-                    if self.choice_index < self.BOTTOM:
-                        self.choice_index += 1
-                        self.cursor_index += 1
-                    else:
-                        self.choice_index = self.BOTTOM
-            elif k == self.cli.key("ArrowRight"):
-                choice, _ = self.choices[self.choice_index]
-                self.choices[self.choice_index] = (choice, True)
-            elif k == self.cli.key("ArrowLeft"):
-                choice, _ = self.choices[self.choice_index]
-                self.choices[self.choice_index] = (choice, False)
-            elif k == self.cli.key("Space"):
-                choice, marked = self.choices[self.choice_index]
-                self.choices[self.choice_index] = (choice, not marked)
-            else:
-                pass
-        elif evt["Type"] == self.cli.event("Error"):
-            # EventError
-            raise(Exception(evt["Err"]))
-        return None
+        self.selected.clear()
+
+    def _take_result(self):
+        self.result = [self.choices[i] for i in self.selected]
+
+    def answer(self, value=None):
+        positions = [self._position(choice) for choice in value or ()]
+        if None in positions:
+            # not taken, see Question.answer()
+            return ["choice"]
+        self.selected.clear()
+        for position in positions:
+            self.selected.add(position)
+        self.result = [self.choices[i] for i in self.selected]
+        return []
+
+    def _filtering(self):
+        return self._query is not None and bool(self._query.text)
+
+    def _submit(self):
+        # the selection is kept whatever the filter shows
+        super(ChoiceSelect, self)._submit()
+
+    def _select(self):
+        if self._length():
+            self.selected.add(self._original(self.choice_index))
+
+    def _deselect(self):
+        if self._length():
+            self.selected.discard(self._original(self.choice_index))
+
+    def _toggle(self):
+        if self._length():
+            self.selected.toggle(self._original(self.choice_index))
+
+    def _select_all(self):
+        if self._filtering():
+            self.selected.update(self._query.matches().mask())
+        else:
+            self.selected.select_all()
+
+    def _select_none(self):
+        if self._filtering():
+            self.selected.update(self._query.matches().mask(), False)
+        else:
+            self.selected.clear()
+
+    def _invert(self):
+        if self._filtering():
+            self.selected.flip(self._query.matches().mask())
+        else:
+            self.selected.invert()
+
+    def _anchor_range(self):
+        if self._anchor is None and self._length():
+            self._anchor = self.choice_index
+            self._before_range = self.selected.copy()
+            self._select()
+        else:
+            self._anchor = None
+            self._before_range = None
+
+    def _select_range(self):
+        # the selection from before the anchor plus anchor..cursor, so
+        # moving back towards the anchor deselects again
+        if self._anchor is None:
+            return
+        lo, hi = sorted((self._anchor, self.choice_index))
+        self.selected = self._before_range.copy()
+        if self._filtering():
+            for rank in range(lo, hi + 1):
+                self.selected.add(self._original(rank))
+        else:
+            self.selected.set_range(lo, hi + 1)
+
+    def _move_up(self):
+        super()._move_up()
+        self._select_range()
+
+    def _move_down(self):
+        super()._move_down()
+        self._select_range()
@@ -1,53 +1,156 @@
-import re
-import threading
 from functools import wraps
 from functools import partial
 from ._base import Question
+from impromptu.utils.textbuffer import GapBuffer
+from impromptu.utils.validation import ValidationRun
 
 
 class BaseInput(Question):
     """
     Base class that includes keyboard input helper functions.
+
+    The text lives in a GapBuffer and the visual column of the cursor is
+    kept up to date as it moves, so edits and cursor moves only look at
+    the runes they pass over instead of rescanning the whole text.
     """
+    __slots__ = ()
+
+    TABSTOP = 8
+    PADDING = 5
+
+    class State(Question.State):
+        __slots__ = ("_visual_offset", "_cursor_offset",
+                     "_cursor_unicode_offset", "_buffer", "_tabs", "_width")
+
+        def __init__(self):
+            super().__init__()
+            self._visual_offset = 0
+            self._cursor_offset = 0
+            self._cursor_unicode_offset = 0
+            self._buffer = GapBuffer("")
+            self._tabs = 0
+            self._width = 0
+
     def __init__(self, name, query, default="", width=120,
                  color=None, colormap=None):
         super().__init__(name, query, default, color, colormap)
-        self.TABSTOP = 8
-        self.PADDING = 5
-        self._visual_offset = 0
-        self._cursor_offset = 0
+        if width != self.config["width"]:
+            self.template = self.template.with_config(width=width)
+
+    @classmethod
+    def _defaults(cls):
+        config = super()._defaults()
+        config["width"] = 120
+        return config
+
+    @property
+    def _text(self):
+        return self._buffer.text()
+
+    @_text.setter
+    def _text(self, text):
+        self._buffer = GapBuffer(text)
+        self._tabs = text.count('\t')
+        # total width of the non-tab runes, measured when first needed
+        self._width = None if text else 0
+        coffset = min(self._cursor_unicode_offset, len(text))
         self._cursor_unicode_offset = 0
-        self.config["width"] = width
-        self._text = ""
+        self._cursor_offset = 0
+        if coffset:
+            self._move_to(coffset)
 
     def _rune_advance(self, r, pos):
         if r == '\t':
             return self.TABSTOP - (pos % self.TABSTOP)
         return self.cli.rune_width(r)
 
-    def _remove(self, text, start, end):
-        text = text[:start] + text[end:]
-        return text
-
-    def _insert(self, text, offset, what):
-        text = text[:offset] + what + text[offset:]
-        return text
+    def _runes_width(self, text):
+        # width of the non-tab runes, tabs depend on where they land
+        tabs = text.count('\t')
+        string_width = getattr(self.cli, "string_width", None)
+        if string_width is not None:
+            width = string_width(text)
+        else:
+            # raw backends (eg. not wrapped in a FrameBuffer) only
+            # answer rune by rune
+            width = sum(map(self.cli.rune_width, text))
+        if tabs:
+            width -= tabs * self.cli.rune_width('\t')
+        return width
+
+    def _text_width(self):
+        if self._width is None:
+            self._width = self._runes_width(self._text)
+        return self._width
+
+    def _added(self, text):
+        self._tabs += text.count('\t')
+        if self._width is not None:
+            self._width += self._runes_width(text)
+
+    def _removed(self, text):
+        self._tabs -= text.count('\t')
+        if self._width is not None:
+            self._width -= self._runes_width(text)
+
+    def _scan_to(self, index):
+        col = 0
+        for _, r in zip(range(index), self._buffer.iter_from(0)):
+            col += self._rune_advance(r, col)
+        return col
+
+    def _column_at(self, coffset):
+        """Returns the visual column where the rune at coffset starts.
+
+        Walks from the cursor, or from the start of the text if that is
+        closer, so the cost is the distance moved. Walking backwards over
+        a tab falls back to a scan from the start, since the width of a
+        tab depends on everything before it.
+        """
+        c, col = self._cursor_unicode_offset, self._cursor_offset
+        if coffset >= c:
+            if coffset == len(self._buffer) and self._tabs == 0:
+                return self._text_width()
+            for _, r in zip(range(coffset - c), self._buffer.iter_from(c)):
+                col += self._rune_advance(r, col)
+            return col
+        if coffset <= c - coffset:
+            return self._scan_to(coffset)
+        for _, r in zip(range(c - coffset), self._buffer.iter_back(c)):
+            if r == '\t':
+                return self._scan_to(coffset)
+            col -= self.cli.rune_width(r)
+        return col
+
+    def _first_visible(self, column):
+        """Returns the offset and column of the first rune at/after column."""
+        i, col = self._cursor_unicode_offset, self._cursor_offset
+        rune_width = self.cli.rune_width
+        for r in self._buffer.iter_back(i):
+            if r == '\t':
+                i, col = 0, 0
+                break
+            w = rune_width(r)
+            if col - w < column:
+                break
+            col -= w
+            i -= 1
+        for r in self._buffer.iter_from(i):
+            if col >= column:
+                break
+            col += self._rune_advance(r, col)
+            i += 1
+        return i, col
 
     def _move_to(self, coffset):
-        text = self._text[:coffset]
-        voffset = 0
-        while len(text) > 0:
-            rune = text[0]
-            text = text[len(rune):]
-            voffset += self._rune_advance(rune, voffset)
-        self._cursor_offset = voffset
+        self._cursor_offset = self._column_at(coffset)
         self._cursor_unicode_offset = coffset
 
     def _under_cursor(self):
-        return self._text[self._cursor_unicode_offset]
+        return self._buffer[self._cursor_unicode_offset]
 
     def _before_cursor(self):
-        return self._text[self._cursor_unicode_offset - 1]
+        return self._buffer[self._cursor_unicode_offset - 1]
 
     def _move_one_backward(self):
         if self._cursor_unicode_offset == 0:
@@ -56,39 +159,48 @@ class BaseInput(Question):
         self._move_to(self._cursor_unicode_offset - size)
 
     def _move_one_forward(self):
-        if self._cursor_unicode_offset == len(self._text):
+        if self._cursor_unicode_offset == len(self._buffer):
             return
-        size = len(self._under_cursor())
-        self._move_to(self._cursor_unicode_offset + size)
+        r = self._under_cursor()
+        self._cursor_offset += self._rune_advance(r, self._cursor_offset)
+        self._cursor_unicode_offset += len(r)
 
     def _move_to_beginning(self):
         self._move_to(0)
 
     def _move_to_end(self):
-        self._move_to(len(self._text))
+        self._move_to(len(self._buffer))
 
     def _delete_backward(self):
         if self._cursor_unicode_offset == 0:
             return
         self._move_one_backward()
-        size = len(self._under_cursor())
-        self._text = self._remove(self._text, self._cursor_unicode_offset,
-                                  self._cursor_unicode_offset + size)
+        self._delete_forward()
 
     def _delete_forward(self):
-        if self._cursor_unicode_offset == len(self._text):
+        if self._cursor_unicode_offset == len(self._buffer):
             return
-        size = len(self._under_cursor())
-        self._text = self._remove(self._text, self._cursor_unicode_offset,
-                                  self._cursor_unicode_offset + size)
+        c = self._cursor_unicode_offset
+        self._removed(self._buffer.delete(c, c + 1))
 
     def _delete_to_end(self):
-        self._text = self._text[:self._cursor_unicode_offset]
+        c = self._cursor_unicode_offset
+        self._removed(self._buffer.delete(c, len(self._buffer)))
 
     def _insert_rune(self, r):
-        self._text = self._insert(self._text, self._cursor_unicode_offset, r)
+        self._buffer.insert(self._cursor_unicode_offset, r)
+        self._added(r)
         self._move_one_forward()
 
+    def _insert_text(self, text):
+        self._buffer.insert(self._cursor_unicode_offset, text)
+        self._added(text)
+        col = self._cursor_offset
+        for r in text:
+            col += self._rune_advance(r, col)
+        self._cursor_offset = col
+        self._cursor_unicode_offset += len(text)
+
     def _cursorX(self):
         return self._cursor_offset - self._visual_offset
 
@@ -110,18 +222,46 @@ class BaseInput(Question):
 
 
 class TextInput(BaseInput):
+    __slots__ = ("completer",)
+
+    class State(BaseInput.State):
+        __slots__ = ("_completion", "_validation", "_validated")
+
+        def __init__(self):
+            super().__init__()
+            self._completion = ("", "")
+            # the ValidationRun, made on the first validation
+            self._validation = None
+            # (buffer, version) of the text validated last
+            self._validated = None
+
+    KEYMAP = {
+        "Enter": "_submit",
+        "CtrlB": "_move_one_backward", "ArrowLeft": "_move_one_backward",
+        "CtrlF": "_move_one_forward", "ArrowRight": "_move_one_forward",
+        "Backspace": "_delete_backward", "Backspace2": "_delete_backward",
+        "CtrlD": "_delete_forward", "Delete": "_delete_forward",
+        "Tab": "_insert_tab",
+        "Space": "_insert_space",
+        "CtrlK": "_delete_to_end",
+        "Home": "_move_to_beginning", "CtrlA": "_move_to_beginning",
+        "End": "_move_to_end", "CtrlE": "_move_to_end",
+    }
+    widget = "text"
+
     def __init__(self, name, query, default="", width=120,
                  color=None, colormap=None):
         super().__init__(name, query, default, width, color, colormap)
-        self._keys_in_use = [
-            "Enter", "CtrlB", "ArrowLeft", "CtrlF",
-            "ArrowRight", "Backspace", "Backspace2",
-            "CtrlD", "Delete", "Tab", "Space", "CtrlK",
-            "Home", "CtrlA", "End", "CtrlE"
-        ]
-        self.widget = "text"
-        self.config["prompt"] = (" » ", [(0, 0, 0), (2, 0, 0), (0, 0, 0)])
-        self.config["inputs"] = (0, 0, 0)
+        self.completer = None
+
+    @classmethod
+    def _defaults(cls):
+        config = super()._defaults()
+        config["prompt"] = (" » ", [(0, 0, 0), (2, 0, 0), (0, 0, 0)])
+        config["inputs"] = (0, 0, 0)
+        # completion ghost text, bold black (ie. grey)
+        config["ghost"] = (1, 0x0200, 0)
+        return config
 
     def _set_config(self, n, c):
         default = self.config[n]
@@ -131,84 +271,128 @@ class TextInput(BaseInput):
             "linespace": (c, default),
             "width": (c, default),
             "inputs": (c, default),
+            "ghost": (c, default),
             "result": (c, default),
             "refresh": (c, default),
         }.get(n, None)
 
     def setup(self, icon=False, prompt=False, inputs=False, linespace=False,
-              width=False, result=False, refresh=False):
+              width=False, result=False, refresh=False, ghost=False):
         kwargs = {
             "icon": icon,
             "prompt": prompt,
             "linespace": linespace,
             "width": width,
             "inputs": inputs,
+            "ghost": ghost,
             "result": result,
             "refresh": refresh,
         }
         super().setup(**kwargs)
 
+    def autocomplete(self, provider):
+        """Completes the word before the cursor from provider.
+
+        Args:
+            provider: A Completer (eg. PrefixIndex, SortedFileIndex) or a
+                function taking (prefix, limit) and returning a list of
+                words starting with prefix, best first.
+        """
+        self.completer = provider
+        self._completion = ("", "")
+
+    def _ghost(self):
+        """Returns the rest of the completed word, "" if there is none."""
+        if self.completer is None or self.widget == "password":
+            return ""
+        if self._cursor_unicode_offset != len(self._buffer):
+            return ""
+        runes = []
+        for rune in self._buffer.iter_back(self._cursor_unicode_offset):
+            if rune.isspace():
+                break
+            runes.append(rune)
+        word = "".join(reversed(runes))
+        if not word:
+            return ""
+        # only ask the provider again when the word changed
+        if self._completion[0] != word:
+            complete = getattr(self.completer, "complete", self.completer)
+            found = complete(word, 1)
+            rest = found[0][len(word):] if found else ""
+            self._completion = (word, rest)
+        return self._completion[1]
+
     def _draw_prompt(self):
-        x, y = 0, self.linenum + 1  # one line below the query
-        prompt, colormap = self.config["prompt"]
-        for ch, colors in zip(prompt, colormap):
-            fg, attr, bg = colors
-            self.cli.set_cell(x, y, ch, fg | attr, bg)
-            x += 1
+        # one line below the query
+        self.theme["prompt"].draw(self.cli, 0, self.linenum + 1)
         return None
 
     def _draw_widget(self):
-        prompt, _ = self.config["prompt"]
-        fg, attr, bg = self.config["inputs"]
+        style = self.theme["inputs"]
         w, h = self.config["width"], 1
         self._adjust_voffset(w)
-        t = self._text
-        lx, tabstop = 0, 0
-        x, y = len(prompt) + 1, self.linenum + h  # one cell after the prompt
-        while True:
-            rx = lx - self._visual_offset
-            if len(t) == 0:
-                break
-            if lx == tabstop:
-                tabstop += self.TABSTOP
+        # one cell after the prompt
+        x, y = len(self.theme["prompt"]) + 1, self.linenum + h
+        # only the runes inside the viewport are visited; the run state
+        # read for every rune is looked up once
+        cli, offset = self.cli, self._visual_offset
+        masked = self.widget == "password"
+        # single width runes are gathered and written as one run
+        run, start = [], 0
+        i, lx = self._first_visible(offset)
+        for rune in self._buffer.iter_from(i):
+            rx = lx - offset
             if rx >= w:
-                self.cli.set_cell(x+w-1, y, '→', fg | attr, bg)
                 break
-            rune = t[0]  # TODO: confirm why t[0]
+            advance = 0 if rune == '\t' else cli.rune_width(rune)
+            if advance == 1:
+                if not run:
+                    start = rx
+                run.append("*" if masked else rune)
+                lx += 1
+                continue
+            if run:
+                style.write(cli, x+start, y, "".join(run))
+                run = []
             if rune == '\t':
-                while lx < tabstop:
-                    rx = lx - self._visual_offset
-                    if rx >= w:
-                        break  # goto next
-                    if rx >= 0:
-                        self.cli.set_cell(x+rx, y, ' ', fg | attr, bg)
-                    lx += 1
+                advance = self.TABSTOP - (lx % self.TABSTOP)
+                style.write(cli, x+rx, y, ' ' * min(advance, w - rx))
             else:
-                if rx >= 0:
-                    char = "*" if self.widget == "password" else rune
-                    self.cli.set_cell(x+rx, y, char, fg | attr, bg)
-                lx += self.cli.rune_width(rune)
-            # next:
-            t = t[len(rune):]
-        if self._visual_offset != 0:
-            self.cli.set_cell(x, y, '←', fg | attr, bg)
+                cli.set_cell(x+rx, y, "*" if masked else rune,
+                             style.pen, style.bg)
+            lx += advance
+        else:
+            rx = None
+        if run:
+            style.write(cli, x+start, y, "".join(run))
+        if rx is None:
+            self._draw_ghost(x, y, lx - offset, w)
+        else:
+            cli.set_cell(x+w-1, y, '→', style.pen, style.bg)
+        if offset != 0:
+            cli.set_cell(x, y, '←', style.pen, style.bg)
+        return None
+
+    def _draw_ghost(self, x, y, rx, w):
+        style = self.theme["ghost"]
+        for rune in self._ghost():
+            advance = self.cli.rune_width(rune)
+            if rx + advance > w:
+                break
+            self.cli.set_cell(x+rx, y, rune, style.pen, style.bg)
+            rx += advance
         return None
 
     def _clear_widget(self):
-        w, h = self.cli.size()
-        h = self.config["linespace"]
-        for i in range(h):
-            y = i + self.linenum + 1
-            for x in range(w):
-                self.cli.set_cell(x, y, " ", 0, 0)
+        self.cli.clear_lines(self.linenum + 1, self.config["linespace"])
         return None
 
     def redraw_all(self):
         self._clear_widget()
         self._draw_prompt()
         self._draw_widget()
-        prompt, _ = self.config["prompt"]
-        x, y = len(prompt) + 1, self.linenum + 1
+        x, y = len(self.theme["prompt"]) + 1, self.linenum + 1
         # re-enable / re-position the cursor if it has been hidden / moved
         self.cli.set_cursor(x+self._cursorX(), y)
         self.cli.flush()
@@ -220,83 +404,98 @@ class TextInput(BaseInput):
         self._cursor_offset = 0
         self._cursor_unicode_offset = 0
 
-    def _main(self):
-        super()._main()
+    def _take_result(self):
         self.result = self._text
-        return None
-
-    def _handle_events(self):
-        evt = self.pull_events()[0]
-        if evt["Type"] == self.cli.event("Key"):
-            k, c = evt["Key"], evt["Ch"]
-            if k == self.cli.key("Enter"):
-                self.end_signal = True
-
-            elif (k == self.cli.key("CtrlB") or
-                  k == self.cli.key("ArrowLeft")):
-                self._move_one_backward()
-
-            elif (k == self.cli.key("CtrlF") or
-                  k == self.cli.key("ArrowRight")):
-                self._move_one_forward()
-
-            elif (k == self.cli.key("Backspace") or
-                  k == self.cli.key("Backspace2")):
-                self._delete_backward()
-
-            elif (k == self.cli.key("CtrlD") or
-                  k == self.cli.key("Delete")):
-                self._delete_forward()
-
-            elif k == self.cli.key("Tab"):
-                self._insert_rune('\t')
-
-            elif k == self.cli.key("Space"):
-                self._insert_rune(' ')
-
-            elif k == self.cli.key("CtrlK"):
-                self._delete_to_end()
 
-            elif (k == self.cli.key("Home") or
-                  k == self.cli.key("CtrlA")):
-                self._move_to_beginning()
-
-            elif (k == self.cli.key("End") or
-                  k == self.cli.key("CtrlE")):
-                self._move_to_end()
+    def _insert_tab(self):
+        # Tab accepts the completion shown, if any
+        ghost = self._ghost()
+        if ghost:
+            self._insert_text(ghost)
+        else:
+            self._insert_rune('\t')
+
+    def _insert_space(self):
+        self._on_rune(' ')
+
+    def _on_rune(self, r):
+        burst = self._take_burst()
+        if burst:
+            self._insert_text(r + burst)
+        else:
+            self._insert_rune(r)
+
+    def _take_burst(self):
+        """Returns the printable runes already queued behind this one.
+
+        A paste reaches us as one key event per rune; taking the ones that
+        are already waiting lets them be inserted, validated and redrawn
+        once instead of once per rune.
+        """
+        if self.loop is None:
+            return ""
+        key, space = self._key_event, self.cli.key("Space")
+
+        def printable(e):
+            return e["Type"] == key and (e["Ch"] != 0 or e["Key"] == space)
+
+        runes = []
+        for e in self.loop.drain(printable):
+            evt = self.evt_stream.append(e)
+            runes.append(chr(evt.ch) if evt.ch != 0 else ' ')
+        return "".join(runes)
+
+    def answer(self, value=None):
+        self._text = "" if value is None else value
+        self.result = self._text
+        return [condition for condition, _ in self._failed_validations()]
 
-            else:
-                # from GoDoc for termbox-go: 'Ch' is invalid
-                # if it is 0 when the EventType is 'Key'
-                if c != 0:
-                    self._insert_rune(chr(c))
-        elif evt["Type"] == self.cli.event("Error"):
-            # EventError
-            raise(Exception(evt["Err"]))
+    def _failed_validations(self):
+        text = self._text
+        return [(condition, validator) for condition, validator
+                in self.lifecycle["validations"].items()
+                if validator.check(self, text)]
 
     def _handle_validations(self):
-        for condition, fn in self.lifecycle["validations"].items():
-            if not callable(condition):
-                condition = partial(re.search, condition, self._text)
-            else:
-                condition = partial(condition, self)
-            running_threads = [t.is_alive() for t in self._threads]
-            if condition() and not any(running_threads):
-                t = threading.Thread(target=fn)
-                self._threads.append(t)
-                t.start()
-
-    def validate(self, condition):
+        validations = self.lifecycle["validations"]
+        if not validations:
+            return
+        # only validate again once the text changed
+        mark = (self._buffer, self._buffer.version)
+        if mark == self._validated:
+            return
+        self._validated = mark
+        if self._validation is None:
+            self._validation = ValidationRun(self)
+        self._validation.update(self._text, validations.values(), mark)
+
+    def _clean_threads(self):
+        if self._validation is not None:
+            self._validation.cancel()
+        super()._clean_threads()
+
+    def validate(self, condition, debounce=0.0, background=False):
+        """Runs the decorated handler while condition holds on the text.
+
+        Args:
+            condition: A regex searched in the text, or a function of the
+                Question (possibly async) returning True on invalid input.
+            debounce (float): Seconds the text has to stay unchanged
+                before condition is checked.
+            background (bool): Check a function condition off the prompt
+                thread. Async conditions always are.
+        """
         def wrapper(self, fn):
             @wraps(fn)
             def register(condition):
-                self.lifecycle["validations"][condition] = partial(fn, self)
+                # kept unbound so spawned copies share the validations
+                self.template = self.template.with_validation(
+                    condition, fn, debounce=debounce, background=background)
             register(condition)
         return partial(wrapper, self)
 
 
 class PasswordInput(TextInput):
-    def __init__(self, name, query, default="", width=120,
-                 color=None, colormap=None):
-        super().__init__(name, query, default, width, color, colormap)
-        self.widget = "password"
+    __slots__ = ()
+
+    widget = "password"
@@ -2,23 +2,28 @@ from ._base import Question
 
 
 class StaticMessage(Question):
+    __slots__ = ("message",)
+
+    KEYMAP = {"Enter": "_submit"}
+    widget = "static"
+
     def __init__(self, name, query, message="", default="",
                  width=120, color=None, colormap=None):
-        super().__init__(name, query, default, color, colormap)
-        self._keys_in_use = ["Enter"]
-        self.widget = "static"
-        self.message = message
-        self.config["icon"] = ("[!]", [(0, 0, 0), (4, 0, 0), (0, 0, 0)])
-        self.config["prompt"] = (" » ", [(0, 0, 0), (4, 0, 0), (0, 0, 0)])
-        self.config["width"] = width
-        self.config["message"] = (4, 0, 0)
         if color is None:
             color = (4, 0, 0)
-        if colormap is None:
-            query_colormap = [color for _ in query]
-        else:
-            query_colormap = colormap
-        self.config["query"] = (query, query_colormap)
+        super().__init__(name, query, default, color, colormap)
+        self.message = message
+        if width != self.config["width"]:
+            self.template = self.template.with_config(width=width)
+
+    @classmethod
+    def _defaults(cls):
+        config = super()._defaults()
+        config["icon"] = ("[!]", [(0, 0, 0), (4, 0, 0), (0, 0, 0)])
+        config["prompt"] = (" » ", [(0, 0, 0), (4, 0, 0), (0, 0, 0)])
+        config["width"] = 120
+        config["message"] = (4, 0, 0)
+        return config
 
     def _set_config(self, n, c):
         default = self.config[n]
@@ -42,31 +47,17 @@ class StaticMessage(Question):
         super().setup(**kwargs)
 
     def _draw_prompt(self):
-        x, y = 0, self.linenum + 1  # one line below the query
-        prompt, colormap = self.config["prompt"]
-        for ch, colors in zip(prompt, colormap):
-            fg, attr, bg = colors
-            self.cli.set_cell(x, y, ch, fg | attr, bg)
-            x += 1
+        # one line below the query
+        self.theme["prompt"].draw(self.cli, 0, self.linenum + 1)
         return None
 
     def _draw_message(self):
         x = len(self.config["prompt"][0]) + 1
         y = self.linenum + 1
         w = self.config["width"]
-        length = len(self.message)
-        segments = []
-        for i in range(0, length, w):
-            segment = self.message[i:i+w]
-            segments.append(
-                (segment, [self.config["message"] for _ in segment]))
-        for dy, s in enumerate(segments):
-            segment, colormap = s
-            dx = 0
-            for ch, colors in zip(segment, colormap):
-                fg, attr, bg = colors
-                self.cli.set_cell(x + dx, y + dy, ch, fg | attr, bg)
-                dx += 1
+        style = self.theme["message"]
+        for dy, i in enumerate(range(0, len(self.message), w)):
+            style.write(self.cli, x, y + dy, self.message[i:i+w])
         return None
 
     def redraw_all(self):
@@ -74,14 +65,3 @@ class StaticMessage(Question):
         self._draw_prompt()
         self._draw_message()
         self.cli.flush()
-
-    def _handle_events(self):
-        evt = self.pull_events()[0]
-        if evt["Type"] == self.cli.event("Key"):
-            k = evt["Key"]
-            if k == self.cli.key("Enter"):
-                self.end_signal = True
-        elif evt["Type"] == self.cli.event("Error"):
-            # EventError
-            raise(Exception(evt["Err"]))
-        return None
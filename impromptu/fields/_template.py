@@ -0,0 +1,197 @@
+"""Shared definitions and per-run state of Questions.
+
+A Template holds everything about a Question that does not change while
+it is asked: the rendering config, the lifecycle hooks and the keymap.
+Templates are immutable and interned, so the thousands of Questions of a
+generated form (and every spawned copy of them) point to a handful of
+Templates instead of each carrying its own dicts. Changing the config or
+a hook derives another Template.
+
+What does change while a Question is asked (cursor offsets, the choice
+under the cursor, the selection, the result, ...) lives in a State with
+__slots__, made when the Question is first reached. StateFields make
+those attributes readable and writable on the Question itself.
+
+"""
+import weakref
+from functools import lru_cache, partial
+from operator import attrgetter
+from types import MappingProxyType
+
+from impromptu.utils.theme import Theme
+from impromptu.utils.validation import Validator
+
+HOOKS = ("mount", "unmount")
+
+# every Template still in use, by content
+_interned = weakref.WeakValueDictionary()
+
+
+def freeze(value):
+    """Returns value with its lists (eg. colormaps) turned into tuples."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+@lru_cache(maxsize=1024)
+def uniform(color, length):
+    """Returns the interned colormap of length cells of a single color."""
+    return (freeze(color),) * length
+
+
+def _hashable(key):
+    # keys that cannot be hashed never match another one
+    try:
+        hash(key)
+    except TypeError:
+        return object()
+    return key
+
+
+class Template(object):
+    """The immutable, shared definition of a Question.
+
+    Two Templates with the same content are the same object, so they
+    hash and compare by identity.
+
+    Attributes:
+        config (mapping): Read-only rendering config, see Question.
+        lifecycle (mapping): Read-only mount and unmount hooks and the
+            condition -> Validator validations.
+        keymap (Keymap): The keys the Question handles.
+        theme (Theme): The config compiled for drawing.
+
+    """
+    __slots__ = ("config", "lifecycle", "keymap", "_hooks", "_derived",
+                 "_theme", "__weakref__")
+
+    def __init__(self, config, hooks, validations, keymap):
+        self.config = MappingProxyType(config)
+        self.lifecycle = MappingProxyType({
+            "mount": hooks[0][1],
+            "unmount": hooks[1][1],
+            "validations": MappingProxyType(dict(validations)),
+        })
+        self.keymap = keymap
+        self._hooks = hooks
+        self._theme = None
+        # memoized derivations, so that building many alike Questions
+        # only looks Templates up; they go away with their last user
+        self._derived = None
+
+    @property
+    def theme(self):
+        # compiled when first drawn, shared by Templates of the same config
+        if self._theme is None:
+            self._theme = Theme.compile(self.config)
+        return self._theme
+
+    @classmethod
+    def make(cls, config, keymap, hooks=((None, None), (None, None)),
+             validations=()):
+        """Returns the interned Template of that content.
+
+        Args:
+            config (dict): The rendering config; lists are frozen.
+            keymap (Keymap): The keys the Question handles.
+            hooks (tuple): A (spec, partial) pair per HOOKS entry, spec
+                being the (fn, args, kwargs) the partial was made of.
+            validations (tuple): (condition, handler) pairs.
+        """
+        return cls._intern({k: freeze(v) for k, v in config.items()},
+                           keymap, hooks, validations)
+
+    @classmethod
+    def _intern(cls, config, keymap, hooks, validations):
+        # config is frozen already
+        key = _hashable((tuple(sorted(config.items())),
+                         tuple(spec for spec, _ in hooks),
+                         tuple(validations), keymap))
+        template = _interned.get(key)
+        if template is None:
+            template = cls(config, hooks, validations, keymap)
+            _interned[key] = template
+        return template
+
+    def _derive(self, change, config=None, hooks=None, validations=None,
+                keymap=None):
+        change = _hashable(change)
+        if self._derived is None:
+            self._derived = weakref.WeakValueDictionary()
+        template = self._derived.get(change)
+        if template is None:
+            template = Template._intern(
+                dict(self.config) if config is None else config,
+                self.keymap if keymap is None else keymap,
+                self._hooks if hooks is None else hooks,
+                (tuple(self.lifecycle["validations"].items())
+                 if validations is None else validations))
+            self._derived[change] = template
+        return template
+
+    def with_config(self, **changes):
+        """Returns the Template with some config keys changed."""
+        changes = {k: freeze(v) for k, v in changes.items()}
+        config = dict(self.config)
+        config.update(changes)
+        return self._derive(("config", tuple(sorted(changes.items()))),
+                            config=config)
+
+    def with_hook(self, kind, fn, *args, **kwargs):
+        """Returns the Template with its kind ("mount"/"unmount") hook set.
+
+        The hook is kept as partial(fn, *args, **kwargs) and called with
+        the Question in front of args.
+        """
+        spec = _hashable((fn, args, tuple(kwargs.items())))
+        hooks = list(self._hooks)
+        hooks[HOOKS.index(kind)] = (spec, partial(fn, *args, **kwargs))
+        return self._derive((kind, spec), hooks=tuple(hooks))
+
+    def with_validation(self, condition, fn, **options):
+        """Returns the Template with fn handling condition.
+
+        The validation is compiled into a Validator, see Validator for
+        the options.
+        """
+        validations = dict(self.lifecycle["validations"])
+        validations[condition] = Validator(condition, fn, **options)
+        return self._derive(
+            ("validation", condition, fn, tuple(sorted(options.items()))),
+            validations=tuple(validations.items()))
+
+    def with_keymap(self, keymap):
+        """Returns the Template handling the keys of keymap."""
+        return self._derive(("keymap", keymap), keymap=keymap)
+
+
+def _set_field(name, question, value):
+    try:
+        setattr(question._state, name, value)
+    except AttributeError:
+        if question._state is not None:
+            raise
+        setattr(question._new_state(), name, value)
+
+
+class StateField(property):
+    """An attribute of a Question kept in its State.
+
+    Reads go straight to the State; while there is none they fail and
+    Question.__getattr__ makes it, ie. when the Question is reached (or
+    something about its run is set up ahead of time).
+    """
+
+    def __init__(self, name):
+        super().__init__(attrgetter("_state." + name),
+                         partial(_set_field, name))
+
+
+def state_fields(cls):
+    """Exposes the fields of cls.State that cls does not define yet."""
+    for klass in cls.State.__mro__:
+        for name in getattr(klass, "__slots__", ()):
+            if not hasattr(cls, name):
+                setattr(cls, name, StateField(name))
+    return cls
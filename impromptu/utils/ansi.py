@@ -0,0 +1,231 @@
+"""A cli backend that speaks ANSI escape sequences over a byte stream.
+
+AnsiTerminal keeps the same in-memory grid as Headless, but flush() turns
+the cells drawn since the previous flush into escape sequences handed to
+a send callable (eg. a socket write), and poll_event() returns the key
+presses parsed from the bytes passed to feed(), unless listen() had them
+pushed to an EventLoop instead. Nothing in it touches a TTY, so any
+number of them can run in one process, one per session.
+
+The client is expected to put its terminal in raw mode. It may report
+its size with the xterm sequence ``ESC [ 8 ; rows ; cols t``, which
+is turned into a Resize event.
+
+"""
+import codecs
+import queue
+import re
+
+from impromptu.utils.headless import (
+    Headless, KEYS, ATTRIBUTES, make_event,
+)
+
+# escape sequences (after ESC) -> key name
+SEQUENCES = {
+    "[A": "ArrowUp", "[B": "ArrowDown", "[C": "ArrowRight",
+    "[D": "ArrowLeft", "[H": "Home", "[F": "End", "OH": "Home",
+    "OF": "End", "[1~": "Home", "[4~": "End", "[2~": "Insert",
+    "[3~": "Delete", "[5~": "Pgup", "[6~": "Pgdn", "OP": "F1",
+    "OQ": "F2", "OR": "F3", "OS": "F4", "[15~": "F5", "[17~": "F6",
+    "[18~": "F7", "[19~": "F8", "[20~": "F9", "[21~": "F10",
+    "[23~": "F11", "[24~": "F12",
+}
+# a CSI or SS3 sequence, complete or not
+ESCAPE = re.compile(r"\[[0-9;]*[A-Za-z~]?|O[A-Za-z]?")
+RESIZE = re.compile(r"\[8;(\d+);(\d+)t")
+# control bytes -> key name; the rest of 0x01..0x1A are CtrlA..CtrlZ
+CONTROLS = {
+    "\x00": "CtrlSpace", "\x08": "Backspace", "\t": "Tab",
+    "\r": "Enter", "\n": "Enter", "\x1c": "Ctrl4", "\x1d": "Ctrl5",
+    "\x1e": "Ctrl6", "\x1f": "Ctrl7", " ": "Space", "\x7f": "Backspace2",
+}
+
+# SGR parameters of the attribute bits
+SGR = ((ATTRIBUTES["Bold"], "1"), (ATTRIBUTES["Underline"], "4"),
+       (ATTRIBUTES["Reverse"], "7"))
+
+
+def _sgr(fg, bg):
+    # select graphic rendition for a termbox fg (color | attributes), bg
+    params = ["0"]
+    params.extend(code for bit, code in SGR if fg & bit)
+    for color, base in ((fg & 0xFF, 30), (bg & 0xFF, 40)):
+        if 1 <= color <= 8:
+            params.append(str(base + color - 1))
+        elif color > 8:
+            params.append(f"{base + 8};5;{color - 1}")
+    return "\x1b[" + ";".join(params) + "m"
+
+
+class AnsiTerminal(Headless):
+    """A terminal rendered through ANSI escape sequences.
+
+    Args:
+        send (callable): Called with the bytes of every frame; must be
+            safe to call from the prompt thread.
+        width (int): Columns, until the client reports its size.
+        height (int): Rows, until the client reports its size.
+
+    Attributes:
+        frames (int): Number of flushes that sent something.
+
+    """
+
+    def __init__(self, send, width=80, height=24, encoding="utf-8"):
+        super().__init__(width, height)
+        self.send = send
+        self.encoding = encoding
+        self.frames = 0
+        self._input = queue.Queue()
+        # set by listen(): where events go instead of the queue
+        self._push = None
+        self._fail = None
+        self._decoder = codecs.getincrementaldecoder(encoding)("replace")
+        self._rest = ""
+        self._dirty = set()
+        self._shown = None
+
+    # lifecycle
+    def init(self):
+        # alternate screen, cleared
+        self.send(b"\x1b[?1049h\x1b[2J")
+        return None
+
+    def close(self):
+        self.send(b"\x1b[0m\x1b[?25h\x1b[?1049l")
+        return None
+
+    # drawing
+    def set_cell(self, x, y, ch, fg, bg):
+        super().set_cell(x, y, ch, fg, bg)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self._dirty.add((y, x))
+
+    def clear(self, fg, bg):
+        super().clear(fg, bg)
+        self._dirty.update((y, x) for y in range(self.height)
+                           for x in range(self.width))
+
+    def _resize(self, width, height):
+        super()._resize(width, height)
+        self._dirty = set()
+        self._shown = None
+
+    def flush(self):
+        self.flushes += 1
+        out = []
+        last, pen = None, None
+        for y, x in sorted(self._dirty):
+            chars, fgs, bgs = self.cells[y]
+            if last != (y, x):
+                out.append(f"\x1b[{y + 1};{x + 1}H")
+            if pen != (fgs[x], bgs[x]):
+                pen = (fgs[x], bgs[x])
+                out.append(_sgr(*pen))
+            out.append(chars[x])
+            last = (y, x + max(self.rune_width(chars[x]), 1))
+        self._dirty.clear()
+        if self.cursor is None:
+            if self._shown is not False or out:
+                out.append("\x1b[?25l")
+            self._shown = False
+        else:
+            x, y = self.cursor
+            out.append(f"\x1b[{y + 1};{x + 1}H\x1b[?25h")
+            self._shown = True
+        if out:
+            self.frames += 1
+            self.send("".join(out).encode(self.encoding, "replace"))
+
+    # input
+    def feed(self, data):
+        """Parses bytes received from the client into events."""
+        text = self._rest + self._decoder.decode(data)
+        self._rest = ""
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if c == "\x1b":
+                match = ESCAPE.match(text, i + 1)
+                if match is None:
+                    # Esc pressed on its own
+                    self._key("Esc")
+                    i += 1
+                    continue
+                seq = match.group()
+                if len(seq) < 2 or not (seq[-1].isalpha() or seq[-1] == "~"):
+                    # the rest of the sequence is still on its way
+                    self._rest = text[i:]
+                    break
+                self._sequence(seq)
+                i = match.end()
+            elif c in CONTROLS:
+                self._key(CONTROLS[c])
+                # \r\n is a single Enter
+                if c == "\r" and text[i + 1:i + 2] == "\n":
+                    i += 1
+                i += 1
+            elif c < " ":
+                self._key("Ctrl" + chr(ord(c) + 64))
+                i += 1
+            else:
+                self._emit(make_event(ch=ord(c)))
+                i += 1
+
+    def _emit(self, e):
+        # None ends the input
+        if self._push is None:
+            self._input.put(e)
+        elif e is None:
+            self._fail(EOFError("The client hung up."))
+        else:
+            self.polls += 1
+            if e["Type"] == self.event("Resize"):
+                self._resize(e["Width"], e["Height"])
+            self._push(e)
+
+    def _key(self, name):
+        self._emit(make_event(key=KEYS[name]))
+
+    def _sequence(self, seq):
+        resize = RESIZE.fullmatch(seq)
+        if resize is not None:
+            rows, cols = int(resize.group(1)), int(resize.group(2))
+            self._emit(make_event("Resize", width=cols, height=rows))
+        elif seq in SEQUENCES:
+            self._key(SEQUENCES[seq])
+
+    def hang_up(self):
+        """Ends the input; the waiting Question raises EOFError."""
+        self._emit(None)
+
+    def interrupt(self):
+        self._emit(make_event("Interrupt"))
+
+    def listen(self, push, fail):
+        """Hands every event to push as soon as it is parsed.
+
+        Used by EventLoop.wait_async() instead of a thread blocked on
+        poll_event(); fail gets the EOFError once the client hung up.
+        Events queued before are handed over first. Call it from the
+        thread that feeds the terminal.
+        """
+        self._push, self._fail = push, fail
+        while True:
+            try:
+                e = self._input.get_nowait()
+            except queue.Empty:
+                break
+            self._emit(e)
+            if e is None:
+                break
+
+    def poll_event(self):
+        e = self._input.get()
+        if e is None:
+            self._input.put(None)
+            raise EOFError("The client hung up.")
+        self.polls += 1
+        if e["Type"] == self.event("Resize"):
+            self._resize(e["Width"], e["Height"])
+        return e
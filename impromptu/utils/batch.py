@@ -0,0 +1,126 @@
+"""Runs forms over sets of answers without a terminal.
+
+Every answer set gets a fresh form from a build function, which is then
+driven by Impromptu.answer(): the whole lifecycle runs, logic jumps
+included, but nothing is rendered. Answer sets are plain dicts keyed by
+Question name and can be read from JSON or JSON-lines streams.
+
+Runs are independent, so they can be spread across a process pool; the
+build function then has to be picklable (defined at module level).
+
+Example::
+
+    def build():
+        form = Impromptu()
+        form.register(TextInput("name", "Name?"))
+        return form
+
+    batch = Batch(build, pool="process")
+    with open("answers.jsonl") as f:
+        for result in batch.map(from_jsonl(f)):
+            assert result.ok, result.errors
+
+"""
+import json
+from functools import partial
+from itertools import islice
+
+from impromptu.utils.executor import shared_pool
+
+
+class BatchResult(object):
+    """The outcome of one answer set.
+
+    Attributes:
+        responses (dict): Question name -> answer, as start() leaves in
+            Impromptu.responses.
+        errors (dict): Question name -> the failed validations, by
+            condition (callables by their name).
+
+    """
+    __slots__ = ("responses", "errors")
+
+    def __init__(self, responses, errors):
+        self.responses = responses
+        self.errors = errors
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f"BatchResult({self.responses!r}, {self.errors!r})"
+
+
+def _condition(condition):
+    if callable(condition):
+        return getattr(condition, "__name__", repr(condition))
+    return condition
+
+
+def run(build, answers):
+    """Runs a fresh form from build() with answers."""
+    form = build()
+    errors = form.answer(answers)
+    errors = {name: [_condition(c) for c in failed]
+              for name, failed in errors.items()}
+    return BatchResult(dict(form.responses), errors)
+
+
+def _run_chunk(build, chunk):
+    return [run(build, answers) for answers in chunk]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Batch(object):
+    """Runs a form over many answer sets.
+
+    Args:
+        build (callable): Returns a new Impromptu with the Questions of
+            the form registered.
+        pool: None to run in this process, "process" (or "thread") for
+            the shared pools or any concurrent.futures executor.
+        chunksize (int): Answer sets sent to a worker at once; larger
+            chunks cost less to ship back and forth.
+
+    """
+
+    def __init__(self, build, pool=None, chunksize=256):
+        self.build = build
+        self.pool = shared_pool(pool) if isinstance(pool, str) else pool
+        self.chunksize = chunksize
+
+    def run(self, answers):
+        return run(self.build, answers)
+
+    def map(self, answer_sets):
+        """Yields a BatchResult per answer set, in order."""
+        if self.pool is None:
+            for answers in answer_sets:
+                yield run(self.build, answers)
+            return
+        work = partial(_run_chunk, self.build)
+        chunks = _chunks(answer_sets, self.chunksize)
+        for results in self.pool.map(work, chunks):
+            yield from results
+
+
+def from_json(stream):
+    """Returns the answer sets of a JSON object (one set) or array."""
+    data = json.load(stream)
+    return [data] if isinstance(data, dict) else data
+
+
+def from_jsonl(stream):
+    """Yields the answer sets of a JSON-lines stream, one per line."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
@@ -0,0 +1,122 @@
+"""A compact set of choice indexes backed by a bytearray.
+
+One bit per choice, so a million choices take 125KB. Single bits are
+flipped in place and bulk operations go through C-level bytes and int
+operations instead of Python loops over the choices.
+
+"""
+import re
+
+# positions of the set bits of every byte value
+BITS = [tuple(b for b in range(8) if n >> b & 1) for n in range(256)]
+# every byte value with its bits flipped
+INVERTED = bytes(255 - n for n in range(256))
+# finds the bytes holding at least one member
+NONZERO = re.compile(b"[^\x00]+")
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(mask):
+        return bin(mask).count("1")
+
+
+class BitSet(object):
+    """Set of the integers in range(size).
+
+    Attributes:
+        size (int): How many integers the set can hold.
+        count (int): How many are in the set, kept as it changes.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self._bits = bytearray((size + 7) // 8)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, i):
+        return 0 <= i < self.size and bool(self._bits[i >> 3] >> (i & 7) & 1)
+
+    def __iter__(self):
+        """Yields the members in increasing order."""
+        # the regex skips runs of empty bytes in C
+        for run in NONZERO.finditer(self._bits):
+            at = run.start() * 8
+            for byte in run.group():
+                for bit in BITS[byte]:
+                    yield at + bit
+                at += 8
+
+    def copy(self):
+        other = BitSet(0)
+        other.size, other.count = self.size, self.count
+        other._bits = bytearray(self._bits)
+        return other
+
+    def add(self, i):
+        if 0 <= i < self.size and i not in self:
+            self._bits[i >> 3] |= 1 << (i & 7)
+            self.count += 1
+
+    def discard(self, i):
+        if i in self:
+            self._bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+            self.count -= 1
+
+    def toggle(self, i):
+        if 0 <= i < self.size:
+            self._bits[i >> 3] ^= 1 << (i & 7)
+            self.count += 1 if i in self else -1
+
+    def _trim(self):
+        # keep the unused bits of the last byte clear
+        extra = len(self._bits) * 8 - self.size
+        if extra:
+            self._bits[-1] &= 0xFF >> extra
+
+    def select_all(self):
+        self._bits[:] = b"\xff" * len(self._bits)
+        self._trim()
+        self.count = self.size
+
+    def clear(self):
+        self._bits[:] = bytes(len(self._bits))
+        self.count = 0
+
+    def invert(self):
+        self._bits = bytearray(self._bits.translate(INVERTED))
+        self._trim()
+        self.count = self.size - self.count
+
+    def to_int(self):
+        """Returns the set as an int with bit i set for every member i."""
+        return int.from_bytes(self._bits, "little")
+
+    def _assign(self, mask):
+        mask &= (1 << self.size) - 1
+        self._bits = bytearray(mask.to_bytes(len(self._bits), "little"))
+        self.count = popcount(mask)
+
+    def update(self, mask, value=True):
+        """Adds (or removes if not value) the members of an int bitset."""
+        if value:
+            self._assign(self.to_int() | mask)
+        else:
+            self._assign(self.to_int() & ~mask)
+
+    def flip(self, mask):
+        """Toggles the members of an int bitset."""
+        self._assign(self.to_int() ^ mask)
+
+    def set_range(self, start, stop, value=True):
+        """Adds (or removes if not value) every i in range(start, stop)."""
+        start, stop = max(start, 0), min(stop, self.size)
+        if start >= stop:
+            return
+        mask = ((1 << (stop - start)) - 1) << start
+        self.update(mask, value)
@@ -0,0 +1,239 @@
+"""Append-only checkpoints of a running form.
+
+A checkpoint file holds one JSON line per checkpoint, and each line only
+holds what changed since the line before it: the nodes of the Registrar
+whose links, rank or state moved, new entries of branched and orphaned,
+the branch origins that were merged (unbranched), the cursor keys and the
+answers that changed. The Registrar keeps track of the nodes it touches
+and the Checkpointer of the answers it is sent, so a checkpoint costs
+what changed, not the size of the form. Folding the lines in order
+gives the state of the form at the last checkpoint, so resuming a form
+restores the Registrar as it was instead of asking every Question again.
+
+Questions are code, not data: a checkpoint refers to them by name and
+resuming needs the same Questions registered (plus the ones logic jumps
+insert, see Impromptu.resume).
+
+"""
+import json
+import os
+from fractions import Fraction
+
+from impromptu.utils.registrar import Node
+from impromptu.utils.sinks import Sink
+
+# registrar attributes holding a single key
+CURSORS = ("entry", "cursor", "running", "tail")
+
+
+def _rank(rank):
+    # Fractions are stored as "n/d" strings
+    return rank if rank is None or type(rank) is int else str(rank)
+
+
+def _unrank(rank):
+    return Fraction(rank) if isinstance(rank, str) else rank
+
+
+def _node(node):
+    return (getattr(node.data, "name", None), node.prev, node.next,
+            node.origin, _rank(node.rank), _rank(node.bound), node.orphaned)
+
+
+def _keys(registrar):
+    return {name: getattr(registrar, name) for name in CURSORS}
+
+
+def snapshot(registrar, responses):
+    """Returns the checkpointed state of a form as plain data."""
+    return {
+        "keys": _keys(registrar),
+        "nodes": {key: _node(node)
+                  for key, node in registrar.registry.items()},
+        "branched": dict(registrar.branched),
+        "orphaned": dict(registrar.orphaned),
+        "answers": dict(responses),
+    }
+
+
+def _fold(state, change):
+    for part, values in change.items():
+        if part == "unbranched":
+            for key in values:
+                state.get("branched", {}).pop(key, None)
+            continue
+        if part in ("nodes", "branched", "orphaned"):
+            # JSON turns the int keys into strings
+            values = {int(k): v for k, v in values.items()}
+        state.setdefault(part, {}).update(values)
+    return state
+
+
+def load(path):
+    """Folds the checkpoints of path into a single snapshot.
+
+    A torn last line (left by a crash mid-write) is ignored. Returns
+    None if there is no checkpoint yet.
+    """
+    state = None
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    with f:
+        for line in f:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                continue
+            state = _fold(state or {}, change)
+    if state is None:
+        return None
+    for part in ("keys", "nodes", "branched", "orphaned", "answers"):
+        state.setdefault(part, {})
+    return state
+
+
+def restore(registrar, state, questions):
+    """Rebuilds registrar in place from a snapshot.
+
+    Args:
+        registrar (Registrar): The registrar to overwrite.
+        state (dict): A snapshot, as returned by load().
+        questions (dict): name -> Question for every name in the snapshot.
+    """
+    registrar.registry.clear()
+    registrar.names.clear()
+    for key in sorted(state["nodes"]):
+        name, prev, next_, origin, rank, bound, orphaned = state["nodes"][key]
+        if name not in questions:
+            # TODO: refine error messaging
+            raise Exception(f"Cannot resume unknown question {name!r}!")
+        node = Node(key, questions[name], _unrank(rank), _unrank(bound),
+                    origin)
+        node.prev, node.next, node.orphaned = prev, next_, orphaned
+        registrar.registry[key] = node
+        registrar.names[name] = node
+    registrar.branched = {k: tuple(v) if v is not None else None
+                          for k, v in state["branched"].items()}
+    registrar.orphaned = dict(state["orphaned"])
+    for name in CURSORS:
+        setattr(registrar, name, state["keys"].get(name))
+    registrar.reseed(max(registrar.registry, default=0) + 1)
+
+
+class Checkpointer(Sink):
+    """Appends a checkpoint of the form every few answers.
+
+    A response sink, so a checkpoint is taken right after a Question is
+    closed; every checkpoint is flushed and fsynced before the next
+    Question is asked. The first checkpoint replaces the file with the
+    whole form, later ones append the nodes registrar.touched and the
+    answers emitted since.
+
+    Args:
+        path (str): The checkpoint file.
+        registrar (Registrar): The flow of the form; starts keeping track
+            of the nodes it touches.
+        responses (dict): The answers of the form, by name.
+        every (int): Answers between two checkpoints.
+
+    """
+
+    def __init__(self, path, registrar, responses, every=1):
+        self.path = path
+        self.registrar = registrar
+        self.responses = responses
+        self.every = every
+        self.pending = 0
+        registrar.touched = set()
+        # names answered since the last checkpoint
+        self._answered = set()
+        # what the file holds of the cursors and of branched; None until
+        # the first checkpoint
+        self._keys = None
+        self._origins = set()
+        self._file = None
+
+    def _written(self, change):
+        # the file is up to date with the form again
+        self.registrar.touched.clear()
+        self._answered.clear()
+        self._keys.update(change["keys"])
+        self._origins.update(change["branched"])
+        self._origins.difference_update(change.get("unbranched", ()))
+        self.pending = 0
+
+    def compact(self, state=None):
+        """Replaces the file with a single checkpoint of state.
+
+        Defaults to the current state of the form. Written to a temporary
+        file first, so a crash leaves either the old or the new file.
+        """
+        if state is None:
+            state = snapshot(self.registrar, self.responses)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(json.dumps(state, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._keys, self._origins = {}, set()
+        self._written(state)
+
+    def _changes(self):
+        """Returns what changed since the last checkpoint."""
+        registrar = self.registrar
+        nodes, branched, orphaned, unbranched = {}, {}, {}, []
+        for key in registrar.touched:
+            nodes[key] = _node(registrar.registry[key])
+            if key in registrar.orphaned:
+                orphaned[key] = registrar.orphaned[key]
+            if key in registrar.branched:
+                branched[key] = registrar.branched[key]
+            elif key in self._origins:
+                unbranched.append(key)
+        keys = {name: key for name, key in _keys(registrar).items()
+                if name not in self._keys or self._keys[name] != key}
+        answers = {name: self.responses[name] for name in self._answered
+                   if name in self.responses}
+        return {"keys": keys, "nodes": nodes, "branched": branched,
+                "orphaned": orphaned, "unbranched": unbranched,
+                "answers": answers}
+
+    def checkpoint(self):
+        """Appends what changed since the last checkpoint.
+
+        The first checkpoint replaces whatever the file held before (eg.
+        an earlier run that was not resumed) with the whole form.
+        """
+        if self._keys is None:
+            self.compact()
+            return
+        change = self._changes()
+        written = {part: values for part, values in change.items()
+                   if values}
+        if written:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(written, separators=(",", ":")) +
+                             "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._written(change)
+
+    def emit(self, name, value):
+        self._answered.add(name)
+        self.pending += 1
+        if self.pending >= self.every:
+            self.checkpoint()
+
+    def close(self):
+        if self.pending:
+            self.checkpoint()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
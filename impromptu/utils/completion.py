@@ -0,0 +1,127 @@
+"""Completion providers for TextInput.
+
+A provider is an object with a complete(prefix, limit=1) method (or just
+a function with that signature) returning up to limit words starting with
+prefix, best first. TextInput shows the rest of the first word as ghost
+text after the cursor and Tab accepts it.
+
+Two prefix indexes are built in: PrefixIndex keeps a sorted list in
+memory, SortedFileIndex binary searches a sorted word file through mmap
+so that a list of millions of words is paged in on demand instead of
+being read at startup.
+
+"""
+import abc
+import mmap
+import os
+from bisect import bisect_left
+
+
+class Completer(abc.ABC):
+    """Base class of the completion providers.
+
+    Subclasses have to override complete(); plain functions can be used
+    as providers without subclassing.
+    """
+
+    @abc.abstractmethod
+    def complete(self, prefix, limit=1):
+        """Returns up to limit words starting with prefix, best first."""
+
+    def __call__(self, prefix, limit=1):
+        return self.complete(prefix, limit)
+
+
+class PrefixIndex(Completer):
+    """Completes from an in-memory list of words.
+
+    Args:
+        words (iterable): The words to complete, in any order.
+
+    """
+
+    def __init__(self, words):
+        self.words = sorted(set(words))
+
+    def complete(self, prefix, limit=1):
+        found = []
+        i = bisect_left(self.words, prefix)
+        while i < len(self.words) and len(found) < limit:
+            word = self.words[i]
+            if not word.startswith(prefix):
+                break
+            if word != prefix:
+                found.append(word)
+            i += 1
+        return found
+
+
+class SortedFileIndex(Completer):
+    """Completes from a file of newline separated words sorted bytewise.
+
+    The file is memory-mapped and every lookup is a binary search over
+    byte offsets, backing up to the start of the line it lands in (like
+    look(1)), so only the pages it touches are ever read. UTF-8 sorts
+    bytewise in code point order, so a file written by write() or by
+    ``LC_ALL=C sort -u`` works.
+
+    Args:
+        path (str): The sorted word file.
+        encoding (str): Encoding of the file.
+
+    """
+
+    def __init__(self, path, encoding="utf-8"):
+        self.path = path
+        self.encoding = encoding
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            # an empty file cannot be mapped
+            self._map = b""
+
+    @staticmethod
+    def write(path, words, encoding="utf-8"):
+        """Writes words to path in the order SortedFileIndex expects."""
+        lines = sorted(set(w.encode(encoding) for w in words if w))
+        with open(path, "wb") as f:
+            for line in lines:
+                f.write(line + b"\n")
+
+    def _line(self, pos):
+        # start and end offsets of the line holding pos
+        start = self._map.rfind(b"\n", 0, pos) + 1
+        end = self._map.find(b"\n", pos)
+        return start, len(self._map) if end < 0 else end
+
+    def _lower_bound(self, key):
+        # offset of the first line that is not smaller than key
+        lo, hi = 0, len(self._map)
+        while lo < hi:
+            start, end = self._line((lo + hi) // 2)
+            if self._map[start:end].rstrip(b"\r") < key:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def complete(self, prefix, limit=1):
+        key = prefix.encode(self.encoding)
+        found = []
+        pos = self._lower_bound(key)
+        while pos < len(self._map) and len(found) < limit:
+            _, end = self._line(pos)
+            line = self._map[pos:end].rstrip(b"\r")
+            if not line.startswith(key):
+                break
+            if line != key:
+                found.append(line.decode(self.encoding))
+            pos = end + 1
+        return found
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
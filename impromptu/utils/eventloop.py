@@ -0,0 +1,221 @@
+"""A blocking event loop shared by the Questions of a form.
+
+A reader thread pulls events from the cli as they arrive and queues
+them. Questions block in wait() until there is input, a timer is due or
+a handler posted a wakeup, so an idle prompt uses no CPU at all.
+
+Questions asked from asyncio await wait_async() instead, which suspends
+the coroutine rather than the thread. A cli with a listen() method (eg.
+AnsiTerminal) then pushes its events to the loop as they arrive and no
+reader thread is needed, so one asyncio loop can prompt many forms.
+
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class Timer(object):
+    """Handle returned by EventLoop.call_later()."""
+    __slots__ = ("deadline", "fn", "cancelled")
+
+    def __init__(self, deadline, fn):
+        self.deadline = deadline
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop(object):
+    """Multiplexes cli input, timers and cross-thread wakeups.
+
+    Attributes:
+        cli: The backend that events are polled from.
+        closed (bool): Whether close() has been called.
+
+    """
+
+    def __init__(self, cli):
+        self.cli = cli
+        self.closed = False
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._calls = deque()
+        self._timers = []
+        self._seq = itertools.count()
+        self._reader = None
+        self._listening = False
+        self._error = None
+        # the asyncio future wait_async() is suspended on, if any
+        self._waiter = None
+
+    def _notify(self):
+        # called with the condition held
+        self._cond.notify_all()
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.get_loop().is_closed():
+            waiter.get_loop().call_soon_threadsafe(_wake_up, waiter)
+
+    def _read(self):
+        while not self.closed:
+            try:
+                e = self.cli.poll_event()
+            except Exception as err:
+                # eg. the Headless script ran out; hand it to the waiter
+                self.fail(err)
+                return
+            self.push(e)
+
+    def start(self):
+        if self._reader is None and not self._listening:
+            self._reader = threading.Thread(target=self._read, daemon=True)
+            self._reader.start()
+
+    def listen(self):
+        """Has the cli push its events instead of a reader thread, if it can.
+
+        Returns whether the cli listens; the reader thread is started
+        otherwise.
+        """
+        listen = getattr(self.cli, "listen", None)
+        if self._reader is None and not self._listening and \
+                callable(listen):
+            self._listening = True
+            listen(self.push, self.fail)
+        self.start()
+        return self._listening
+
+    def push(self, e):
+        """Queues an input event, from any thread."""
+        with self._cond:
+            self._events.append(e)
+            self._notify()
+
+    def fail(self, err):
+        """Ends the input: err is raised once the queued events are taken."""
+        with self._cond:
+            self._error = err
+            self._notify()
+
+    def post(self, fn=None):
+        """Wakes the loop from any thread, running fn on the loop if given."""
+        with self._cond:
+            self._calls.append(fn)
+            self._notify()
+
+    def call_later(self, delay, fn):
+        """Runs fn on the loop once delay seconds have passed."""
+        timer = Timer(time.monotonic() + delay, fn)
+        with self._cond:
+            heapq.heappush(self._timers,
+                           (timer.deadline, next(self._seq), timer))
+            self._notify()
+        return timer
+
+    def _due(self, now):
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                due.append(timer.fn)
+        return due
+
+    def _ready(self, accept_input):
+        """Returns (calls, event, timeout) for what is ready to be handled.
+
+        Called with the condition held. Either the calls to run (posted or
+        due), the next input event, or how long to sleep (None for as long
+        as it takes) if there is neither.
+        """
+        if self.closed:
+            raise EOFError("The event loop was closed.")
+        calls = self._due(time.monotonic())
+        while self._calls:
+            calls.append(self._calls.popleft())
+        if calls:
+            return calls, None, None
+        if accept_input:
+            if self._events:
+                return None, self._events.popleft(), None
+            if self._error is not None:
+                raise self._error
+        timeout = None
+        if self._timers:
+            timeout = max(self._timers[0][0] - time.monotonic(), 0)
+        return None, None, timeout
+
+    def _run(self, calls):
+        for fn in calls:
+            if fn is not None:
+                fn()
+        return None
+
+    def wait(self, accept_input=True):
+        """Blocks until something happens on the loop.
+
+        Due timers and posted calls are run first and None is returned,
+        otherwise the next input event is returned. Input is left queued
+        while accept_input is False (eg. when the evt_mutex is taken).
+        """
+        self.start()
+        with self._cond:
+            while True:
+                calls, e, timeout = self._ready(accept_input)
+                if calls or e is not None:
+                    break
+                self._cond.wait(timeout)
+        if e is not None:
+            return e
+        return self._run(calls)
+
+    async def wait_async(self, accept_input=True):
+        """Same as wait(), suspending the running coroutine instead."""
+        self.listen()
+        while True:
+            with self._cond:
+                calls, e, timeout = self._ready(accept_input)
+                if calls or e is not None:
+                    break
+                waiter = self._waiter = \
+                    asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait((waiter,), timeout=timeout)
+            finally:
+                with self._cond:
+                    if self._waiter is waiter:
+                        self._waiter = None
+        if e is not None:
+            return e
+        return self._run(calls)
+
+    def drain(self, predicate):
+        """Pops the queued input events at the front that match predicate.
+
+        Never blocks; used to take a burst of already received events (eg.
+        a paste) in one go.
+        """
+        taken = []
+        with self._cond:
+            events = self._events
+            while events and predicate(events[0]):
+                taken.append(events.popleft())
+        return taken
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._notify()
+        # unblock a reader that is waiting on the terminal, if possible
+        interrupt = getattr(self.cli, "interrupt", None)
+        if self._reader is not None and callable(interrupt):
+            interrupt()
+
+
+def _wake_up(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,140 @@
+"""A fixed-size ring of reusable event records.
+
+Events polled from the cli are copied into reusable Event records with
+a sequence number; each slot gets its record the first time it is used.
+Handlers read the latest record (or walk the ones they haven't seen yet
+through a Cursor) without copying the stream.
+
+"""
+
+# the Type reported when nothing has been polled yet; termbox-go event
+# types stop at EventNone (6)
+NO_EVENT = 7
+
+FIELDS = {
+    "Type": "type", "Mod": "mod", "Key": "key", "Ch": "ch",
+    "Width": "width", "Height": "height", "Err": "err",
+    "MouseX": "mouse_x", "MouseY": "mouse_y", "N": "n",
+}
+
+
+class Event(object):
+    """A single slot of the EventRing.
+
+    Records are recycled once the ring wraps around, so a handler that
+    needs to keep an event past the next few key presses should copy()
+    it. Item access with the Intermezzo dict keys (eg. evt["Key"]) is
+    kept for handlers written against the raw event dicts.
+    """
+    __slots__ = ("seq",) + tuple(FIELDS.values())
+
+    def __init__(self):
+        self.seq = 0
+        self.type = NO_EVENT
+        self.mod = self.key = self.ch = 0
+        self.width = self.height = 0
+        self.err = ""
+        self.mouse_x = self.mouse_y = self.n = 0
+
+    def _fill(self, seq, e):
+        self.seq = seq
+        self.type = e["Type"]
+        self.mod = e.get("Mod", 0)
+        self.key = e.get("Key", 0)
+        self.ch = e.get("Ch", 0)
+        self.width = e.get("Width", 0)
+        self.height = e.get("Height", 0)
+        self.err = e.get("Err", "")
+        self.mouse_x = e.get("MouseX", 0)
+        self.mouse_y = e.get("MouseY", 0)
+        self.n = e.get("N", 0)
+
+    def __getitem__(self, name):
+        return getattr(self, FIELDS[name])
+
+    def get(self, name, default=None):
+        if name not in FIELDS:
+            return default
+        return getattr(self, FIELDS[name])
+
+    def copy(self):
+        e = Event()
+        for attr in self.__slots__:
+            setattr(e, attr, getattr(self, attr))
+        return e
+
+    def __repr__(self):
+        return (f"Event(seq={self.seq}, type={self.type}, "
+                f"key={self.key}, ch={self.ch})")
+
+
+EMPTY = Event()
+
+
+class Cursor(object):
+    """Reads every event of a ring exactly once, oldest first."""
+    __slots__ = ("ring", "seq")
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.seq = ring.seq
+
+    def read(self):
+        """Yields the events appended since the last read.
+
+        Events that were overwritten before being read are skipped.
+        """
+        events = self.ring.since(self.seq)
+        self.seq = self.ring.seq
+        return events
+
+
+class EventRing(object):
+    """Fixed-size ring buffer of Event records.
+
+    Attributes:
+        size (int): Number of records kept.
+        seq (int): Sequence number of the newest event, 0 if none.
+
+    """
+
+    def __init__(self, size=20):
+        self.size = size
+        self.seq = 0
+        # records are made on first use; a Question that never sees an
+        # event (eg. in a batch run) does not pay for them
+        self._slots = [None] * size
+
+    def __len__(self):
+        return min(self.seq, self.size)
+
+    def append(self, e):
+        """Copies an event dict into the next slot and returns the record."""
+        self.seq += 1
+        slot = self._slots[self.seq % self.size]
+        if slot is None:
+            slot = self._slots[self.seq % self.size] = Event()
+        slot._fill(self.seq, e)
+        return slot
+
+    def latest(self):
+        if self.seq == 0:
+            return EMPTY
+        return self._slots[self.seq % self.size]
+
+    def get(self, seq):
+        """Returns the record with that sequence number, if still held."""
+        if 0 < seq <= self.seq and self.seq - seq < self.size:
+            return self._slots[seq % self.size]
+        return None
+
+    def since(self, seq):
+        start = max(seq + 1, self.seq - self.size + 1, 1)
+        slots, size = self._slots, self.size
+        return [slots[s % size] for s in range(start, self.seq + 1)]
+
+    def cursor(self):
+        return Cursor(self)
+
+    def clear(self):
+        self.seq = 0
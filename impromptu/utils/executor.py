@@ -0,0 +1,177 @@
+"""Bounded executors for the update and validation handlers of Questions.
+
+Instead of starting a thread per key press, handlers are submitted to a
+shared pool through a HandlerExecutor that caps how many of them a single
+Question may have in flight and what to do with repeated triggers of a
+handler that has not run yet.
+
+Handlers are called with their Question, which holds the cli, the event
+loop and locks: none of them pickle, so handlers only ever run on
+threads. The shared process pool is there for work with top-level
+functions and plain arguments, eg. batch answering.
+
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+_loop = None
+
+
+def shared_pool(kind="thread"):
+    """Returns the process-wide "thread" or "process" pool.
+
+    Work sent to the "process" pool has to be a top-level function with
+    picklable arguments.
+    """
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == "thread":
+                workers = min(32, (os.cpu_count() or 1) + 4)
+                pool = ThreadPoolExecutor(max_workers=workers,
+                                          thread_name_prefix="impromptu")
+            elif kind == "process":
+                pool = ProcessPoolExecutor()
+            else:
+                raise ValueError(f"Unknown pool kind: {kind}")
+            _pools[kind] = pool
+        return pool
+
+
+def shared_loop():
+    """Returns the process-wide asyncio loop, running on its own thread.
+
+    Coroutines are sent to it with asyncio.run_coroutine_threadsafe(),
+    whose futures can be cancelled from any thread.
+    """
+    global _loop
+    with _pools_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True,
+                             name="impromptu-async").start()
+        return _loop
+
+
+class HandlerExecutor(object):
+    """Runs handlers on a pool with a concurrency limit.
+
+    Handlers are submitted under a key (eg. the key code of an update or
+    the condition of a validation). The policy decides what happens when
+    the same key is triggered again while an earlier run is still queued:
+
+    * "skip": drop the new trigger while the key is queued or running.
+    * "coalesce": keep the queued run and drop the new trigger.
+    * "cancel": cancel the queued run in favour of the new one.
+    * "queue": run every trigger.
+
+    A run that already started is never interrupted. A handler that
+    raises does not stop the Question: the exception is logged and kept
+    until the next join().
+
+    Attributes:
+        pool: The concurrent.futures thread pool handlers run on.
+        limit (int): How many handlers may run at the same time.
+        policy (str): The default policy, see POLICIES.
+        on_done (callable): Called with no arguments after each run.
+
+    """
+
+    POLICIES = ("skip", "coalesce", "cancel", "queue")
+
+    def __init__(self, pool=None, limit=4, policy="coalesce", on_done=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown handler policy: {policy}")
+        if pool == "process" or isinstance(pool, ProcessPoolExecutor):
+            # handlers get their Question, which cannot be pickled
+            raise ValueError("Handlers cannot run on a process pool")
+        if pool is None or isinstance(pool, str):
+            pool = shared_pool(pool or "thread")
+        self.pool = pool
+        self.limit = max(1, limit)
+        self.policy = policy
+        self.on_done = on_done
+        self._cond = threading.Condition()
+        self._queued = deque()
+        self._running = 0
+        self._inflight = {}
+        self._errors = []
+
+    @property
+    def active(self):
+        """Number of handler runs that are running or queued."""
+        with self._cond:
+            return self._running + len(self._queued)
+
+    def submit(self, key, fn, *args, policy=None):
+        policy = policy or self.policy
+        with self._cond:
+            if policy == "skip" and self._inflight.get(key):
+                return
+            if policy in ("coalesce", "cancel"):
+                for i, item in enumerate(self._queued):
+                    if item[0] == key:
+                        if policy == "coalesce":
+                            return
+                        del self._queued[i]
+                        self._release(key)
+                        break
+            self._queued.append((key, fn, args))
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+            self._dispatch()
+
+    def _release(self, key):
+        count = self._inflight.pop(key, 0) - 1
+        if count > 0:
+            self._inflight[key] = count
+
+    def _dispatch(self):
+        # called with the condition held
+        while self._queued and self._running < self.limit:
+            key, fn, args = self._queued.popleft()
+            self._running += 1
+            future = self.pool.submit(fn, *args)
+            future.add_done_callback(partial(self._finished, key))
+
+    def _finished(self, key, future):
+        with self._cond:
+            self._running -= 1
+            self._release(key)
+            error = None if future.cancelled() else future.exception()
+            if error is not None:
+                self._errors.append(error)
+            self._dispatch()
+            self._cond.notify_all()
+        if error is not None:
+            logger.error("Handler %r raised", key, exc_info=error)
+        if self.on_done is not None:
+            self.on_done()
+
+    def cancel(self):
+        """Drops every queued run; running handlers are left to finish."""
+        with self._cond:
+            for key, _, _ in self._queued:
+                self._release(key)
+            self._queued.clear()
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Waits for every queued and running handler to finish.
+
+        Returns the exceptions handlers raised since the last join; they
+        were logged already.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: not self._queued and self._running == 0, timeout)
+            errors, self._errors = self._errors, []
+        return errors
@@ -0,0 +1,139 @@
+"""A shadow framebuffer that sits between the Questions and the cli.
+
+Widgets draw into an in-memory grid of cells. On flush() every row that
+was touched since the last frame is diffed against what the cli already
+holds and only the cells that actually changed are sent, followed by a
+single flush() of the cli.
+
+"""
+from impromptu.utils.width import WidthOracle
+
+
+class FrameBuffer(object):
+    """Damage-tracking wrapper around a cli backend (eg. Intermezzo).
+
+    Each row is stored as three parallel lists holding the character,
+    the foreground (fg | attr) and the background of every column. The
+    ``back`` rows are the frame being drawn, the ``front`` rows mirror
+    the cells that were last sent to the cli. Anything that is not part
+    of the drawing surface (key, event, poll_event, ...) is forwarded to
+    the wrapped cli untouched, except rune widths which are answered by a
+    WidthOracle caching the cli's rune_width.
+
+    Attributes:
+        cli: The wrapped backend.
+        widths (WidthOracle): Cached rune widths of the backend.
+        emitted (int): Number of set_cell calls forwarded to the cli.
+        flushes (int): Number of frames flushed to the cli.
+
+    """
+
+    def __init__(self, cli):
+        self.cli = cli
+        self.emitted = 0
+        self.flushes = 0
+        self._w, self._h = 0, 0
+        self._back = []
+        self._front = []
+        self._dirty = set()
+        self.widths = WidthOracle(cli.rune_width)
+        self.size()
+
+    def __getattr__(self, name):
+        if name == "cli":
+            raise AttributeError(name)
+        return getattr(self.cli, name)
+
+    def _blank_row(self, w, fg=0, bg=0):
+        return [[" "] * w, [fg] * w, [bg] * w]
+
+    def _unknown_row(self, w):
+        # None never equals a drawn character, so the next flush
+        # re-emits every cell of the row
+        return [[None] * w, [0] * w, [0] * w]
+
+    def _resize(self, w, h):
+        back = []
+        for y in range(h):
+            row = self._blank_row(w)
+            if y < self._h:
+                n = min(w, self._w)
+                for old, new in zip(self._back[y], row):
+                    new[:n] = old[:n]
+            back.append(row)
+        self._back = back
+        # whatever the cli kept across the resize is unknown
+        self._front = [self._unknown_row(w) for _ in range(h)]
+        self._dirty = set(range(h))
+        self._w, self._h = w, h
+
+    def size(self):
+        w, h = self.cli.size()
+        if w != self._w or h != self._h:
+            self._resize(w, h)
+        return w, h
+
+    def rune_width(self, r):
+        return self.widths.width(r)
+
+    def string_width(self, s):
+        return self.widths.string_width(s)
+
+    def set_cell(self, x, y, ch, fg, bg):
+        if 0 <= x < self._w and 0 <= y < self._h:
+            chars, fgs, bgs = self._back[y]
+            chars[x] = ch
+            fgs[x] = fg
+            bgs[x] = bg
+            self._dirty.add(y)
+
+    def write(self, x, y, text, fg, bg):
+        """Writes a run of text sharing the same colors starting at x, y."""
+        if not 0 <= y < self._h:
+            return
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        n = min(len(text), self._w - x)
+        if n <= 0:
+            return
+        chars, fgs, bgs = self._back[y]
+        chars[x:x+n] = text[:n]
+        fgs[x:x+n] = [fg] * n
+        bgs[x:x+n] = [bg] * n
+        self._dirty.add(y)
+
+    def clear_lines(self, y, height=None, fg=0, bg=0):
+        """Blanks ``height`` rows starting at y (to the bottom if None)."""
+        start = max(y, 0)
+        stop = self._h if height is None else min(y + height, self._h)
+        for i in range(start, stop):
+            self._back[i] = self._blank_row(self._w, fg, bg)
+            self._dirty.add(i)
+
+    def clear(self, fg, bg):
+        self.cli.clear(fg, bg)
+        self._back = [self._blank_row(self._w, fg, bg)
+                      for _ in range(self._h)]
+        self._front = [self._blank_row(self._w, fg, bg)
+                       for _ in range(self._h)]
+        self._dirty = set()
+
+    def flush(self):
+        w, _ = self.size()
+        set_cell = self.cli.set_cell
+        dirty, self._dirty = self._dirty, set()
+        for y in sorted(dirty):
+            back, front = self._back[y], self._front[y]
+            if back == front:
+                continue
+            bc, bf, bb = back
+            fc, ff, fb = front
+            for x in range(w):
+                ch, fg, bg = bc[x], bf[x], bb[x]
+                if ch != fc[x] or fg != ff[x] or bg != fb[x]:
+                    set_cell(x, y, ch, fg, bg)
+                    self.emitted += 1
+            fc[:], ff[:], fb[:] = bc, bf, bb
+        self.flushes += 1
+        self.cli.flush()
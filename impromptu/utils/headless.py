@@ -0,0 +1,231 @@
+"""A pure-Python, in-memory stand-in for the Intermezzo cli.
+
+Headless implements the small surface that Question and Impromptu use
+(set_cell, flush, size, clear, poll_event, set_cursor, hide_cursor,
+rune_width, key, event, color, ...) over a grid of cells held in memory.
+Events are read from a scripted iterator instead of a TTY, which makes it
+possible to run whole forms at full speed, eg. for load tests::
+
+    cli = Headless(80, 24, events=Headless.script("Ada", "Enter"))
+    Impromptu().start(cli)
+
+Key, event, color and mode codes mirror the termbox-go constants that
+Intermezzo exposes, so handlers written against one backend behave the
+same on the other.
+
+"""
+import unicodedata
+
+
+KEYS = {
+    "F1": 0xFFFF, "F2": 0xFFFE, "F3": 0xFFFD, "F4": 0xFFFC,
+    "F5": 0xFFFB, "F6": 0xFFFA, "F7": 0xFFF9, "F8": 0xFFF8,
+    "F9": 0xFFF7, "F10": 0xFFF6, "F11": 0xFFF5, "F12": 0xFFF4,
+    "Insert": 0xFFF3, "Delete": 0xFFF2, "Home": 0xFFF1, "End": 0xFFF0,
+    "Pgup": 0xFFEF, "Pgdn": 0xFFEE, "ArrowUp": 0xFFED, "ArrowDown": 0xFFEC,
+    "ArrowLeft": 0xFFEB, "ArrowRight": 0xFFEA, "MouseLeft": 0xFFE8,
+    "MouseMiddle": 0xFFE7, "MouseRight": 0xFFE6, "MouseRelease": 0xFFE5,
+    "MouseWheelUp": 0xFFE4, "MouseWheelDown": 0xFFE3,
+    "CtrlTilde": 0x00, "Ctrl2": 0x00, "CtrlSpace": 0x00,
+    "Backspace": 0x08, "Tab": 0x09, "Enter": 0x0D, "Esc": 0x1B,
+    "CtrlLsqBracket": 0x1B, "Ctrl3": 0x1B, "Ctrl4": 0x1C,
+    "CtrlBackslash": 0x1C, "Ctrl5": 0x1D, "CtrlRsqBracket": 0x1D,
+    "Ctrl6": 0x1E, "Ctrl7": 0x1F, "CtrlSlash": 0x1F,
+    "CtrlUnderscore": 0x1F, "Space": 0x20, "Backspace2": 0x7F,
+    "Ctrl8": 0x7F,
+}
+KEYS.update({"Ctrl" + c: i + 1
+             for i, c in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ")})
+
+EVENTS = {
+    "Key": 0, "Resize": 1, "Mouse": 2, "Error": 3,
+    "Interrupt": 4, "Raw": 5, "None": 6,
+}
+
+COLORS = {
+    "Default": 0, "Black": 1, "Red": 2, "Green": 3, "Yellow": 4,
+    "Blue": 5, "Magenta": 6, "Cyan": 7, "White": 8,
+}
+
+ATTRIBUTES = {"Bold": 0x0200, "Underline": 0x0400, "Reverse": 0x0800}
+
+INPUT_MODES = {"Current": 0, "Esc": 1, "Alt": 2, "Mouse": 4}
+
+OUTPUT_MODES = {
+    "Current": 0, "Normal": 1, "256": 2, "216": 3, "Grayscale": 4,
+}
+
+
+def make_event(etype="Key", key=0, ch=0, mod=0, width=0, height=0,
+               err=""):
+    """Builds an event dict shaped like the ones Intermezzo returns."""
+    return {
+        "Type": EVENTS[etype], "Mod": mod, "Key": key, "Ch": ch,
+        "Width": width, "Height": height, "Err": err,
+        "MouseX": 0, "MouseY": 0, "N": 0,
+    }
+
+
+class Headless(object):
+    """An in-memory terminal that replays a scripted stream of events.
+
+    Attributes:
+        cells (list): One [chars, fgs, bgs] triplet of lists per row.
+        cursor (tuple): The cursor position or None if it is hidden.
+        writes (int): Number of set_cell calls received.
+        flushes (int): Number of flush calls received.
+        polls (int): Number of events handed out by poll_event.
+
+    """
+
+    def __init__(self, width=80, height=24, events=()):
+        self.events = iter(events)
+        self.writes = 0
+        self.flushes = 0
+        self.polls = 0
+        self.cursor = None
+        self._pending = []
+        self._resize(width, height)
+
+    @staticmethod
+    def keys(*names):
+        """Returns the key press events for each of the key names."""
+        return [make_event(key=KEYS[n]) for n in names]
+
+    @staticmethod
+    def text(s):
+        """Returns the events a terminal would send when s is typed."""
+        events = []
+        for c in s:
+            if c == " ":
+                events.append(make_event(key=KEYS["Space"]))
+            elif c == "\t":
+                events.append(make_event(key=KEYS["Tab"]))
+            elif c == "\n":
+                events.append(make_event(key=KEYS["Enter"]))
+            else:
+                events.append(make_event(ch=ord(c)))
+        return events
+
+    @classmethod
+    def script(cls, *steps):
+        """Flattens key names and typed strings into one event list.
+
+        Steps matching a key name (eg. "Enter") are pressed, dicts are
+        used as-is and any other string is typed out.
+        """
+        events = []
+        for step in steps:
+            if isinstance(step, dict):
+                events.append(step)
+            elif step in KEYS:
+                events.extend(cls.keys(step))
+            else:
+                events.extend(cls.text(step))
+        return events
+
+    def _resize(self, width, height):
+        self.width, self.height = width, height
+        self.cells = [[[" "] * width, [0] * width, [0] * width]
+                      for _ in range(height)]
+
+    # lifecycle and modes
+    def init(self):
+        return None
+
+    def close(self):
+        return None
+
+    def set_input_mode(self, mode):
+        return mode
+
+    def set_output_mode(self, mode):
+        return mode
+
+    def input(self, name):
+        return INPUT_MODES.get(name)
+
+    def output(self, name):
+        return OUTPUT_MODES.get(name)
+
+    def key(self, name):
+        return KEYS.get(name)
+
+    def event(self, name):
+        return EVENTS.get(name)
+
+    def color(self, name):
+        return COLORS.get(name)
+
+    def attribute(self, name):
+        return ATTRIBUTES.get(name)
+
+    # drawing
+    def size(self):
+        return self.width, self.height
+
+    def set_cell(self, x, y, ch, fg, bg):
+        self.writes += 1
+        if 0 <= x < self.width and 0 <= y < self.height:
+            chars, fgs, bgs = self.cells[y]
+            chars[x] = ch
+            fgs[x] = fg
+            bgs[x] = bg
+
+    def clear(self, fg, bg):
+        for chars, fgs, bgs in self.cells:
+            chars[:] = [" "] * self.width
+            fgs[:] = [fg] * self.width
+            bgs[:] = [bg] * self.width
+
+    def flush(self):
+        self.flushes += 1
+
+    def set_cursor(self, x, y):
+        self.cursor = (x, y)
+
+    def hide_cursor(self):
+        self.cursor = None
+
+    def rune_width(self, r):
+        # same rules as go-runewidth: controls and combining marks take
+        # no space, East Asian wide and fullwidth runes take two cells
+        o = ord(r)
+        if o < 0x20 or 0x7F <= o <= 0x9F:
+            return 0
+        if o < 0x300:
+            return 1
+        if unicodedata.combining(r):
+            return 0
+        if unicodedata.east_asian_width(r) in ("W", "F"):
+            return 2
+        return 1
+
+    # input
+    def poll_event(self):
+        if self._pending:
+            e = self._pending.pop(0)
+        else:
+            try:
+                e = next(self.events)
+            except StopIteration:
+                raise EOFError("The scripted event stream is exhausted.")
+        self.polls += 1
+        if e["Type"] == EVENTS["Resize"]:
+            self._resize(e["Width"], e["Height"])
+        return e
+
+    def interrupt(self):
+        self._pending.append(make_event("Interrupt"))
+
+    # inspection
+    def line(self, y):
+        """Returns the text rendered on row y, without trailing blanks."""
+        return "".join(self.cells[y][0]).rstrip()
+
+    def screen(self):
+        """Returns the text of every row, without trailing blank rows."""
+        lines = [self.line(y) for y in range(self.height)]
+        while lines and not lines[-1]:
+            lines.pop()
+        return lines
@@ -0,0 +1,94 @@
+"""Key bindings compiled into a dispatch trie.
+
+A binding maps a key, or a chord of keys pressed one after the other,
+to a handler. Chords are written as space separated key names (eg.
+"CtrlX CtrlS") or as a tuple of names. Bindings are resolved to key codes
+once, when they are bound, so dispatching an event is a single dict
+lookup and conflicting bindings are reported up front instead of at
+runtime.
+
+"""
+
+
+class Keymap(object):
+    """A trie of key codes to handlers.
+
+    Each level of the trie is a dict keyed by key code. A value is either
+    a handler, or another dict when the key starts a longer chord.
+
+    Attributes:
+        resolve (callable): Turns a key name into its key code.
+        table (dict): The root of the trie.
+        bindings (dict): The chord (tuple of key names) of each binding.
+
+    """
+
+    def __init__(self, bindings=None, resolve=None):
+        self.resolve = resolve
+        self.table = {}
+        self.bindings = {}
+        for keys, handler in (bindings or {}).items():
+            self.bind(keys, handler)
+
+    def _parse(self, keys):
+        names = tuple(keys.split()) if isinstance(keys, str) else keys
+        if not names:
+            raise Exception("An empty key binding is not valid.")
+        codes = []
+        for name in names:
+            code = self.resolve(name)
+            if code is None:
+                raise Exception("This update key is not valid " +
+                                "or is unsupported.")
+            codes.append(code)
+        return names, tuple(codes)
+
+    def _conflict(self, names, other):
+        return Exception("This update key is already in use: " +
+                         f"{' '.join(names)} conflicts with " +
+                         f"{' '.join(other)}.")
+
+    def bind(self, keys, handler):
+        """Adds a binding, raising if it clashes with an existing one.
+
+        Two bindings clash when they resolve to the same codes, or when
+        one of them is the beginning of the other chord.
+        """
+        names, codes = self._parse(keys)
+        node = self.table
+        for i, code in enumerate(codes[:-1]):
+            nxt = node.get(code)
+            if nxt is None:
+                nxt = node[code] = {}
+            elif not isinstance(nxt, dict):
+                # a shorter binding already ends here
+                raise self._conflict(names, self.bindings[codes[:i + 1]])
+            node = nxt
+        last = codes[-1]
+        if last in node:
+            # either the very same chord, or the start of a longer one
+            prefix, existing = codes, node[last]
+            while isinstance(existing, dict):
+                code, existing = next(iter(existing.items()))
+                prefix = prefix + (code,)
+            raise self._conflict(names, self.bindings[prefix])
+        node[last] = handler
+        self.bindings[codes] = names
+
+    def copy(self):
+        """Returns a Keymap with the same bindings that can be extended."""
+        km = Keymap(resolve=self.resolve)
+        km.table = _copy_trie(self.table)
+        km.bindings = dict(self.bindings)
+        return km
+
+    def lookup(self, code, node=None):
+        """Returns the handler, the next trie level or None for a code."""
+        if node is None:
+            node = self.table
+        return node.get(code)
+
+
+def _copy_trie(node):
+    return {k: _copy_trie(v) if isinstance(v, dict) else v
+            for k, v in node.items()}
@@ -12,22 +12,76 @@ If there is a need for more full featured implementation:
 registry = {}
 
 
+def supercedes(a, b):
+    """Returns True if signature a is at least as specific as b."""
+    return len(a) == len(b) and all(map(issubclass, a, b))
+
+
+def consistent(a, b):
+    """Returns True if some argument types could match both a and b."""
+    return len(a) == len(b) and \
+        all(issubclass(x, y) or issubclass(y, x) for x, y in zip(a, b))
+
+
 class MultiMethod(object):
+    """Dispatches on the classes of all the positional arguments.
+
+    A registered signature matches the arguments if each of their classes
+    is a subclass of the type at that position, so a bool is taken where
+    an int is registered. The most specific match wins; among matches
+    that are not comparable the one closest in the MRO of the arguments
+    does. Resolutions are cached by argument classes, so repeated calls
+    are a single dict lookup.
+    """
+
     def __init__(self, name):
         self.name = name
         self.typemap = {}
+        # argument classes -> resolved function, None if nothing matches
+        self.cache = {}
 
     def __call__(self, *args):
         types = tuple(arg.__class__ for arg in args)  # a generator expression!
-        function = self.typemap.get(types)
+        try:
+            function = self.cache[types]
+        except KeyError:
+            function = self.cache[types] = self.resolve(types)
         if function is None:
             raise TypeError("no match")
         return function(*args)
 
+    def resolve(self, types):
+        """Returns the function registered for the best match of types."""
+        function = self.typemap.get(types)
+        if function is not None:
+            return function
+        matches = [sig for sig in self.typemap if supercedes(types, sig)]
+        # drop the matches that a more specific one supercedes
+        best = [sig for sig in matches
+                if not any(other != sig and supercedes(other, sig)
+                           for other in matches)]
+        if not best:
+            return None
+        if len(best) > 1:
+            # eg. classes with multiple bases, rank by MRO distance
+            def distance(sig):
+                return sum(t.__mro__.index(s) for t, s in zip(types, sig))
+            best.sort(key=distance)
+            if distance(best[0]) == distance(best[1]):
+                raise TypeError(f"ambiguous call to {self.name}: "
+                                f"{best[0]} and {best[1]} both match")
+        return self.typemap[best[0]]
+
     def register(self, types, function):
         if types in self.typemap:
             raise TypeError("duplicate registration")
+        for sig in self.typemap:
+            if consistent(types, sig) and not supercedes(types, sig) and \
+                    not supercedes(sig, types):
+                raise TypeError(f"ambiguous registration of {self.name}: "
+                                f"{types} and {sig}")
         self.typemap[types] = function
+        self.cache.clear()
 
 
 def dispatch(*types):
@@ -56,11 +110,11 @@ def configure(newv, colors, default):
     # eg: ("?", (3,0,0))
     # handle tuple2 vs. tuple3
     if len(colors) == 3:
-        newcm = [colors for _ in newv]
+        newcm = (colors,) * len(newv)
         return (newv, newcm)
     elif len(colors) == 2:
         fg, bg = colors
-        newcm = [(fg, 0, bg) for _ in newv]
+        newcm = ((fg, 0, bg),) * len(newv)
         return (newv, newcm)
     else:
         return default
@@ -70,7 +124,7 @@ def configure(newv, colors, default):
 def configure(newv, fg, attr, bg, default):
     # format: (str, int, int, int)
     # eg. ("?", 3, 0, 0)
-    newcm = [(fg, attr, bg) for _ in newv]
+    newcm = ((fg, attr, bg),) * len(newv)
     return (newv, newcm)
 
 
@@ -78,7 +132,7 @@ def configure(newv, fg, attr, bg, default):
 def configure(newv, fg, bg, default):
     # format: (str, int, int)
     # eg. ("?", 3, 0)
-    newcm = [(fg, 0, bg) for _ in newv]
+    newcm = ((fg, 0, bg),) * len(newv)
     return (newv, newcm)
 
 
@@ -87,7 +141,7 @@ def configure(fg, attr, bg, default):
     # format: (int, int, int)
     # eg. (3, 0, 0)
     v, _ = default
-    newcm = [(fg, attr, bg) for _ in v]
+    newcm = ((fg, attr, bg),) * len(v)
     return (v, newcm)
 
 
@@ -96,7 +150,7 @@ def configure(fg, bg, default):
     # format: (int, int)
     # eg. (3, 0)
     v, _ = default
-    newcm = [(fg, 0, bg) for _ in v]
+    newcm = ((fg, 0, bg),) * len(v)
     return (v, newcm)
 
 
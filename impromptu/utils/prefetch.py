@@ -0,0 +1,131 @@
+"""Runs the mount() of upcoming Questions ahead of time.
+
+While a Question waits for input, the Questions that the Registrar will
+hand out next are already known. A Prefetcher starts their mount() on a
+worker so that the work a mount does (eg. downloading a file) is done by
+the time the user gets there.
+
+Every prefetch remembers the Questions that were expected to be asked
+before it. As soon as the flow takes another path (a logic jump inserted,
+skipped or branched) the prefetch is stale: it is cancelled if it has not
+started yet and its result is discarded otherwise, and the mount runs
+again when the Question is actually reached.
+
+"""
+from concurrent.futures import CancelledError
+
+from impromptu.utils.executor import shared_pool
+
+
+class Prefetch(object):
+    """A mount() running ahead of time."""
+    __slots__ = ("key", "future", "before")
+
+    def __init__(self, key, future, before):
+        self.key = key
+        self.future = future
+        # keys that have to be asked, in order, before this one
+        self.before = before
+
+
+class Prefetcher(object):
+    """Prefetches the mount() of the next Questions of a Registrar.
+
+    Args:
+        registrar (Registrar): The flow being prompted.
+        depth (int): How many of the upcoming Questions to prefetch.
+        pool: The concurrent.futures executor mounts run on; defaults
+            to the shared thread pool.
+        prepare (callable): Called with a Question before its mount() is
+            started, eg. to hand it the cli and registrar.
+
+    Attributes:
+        hits (int): Mounts answered by a prefetch.
+        discarded (int): Prefetches dropped because the flow changed.
+
+    """
+
+    def __init__(self, registrar, depth=1, pool=None, prepare=None):
+        self.registrar = registrar
+        self.depth = depth
+        self.prepare = prepare
+        self.pool = shared_pool("thread") if pool is None else pool
+        self.pending = {}
+        # the key last handed to mount()
+        self.running = None
+        self.hits = 0
+        self.discarded = 0
+
+    def _upcoming(self):
+        keys = []
+        key = self.registrar.cursor
+        while key is not None and len(keys) < self.depth:
+            keys.append(key)
+            key = self.registrar.registry[key].next
+        return keys
+
+    def _discard(self, prefetch):
+        del self.pending[prefetch.key]
+        if not prefetch.future.cancel():
+            # already running; its result (or error) is simply dropped
+            prefetch.future.add_done_callback(_ignore)
+        self.discarded += 1
+
+    def schedule(self):
+        """Starts the mounts of the upcoming Questions not started yet."""
+        upcoming = self._upcoming()
+        for i, key in enumerate(upcoming):
+            before = tuple(upcoming[:i])
+            prefetch = self.pending.get(key)
+            if prefetch is not None and prefetch.before != before:
+                self._discard(prefetch)
+                prefetch = None
+            if prefetch is not None:
+                continue
+            question = self.registrar.registry[key].data
+            if question.lifecycle["mount"] is None:
+                # nothing to do ahead of time
+                continue
+            if self.prepare is not None:
+                self.prepare(question)
+            future = self.pool.submit(question.mount)
+            self.pending[key] = Prefetch(key, future, before)
+
+    def mount(self, key, question):
+        """Returns the result of question.mount(), prefetched if possible.
+
+        Called when the Question under key is reached; every prefetch that
+        did not expect the flow to reach it at this point is discarded. The
+        Question being asked again (its unmount() returned False) keeps the
+        prefetches of the ones after it.
+        """
+        if key == self.running:
+            return question.mount()
+        self.running = key
+        found = None
+        for prefetch in list(self.pending.values()):
+            if prefetch.key == key and not prefetch.before:
+                found = prefetch
+                del self.pending[key]
+            elif prefetch.before and prefetch.before[0] == key:
+                prefetch.before = prefetch.before[1:]
+            else:
+                self._discard(prefetch)
+        if found is None:
+            return question.mount()
+        try:
+            result = found.future.result()
+        except CancelledError:
+            return question.mount()
+        self.hits += 1
+        return result
+
+    def close(self):
+        for prefetch in list(self.pending.values()):
+            self._discard(prefetch)
+
+
+def _ignore(future):
+    # retrieve the outcome so a failed, discarded mount is not reported
+    if not future.cancelled():
+        future.exception()
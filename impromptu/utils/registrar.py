@@ -1,235 +1,351 @@
 """A helper class to manage the logical flow of Questions.
 
+Questions are kept in a doubly linked list of Nodes, indexed by key and
+by name. Keys come from a counter, so they are unique without looking at
+the registry and increase in registration order.
+
+Every node also has a rank. Along the running chain ranks only increase:
+nodes spliced in between two others get ranks in between (the nodes that
+follow are spread out again when two ranks get too close) and the nodes
+of a branch are bounded by the rank of the first question the branch
+cut off. Whether a key is ahead of the running question, or part of the
+chain a branch replaced, is then a comparison of ranks instead of a walk
+over the list.
+
 """
-import time
-import random
+import itertools
+from fractions import Fraction
+
+# rank distance between appended nodes
+SPACING = 1 << 32
+# smallest rank distance left between nodes when making room
+ROOM = 1 << 10
+
+
+class Node(object):
+    """A registered Question and its place in the flow.
+
+    Attributes:
+        key (int): Unique key of the node.
+        data (Question): The registered Question.
+        prev (int): Key of the previous node, None for the first one.
+        next (int): Key of the next node, None for the last one.
+        origin (int): Key of the node a branch started from, None if the
+            node is not part of a branch.
+        rank (int or Fraction): Position of the node in the flow.
+        bound (int or Fraction): Ranks of the chain the node is in stay
+            below this, None if unbounded.
+        orphaned (bool): Whether the node was skipped over for good.
+
+    """
+    __slots__ = ("key", "data", "prev", "next", "origin", "rank", "bound",
+                 "orphaned")
+
+    def __init__(self, key, data, rank, bound=None, origin=None):
+        self.key = key
+        self.data = data
+        self.prev = None
+        self.next = None
+        self.origin = origin
+        self.rank = rank
+        self.bound = bound
+        self.orphaned = False
+
+    def __getitem__(self, name):
+        # the registry used to hold dicts; keep node["data"] working
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
 
 
 class Registrar(object):
+    """Registry and flow of the Questions of a form.
+
+    Attributes:
+        registry (dict): key -> Node of every registered Question.
+        names (dict): Question name -> Node (the latest registered).
+        orphaned (dict): key of an orphaned node -> key of the node that
+            left it behind.
+        branched (dict): key of a branch origin -> (first, last) keys of
+            the chain the branch cut off, None if it cut off nothing.
+            Entries are dropped once the branch is merged.
+        entry (int): Key of the first node.
+        cursor (int): Key of the node get() returns next.
+        running (int): Key of the node get() returned last.
+        tail (int): Key of the last node of the running chain.
+        adopt (callable): Applied to every Question before it is
+            registered, eg. to spawn a private copy of a shared one.
+        touched (set): Keys of the nodes created or changed (links, rank,
+            bound, orphaned, branched entry) since it was last reset;
+            None (the default) to not keep track.
+
+    """
 
     def __init__(self):
         self.registry = {}
+        self.names = {}
         self.orphaned = {}
         self.branched = {}
         self.entry = None
         self.cursor = None
         self.running = None
+        self.tail = None
+        self._keys = itertools.count(1)
+        self.adopt = None
+        self.touched = None
+
+    def _make_node(self, question, rank, bound=None, origin=None):
+        if self.adopt is not None:
+            question = self.adopt(question)
+        node = Node(next(self._keys), question, rank, bound, origin)
+        self.registry[node.key] = node
+        self._touch(node.key)
+        name = getattr(question, "name", None)
+        if name is not None:
+            self.names[name] = node
+        return node
 
-    def _make_unique_key(self):
-        keys = list(self.registry.keys())
-        timestamp = None
-        # ensure the inserted key is unique
-        while True:
-            timestamp = int(time.strftime("%m%d%H%M%S"))
-            key = random.randint(0, timestamp)
-            if key not in keys:
-                return key
+    def _touch(self, *keys):
+        if self.touched is not None:
+            self.touched.update(keys)
+
+    def _ranks(self, node, count, upper):
+        # ranks for count nodes spliced in between node and upper
+        if upper is None:
+            step = SPACING
+        elif type(upper - node.rank) is int and upper - node.rank > count:
+            step = (upper - node.rank) // (count + 1)
+        else:
+            step = Fraction(upper - node.rank, count + 1)
+        return [node.rank + step * i for i in range(1, count + 1)]
+
+    def _make_room(self, node, count):
+        # re-spaces the ranks of as few nodes after node as needed so
+        # that count more fit in right after it
+        walked = []
+        after = self.registry.get(node.next)
+        while after is not None:
+            gap = after.rank - node.rank
+            if type(gap) is int and gap >= (len(walked) + count + 1) * ROOM:
+                break
+            walked.append(after)
+            after = self.registry.get(after.next)
+        if not walked:
+            return
+        upper = after.rank if after is not None else walked[-1].bound
+        slots = len(walked) + count + 1
+        if upper is None:
+            step = SPACING
+        elif type(upper - node.rank) is int and upper - node.rank >= slots:
+            step = (upper - node.rank) // slots
+        else:
+            # no integer room left below the bound, _ranks uses Fractions
+            return
+        for i, moved in enumerate(walked, count + 1):
+            moved.rank = node.rank + step * i
+            self._touch(moved.key)
+
+    def _splice(self, node, questions, bound, origin):
+        # links new nodes for questions between node and its next
+        self._make_room(node, len(questions))
+        after = self.registry.get(node.next)
+        upper = after.rank if after is not None else bound
+        ranks = self._ranks(node, len(questions), upper)
+        previous = node
+        for q, rank in zip(questions, ranks):
+            this = self._make_node(q, rank, bound, origin)
+            previous.next = this.key
+            this.prev = previous.key
+            previous = this
+        previous.next = after.key if after is not None else None
+        self._touch(node.key, previous.key)
+        if after is not None:
+            after.prev = previous.key
+            self._touch(after.key)
+        elif self.tail == node.key:
+            self.tail = previous.key
+        return self.registry[node.next]
+
+    def _chain(self, node):
+        # bound and origin of the nodes linked in right after node: the
+        # branch started from node, if any, bounded by what it cut off
+        if node.key in self.branched:
+            cut = self.branched[node.key]
+            if cut is None:
+                return node.bound, node.key
+            return self.registry[cut[0]].rank, node.key
+        return node.bound, node.origin
+
+    def _cut_off(self, node):
+        # whether node is part of a chain a branch cut off, by rank
+        for cut in self.branched.values():
+            if (cut is not None and
+                    self.registry[cut[0]].rank <= node.rank <=
+                    self.registry[cut[1]].rank):
+                return True
+        return False
+
+    def _orphan(self, start, stop, by):
+        # marks the nodes from start up to (not including) stop
+        key = start
+        while key is not None and key != stop:
+            node = self.registry[key]
+            node.orphaned = True
+            self.orphaned[key] = by
+            self._touch(key)
+            key = node.next
+
+    def reseed(self, start):
+        """Hands out keys from start on, eg. after restoring the registry."""
+        self._keys = itertools.count(start)
+
+    def _resolve(self, key):
+        # a key or the name of a Question
+        if isinstance(key, str):
+            return self.names.get(key)
+        return self.registry.get(key)
+
+    def lookup(self, name):
+        """Returns the Node of the Question named name, None if unknown."""
+        return self.names.get(name)
 
     def put(self, question):
-        keys = list(self.registry.keys())
-        unique_key = self._make_unique_key()
-        # link the questions together by referencing their unique keys
-        previous_key = None
-        if not keys:
-            self.entry = unique_key
-            self.cursor = unique_key
+        tail = self.registry.get(self.tail)
+        if tail is None:
+            node = self._make_node(question, 0)
+            self.entry = node.key
+            self.cursor = node.key
+            self.tail = node.key
         else:
-            previous_key = keys[-1]
-            self.registry[previous_key]["next"] = unique_key
-        # append to the registry
-        self.registry[unique_key] = {
-            "data": question,
-            "key": unique_key,
-            "prev": previous_key,
-            "next": None
-        }
-        return unique_key
+            node = self._splice(tail, [question], *self._chain(tail))
+            if self.cursor is None and self.running == tail.key:
+                # the flow had run out; carry on with the new question
+                self.cursor = node.key
+        return node.key
 
     def get(self):
         # grabs the question of the current cursor
         # moves the cursor to the next question
         if self.cursor is None:
             return None
-        question = self.registry[self.cursor]["data"]
+        node = self.registry[self.cursor]
         self.running = self.cursor
-        self.cursor = self.registry[self.cursor]["next"]
-        return question
+        self.cursor = node.next
+        return node.data
 
     def current(self):
         return self.registry[self.running]
 
     def previous(self):
-        return self.registry[self.running]["prev"]
+        return self.registry[self.running].prev
 
     def subsequent(self):
-        return self.registry[self.running]["next"]
+        return self.registry[self.running].next
 
     def insert(self, *questions):
+        """Asks questions right after the running one."""
         if not questions:
-            questions = []
-        # previous is not guaranteed; eg. if you insert right
-        # after the _first_ Question in the registry
-        previous = self.registry.get(self.previous(), None)
+            return
         running = self.current()
-        # subsequent is not guaranteed; eg. if you insert right
-        # after the _last_ Question in the registry
-        subsequent = self.registry.get(self.subsequent(), None)
-        for i, q in enumerate(questions):
-            unique_key = self._make_unique_key()
-            this_question = {
-                "data": q,
-                "key": unique_key,
-                "prev": None,
-                "next": None
-            }
-            if i == 0 and len(questions) > 1:
-                # this is the first question inserted
-                # update self.cursor to this unique key so that
-                # running self.get() will result in this question
-                # instead of the previous subsequent question
-                # the prev of this question is the running question
-                # the next is the next question in the list, which
-                # will get resolved in the next loop
-                self.cursor = unique_key
-                running["next"] = unique_key
-                this_question["prev"] = running["key"]
-            elif len(questions) == 1:
-                # this is the only question to be inserted
-                self.cursor = unique_key
-                running["next"] = unique_key
-                this_question["prev"] = running["key"]
-                if subsequent is not None:
-                    this_question["next"] = subsequent["key"]
-            elif i == len(questions) - 1:
-                # this is the last question to be inserted
-                # the prev is the previous question's key
-                # the next was the previously subsequent question
-                if previous is not None:
-                    previous["next"] = unique_key
-                    this_question["prev"] = previous["key"]
-                if subsequent is not None:
-                    subsequent["prev"] = unique_key
-                    this_question["next"] = subsequent["key"]
-            else:
-                # this is a question between the first and last
-                # this question's prev is the previous question's key
-                # this also resolves the previous question's next
-                # this question's next will be resolved in the next loop
-                if previous is not None:
-                    previous["next"] = unique_key
-                    this_question["prev"] = previous["key"]
-            # this inserts it into the registry
-            self.registry[unique_key] = this_question
-            # update the variable that points to this dict so that in the
-            # next loop the next key can be resolved
-            previous = this_question
-
-    def _list_linked_keys(self):
-        linked_key = None
-        linked_keys = []
-        subsequent = self.subsequent()
-        while True:
-            if not linked_keys:
-                linked_key = subsequent["key"]
-            else:
-                linked_key = self.registry[linked_key]["next"]
-            if not linked_key:
-                break
-            linked_keys.append(linked_key)
-        return linked_keys
+        first = self._splice(running, questions, *self._chain(running))
+        self.cursor = first.key
 
     def branch(self, *questions):
+        """Replaces the rest of the flow with questions.
+
+        The chain that is cut off is recorded in branched so that merge()
+        can return to it. Branching again from the same question replaces
+        the earlier branch, and merge() still returns to the chain the
+        first branch cut off.
+        """
         if not questions:
-            questions = []
+            return
         running = self.current()
-        previous = None
-        for i, q in enumerate(questions):
-            unique_key = self._make_unique_key()
-            this_question = {
-                "data": q,
-                "key": unique_key,
-                "prev": None,
-                "next": None,
-                "origin": running["key"]
-            }
-            if i == 0:
-                # this is the first question that diverges
-                # update self.cursor to this unique key so that
-                # running self.get() will result in this question
-                # instead of the upcoming question that was branched
-                # the prev of this question is the running question
-                # the next is the next question in the list, which
-                # will get resolved in the next loop
-                self.cursor = unique_key
-                running["next"] = unique_key
-                this_question["prev"] = running["key"]
-                # update self.branched with the key of the question
-                # that the branch originated from
-                branched_keys = self._list_linked_keys()
-                self.branched[running["key"]] = branched_keys
-            else:
-                # this question's prev is the previous question's key
-                # this also resolves the previous question's next
-                # this question's next will be resolved in the next loop
-                previous["next"] = unique_key
-                this_question["prev"] = previous["key"]
-            # this inserts it into the registry
-            self.registry[unique_key] = this_question
-            # update the variable that points to this dict so that in the
-            # next loop the next key can be resolved
-            previous = this_question
+        # leave room for questions inserted into the branch later on
+        self._make_room(running, len(questions) + ROOM)
+        after = self.registry.get(running.next)
+        if running.key in self.branched:
+            # what follows is the earlier branch; it is replaced
+            self._orphan(running.next, None, running.key)
+        elif after is not None:
+            self.branched[running.key] = (after.key, self.tail)
+        else:
+            self.branched[running.key] = None
+        # detach the rest; the branch ends the flow until a merge
+        running.next = None
+        self.tail = running.key
+        self._touch(running.key)
+        first = self._splice(running, questions, *self._chain(running))
+        self.cursor = first.key
 
     def merge(self, key=None):
+        """Continues with the chain cut off by the running branch.
+
+        Args:
+            key: Key (or name) of the question to continue with; defaults
+                to the first one that was cut off.
+        """
         running = self.current()
-        origin = running.get("origin", False)
-        if not origin:
+        origin = running.origin
+        if origin is None:
             # TODO: refine error messaging
             raise Exception("No branches found!")
-        valid_keys = self.branched[origin]
-        if not key:
-            key = valid_keys[0]
-        if key in valid_keys:
-            # if merged back, but not to the start of the branch,
-            # any questions skipped over will be orphaned by the
-            # branch origin; record it:
-            key_index = valid_keys.index(key)
-            orphaned_keys = valid_keys[:key_index]
-            for orphan in orphaned_keys:
-                self.orphaned[orphan] = origin
-            # if merged back without finishing the remaining
-            # branched questions, if any, the remaining will
-            # effectively be orphaned; note this:
-            merging = self.registry[key]
-            orphaned_keys = self._list_linked_keys()
-            for orphan in orphaned_keys:
-                self.orphaned[orphan] = running["key"]
-            # update links between questions
-            running["next"] = key
-            merging["prev"] = running["key"]
-            # update the cursor
-            self.cursor = key
-        else:
+        cut = self.branched.get(origin)
+        target = None
+        if cut is not None:
+            first, last = self.registry[cut[0]], self.registry[cut[1]]
+            target = first if key is None else self._resolve(key)
+        if (target is None or target.orphaned or
+                not first.rank <= target.rank <= last.rank):
             # TODO: refine error messaging
             raise Exception("Not a valid merge candidate!")
+        # questions skipped over at the start of the cut off chain are
+        # orphaned by the branch origin, what is left of the branch by
+        # the running question
+        self._orphan(first.key, target.key, origin)
+        self._orphan(running.next, None, running.key)
+        # the branch is part of the chain it merged into from now on
+        del self.branched[origin]
+        node = running
+        while node.key != origin:
+            node.bound, node.origin = last.bound, last.origin
+            self._touch(node.key)
+            node = self.registry[node.prev]
+        running.next = target.key
+        target.prev = running.key
+        self._touch(origin, target.key)
+        self.cursor = target.key
+        self.tail = last.key
 
     def skip(self, key=None):
-        # needs to update self.orphans
+        """Jumps ahead to key (or name), skipping one question if None."""
         running = self.current()
-        valid_keys = self._list_linked_keys()
-        if not key:
-            # if a key isn't provided, skip over one question
-            key = valid_keys[1]
-            orphan = valid_keys[0]
-            self.orphaned[orphan] = running["key"]
+        if key is None:
+            skipped = self.registry.get(running.next)
+            if skipped is None:
+                # TODO: refine error messaging
+                raise Exception("Invalid skip target!")
+            target = self.registry.get(skipped.next)
         else:
-            if key not in valid_keys:
+            target = self._resolve(key)
+            if (target is None or target.orphaned or
+                    target.rank <= running.rank or
+                    (running.bound is not None and
+                     target.rank >= running.bound) or
+                    self._cut_off(target)):
                 # TODO: refine error messaging
                 raise Exception("Invalid skip target!")
-            key_index = valid_keys.index(key)
-            orphaned_keys = valid_keys[:key_index]
-            for orphan in orphaned_keys:
-                self.orphaned[orphan] = running["key"]
-        new_next = self.registry[key]
-        running["next"] = new_next
-        new_next["prev"] = running["key"]
-        self.cursor = new_next
+        stop = target.key if target is not None else None
+        self._orphan(running.next, stop, running.key)
+        running.next = stop
+        self._touch(running.key)
+        if target is not None:
+            target.prev = running.key
+            self._touch(target.key)
+        else:
+            self.tail = running.key
+        self.cursor = stop
@@ -0,0 +1,254 @@
+"""Incremental fuzzy search over the labels of a choice widget.
+
+The index stores, for every rune and column, the set of labels holding
+that rune at that column as a Python int used as a bitset (bit i stands
+for label i). A query is a chain of states, one per typed rune; each
+state is derived from the previous one with a handful of big int ANDs
+per column, so typing one more rune narrows the previous results instead
+of rescanning every label, and erasing one just drops the last state.
+
+A label matches when the query runes appear in it in order. Matches are
+ranked in three groups: labels starting with the query, labels holding
+it as a substring, then the remaining fuzzy matches, each group in the
+original order of the labels.
+
+"""
+from bisect import bisect_right
+from itertools import accumulate
+
+from impromptu.utils.bitset import BITS, popcount
+
+# bits per block when looking up the n-th match of a bitset
+BLOCK = 4096
+
+
+class SearchIndex(object):
+    """Bitset index of the runes of the lower-cased labels.
+
+    Args:
+        labels (sequence): The choices being searched, read once.
+        limit (int): Only the first limit columns are indexed; the few
+            labels that are longer are matched one by one instead.
+
+    Attributes:
+        labels (list): The lower-cased labels.
+        width (int): Number of indexed columns.
+
+    """
+
+    def __init__(self, labels, limit=64):
+        self.labels = [str(label).lower() for label in labels]
+        short = [len(label) <= limit for label in self.labels]
+        self.long = [i for i, ok in enumerate(short) if not ok]
+        self.width = max([len(label) for label, ok in
+                          zip(self.labels, short) if ok] or [0])
+        self.everything = self._mask(i for i, ok in enumerate(short) if ok)
+        # rune -> one bitset per column: labels with the rune there
+        self.columns = {}
+        # rune -> one bitset per column: labels whose first such rune
+        # is there, ie. the states after typing just that rune
+        self.firsts = {}
+        self._build(short)
+
+    def _mask(self, indexes):
+        bits = bytearray(len(self.labels) // 8 + 1)
+        for i in indexes:
+            bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, "little")
+
+    def _build(self, short):
+        width = self.width
+        # one row per label padded to the width, long labels left blank
+        rows = "".join([label.ljust(width, "\0") if ok else "\0" * width
+                        for label, ok in zip(self.labels, short)])
+        runes = sorted(set(rows) - {"\0"})
+        if len(runes) < 256:
+            # map the runes to single bytes so a column can be turned into
+            # a bitset with bytes.translate and int(..., 2)
+            ids = {ord(r): i + 1 for i, r in enumerate(runes)}
+            rows = rows.translate(ids).encode("latin-1")
+            for r in runes:
+                self.columns[r] = [0] * width
+            for x in range(width):
+                # reversed so that the last label ends up as the top bit
+                column = rows[x::width][::-1]
+                for code in set(column) - {0}:
+                    table = bytearray(b"0" * 256)
+                    table[code] = ord("1")
+                    r = runes[code - 1]
+                    self.columns[r][x] = int(column.translate(table), 2)
+        else:
+            positions = {}
+            for i, label in enumerate(self.labels):
+                if short[i]:
+                    for x, r in enumerate(label):
+                        positions.setdefault((r, x), []).append(i)
+            for r in runes:
+                self.columns[r] = [0] * width
+            for (r, x), indexes in positions.items():
+                self.columns[r][x] = self._mask(indexes)
+        for r, masks in self.columns.items():
+            seen = 0
+            firsts = []
+            for mask in masks:
+                firsts.append(mask & ~seen)
+                seen |= mask
+            self.firsts[r] = firsts
+
+    def query(self):
+        """Returns the state of the empty query, matching every label."""
+        return Query(self)
+
+
+class Query(object):
+    """The matches of one query, narrowed from the previous query.
+
+    Attributes:
+        text (str): The lower-cased query.
+        parent (Query): The query without the last rune, None if empty.
+
+    """
+    __slots__ = ("index", "text", "parent", "ends", "starts", "long",
+                 "_matches")
+
+    def __init__(self, index, text="", parent=None, ends=None,
+                 starts=None, long=None):
+        self.index = index
+        self.text = text
+        self.parent = parent
+        # ends[x]: labels whose leftmost in-order match ends before column x
+        self.ends = ends
+        # starts[x]: labels holding the query as a substring at column x
+        self.starts = starts
+        # (index, end) of the long labels still matching
+        self.long = [(i, 0) for i in index.long] if long is None else long
+        self._matches = None
+
+    def extend(self, rune):
+        """Returns the query with rune typed after this one."""
+        index = self.index
+        rune = rune.lower()
+        text = self.text + rune
+        columns = index.columns.get(rune)
+        width = index.width
+        if columns is None:
+            ends, starts = [0] * (width + 1), [0] * width
+        elif self.ends is None:
+            ends = [0] + index.firsts[rune]
+            starts = list(columns)
+        else:
+            ends = [0] * (width + 1)
+            waiting = 0
+            for x in range(width):
+                if self.ends[x]:
+                    waiting |= self.ends[x]
+                if waiting and columns[x]:
+                    hit = waiting & columns[x]
+                    if hit:
+                        ends[x + 1] = hit
+                        waiting ^= hit
+            n = len(self.text)
+            starts = [0] * width
+            for x in range(width - n):
+                if self.starts[x]:
+                    starts[x] = self.starts[x] & columns[x + n]
+        long = []
+        labels = index.labels
+        for i, end in self.long:
+            found = labels[i].find(rune, end)
+            if found >= 0:
+                long.append((i, found + 1))
+        return Query(index, text, self, ends, starts, long)
+
+    def matches(self):
+        """Returns the ranked Matches of the query (cached)."""
+        if self._matches is None:
+            self._matches = Matches(self)
+        return self._matches
+
+
+class Matches(object):
+    """Ranked view of the labels matching a Query.
+
+    Maps a rank to the index of the label in the original choices, so it
+    can stand in for the choices when scrolling. Only the blocks of
+    bits around the requested ranks are ever turned into indexes.
+    """
+
+    def __init__(self, query):
+        index = query.index
+        if query.ends is None:
+            groups = [index.everything, 0, 0]
+        else:
+            found = substring = 0
+            for mask in query.ends:
+                found |= mask
+            for mask in query.starts:
+                substring |= mask
+            prefix = query.starts[0] if query.starts else 0
+            groups = [prefix, substring ^ prefix, found ^ substring]
+        if query.long:
+            groups = self._add_long(query, groups)
+        self.groups = groups
+        self.counts = [popcount(mask) for mask in groups]
+        self._offsets = list(accumulate([0] + self.counts))
+        self._blocks = {}
+
+    def _add_long(self, query, groups):
+        labels, text = query.index.labels, query.text
+        groups = list(groups)
+        for i, _ in query.long:
+            if labels[i].startswith(text):
+                group = 0
+            elif text in labels[i]:
+                group = 1
+            else:
+                group = 2
+            groups[group] |= 1 << i
+        return groups
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def mask(self):
+        """Returns every match as an int bitset of original indexes."""
+        prefix, substring, fuzzy = self.groups
+        return prefix | substring | fuzzy
+
+    def _block(self, group):
+        blocks = self._blocks.get(group)
+        if blocks is None:
+            mask = self.groups[group]
+            data = mask.to_bytes(mask.bit_length() // 8 + 1, "little")
+            size = BLOCK // 8
+            chunks = [data[o:o + size] for o in range(0, len(data), size)]
+            counts = [popcount(int.from_bytes(c, "little")) for c in chunks]
+            blocks = (chunks, list(accumulate(counts)), {})
+            self._blocks[group] = blocks
+        return blocks
+
+    def _nth(self, group, n):
+        chunks, totals, decoded = self._block(group)
+        b = bisect_right(totals, n)
+        indexes = decoded.get(b)
+        if indexes is None:
+            indexes = []
+            base = b * BLOCK
+            for j, byte in enumerate(chunks[b]):
+                if byte:
+                    at = base + j * 8
+                    indexes.extend([at + bit for bit in BITS[byte]])
+            decoded[b] = indexes
+        return indexes[n - (totals[b - 1] if b else 0)]
+
+    def __getitem__(self, rank):
+        if rank < 0:
+            rank += len(self)
+        if not 0 <= rank < len(self):
+            raise IndexError("Matches index out of range")
+        group = bisect_right(self._offsets, rank) - 1
+        return self._nth(group, rank - self._offsets[group])
+
+    def __iter__(self):
+        for rank in range(len(self)):
+            yield self[rank]
@@ -0,0 +1,139 @@
+"""Serves a form to many sessions at once over Unix sockets.
+
+The form is built once; every connection gets its own run of it through
+Impromptu.spawn(), which shares the Question definitions and only keeps
+the state of the run per session. One asyncio loop accepts connections,
+reads the keys sent by the clients and writes the frames back.
+
+Sessions run on that loop too (see Impromptu.start_async): the keys a
+client sends are pushed straight to the EventLoop of its run and the
+waiting Question awaits them, so a session takes no thread of its own.
+Threads are only used for the work that may block, on pools shared by
+every session: update and validation handlers, and mount and unmount
+hooks.
+
+Clients connect with a terminal in raw mode, eg.::
+
+    socat -,raw,echo=0 UNIX-CONNECT:/tmp/form.sock
+
+"""
+import asyncio
+import os
+import threading
+
+from impromptu.utils.ansi import AnsiTerminal
+
+
+class Session(object):
+    """A connected client and the run of the form it answers.
+
+    Attributes:
+        form (Impromptu): The spawned run of the form.
+        terminal (AnsiTerminal): The terminal drawn to the client.
+        error (Exception): What ended the run early, None if it finished.
+
+    """
+    __slots__ = ("form", "terminal", "error")
+
+    def __init__(self, form, terminal):
+        self.form = form
+        self.terminal = terminal
+        self.error = None
+
+    @property
+    def responses(self):
+        return self.form.responses
+
+
+class FormServer(object):
+    """Runs a form for every client of a Unix socket.
+
+    Args:
+        form (Impromptu): The form definition; its Questions are shared
+            by every session and should not be asked directly.
+        path (str): Path of the Unix socket.
+        sessions (int): How many sessions may run at once; clients past
+            that wait for a session to end.
+        on_done (callable): Called with every Session once its run ends,
+            on the asyncio loop.
+        size (tuple): (width, height) of a terminal until its client
+            reports its size.
+        backlog (int): Connections the socket queues before they are
+            accepted.
+
+    Attributes:
+        active (set): The running Sessions.
+        slots (asyncio.Semaphore): Taken by every running Session.
+
+    """
+
+    def __init__(self, form, path, sessions=4096, on_done=None,
+                 size=(80, 24), backlog=1024):
+        self.form = form
+        self.path = path
+        self.on_done = on_done
+        self.size = size
+        self.backlog = backlog
+        self.active = set()
+        self.slots = asyncio.Semaphore(sessions)
+        self.server = None
+
+    async def _serve(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        thread = threading.get_ident()
+
+        def send(data):
+            # frames are drawn on the loop, but handlers may draw from the
+            # pool
+            if threading.get_ident() == thread:
+                writer.write(data)
+            else:
+                loop.call_soon_threadsafe(writer.write, data)
+
+        terminal = AnsiTerminal(send, *self.size)
+        session = Session(self.form.spawn(), terminal)
+        feed = asyncio.ensure_future(self._feed(reader, terminal))
+        try:
+            async with self.slots:
+                self.active.add(session)
+                await session.form.start_async(terminal)
+        except Exception as err:
+            # eg. EOFError when the client hung up
+            session.error = err
+        finally:
+            feed.cancel()
+            self.active.discard(session)
+            # after the frames handlers queued
+            loop.call_soon(writer.close)
+        if self.on_done is not None:
+            self.on_done(session)
+
+    async def _feed(self, reader, terminal):
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                terminal.feed(data)
+        finally:
+            terminal.hang_up()
+
+    async def start(self):
+        """Starts listening; returns once the socket is ready."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(
+            self._serve, self.path, backlog=self.backlog)
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for session in list(self.active):
+            session.terminal.hang_up()
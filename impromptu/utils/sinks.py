@@ -0,0 +1,156 @@
+"""Response sinks that receive every answer as soon as it is given.
+
+Impromptu hands each answer to its sinks right after the Question is
+closed, so processing can start while the rest of the form is still being
+asked. A sink is an object with emit(name, value) and close() methods;
+plain functions are wrapped in a CallbackSink.
+
+"""
+import abc
+import asyncio
+import json
+import os
+import queue
+import time
+
+# put on the queue of an IteratorSink once it is closed
+_DONE = object()
+
+
+class Sink(abc.ABC):
+    """Base class of the response sinks.
+
+    Subclasses have to override emit(); close() does nothing by default.
+    """
+
+    @abc.abstractmethod
+    def emit(self, name, value):
+        """Receives the answer value of the Question called name."""
+
+    def close(self):
+        pass
+
+
+class CallbackSink(Sink):
+    """Calls fn(name, value) for every answer.
+
+    Args:
+        fn (callable): Called on the prompt thread; keep it short.
+
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def emit(self, name, value):
+        self.fn(name, value)
+
+
+class IteratorSink(Sink):
+    """Yields (name, value) pairs as they are answered.
+
+    Iterate it (or async iterate it from an asyncio application) on
+    another thread than the prompt; iteration ends once the form does.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def emit(self, name, value):
+        self._queue.put((name, value))
+
+    def close(self):
+        self._queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                # let other iterators see the end as well
+                self._queue.put(_DONE)
+                return
+            yield item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        item = await loop.run_in_executor(None, self._queue.get)
+        if item is _DONE:
+            self._queue.put(_DONE)
+            raise StopAsyncIteration
+        return item
+
+
+class JSONLinesSink(Sink):
+    """Appends every answer to a file as a line of JSON.
+
+    Each line is flushed to the OS as soon as it is written, so a crash of
+    the process loses at most the answer being written. fsync is batched:
+    it runs every batch lines or every interval seconds, whichever comes
+    first, and on close.
+
+    Args:
+        path (str): The file to append to; created if missing.
+        batch (int): Lines written between two fsyncs.
+        interval (float): Seconds after which pending lines are synced
+            regardless of batch.
+
+    """
+
+    def __init__(self, path, batch=16, interval=1.0, encoding="utf-8"):
+        self.path = path
+        self.batch = batch
+        self.interval = interval
+        self.pending = 0
+        self.synced = time.monotonic()
+        self._file = open(path, "a", encoding=encoding)
+
+    def emit(self, name, value):
+        line = json.dumps({"name": name, "value": value}, default=str)
+        self._file.write(line + "\n")
+        self._file.flush()
+        self.pending += 1
+        if (self.pending >= self.batch or
+                time.monotonic() - self.synced >= self.interval):
+            self.sync()
+
+    def sync(self):
+        """Forces the written lines to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.pending:
+            self.sync()
+        self._file.close()
+
+    @staticmethod
+    def read(path, encoding="utf-8"):
+        """Returns the answers of a file as a name -> value dict.
+
+        A torn last line (left by a crash mid-write) is ignored.
+        """
+        responses = {}
+        with open(path, encoding=encoding) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                responses[entry["name"]] = entry["value"]
+        return responses
+
+
+def as_sink(sink):
+    """Wraps plain callables in a CallbackSink."""
+    if isinstance(sink, Sink) or hasattr(sink, "emit"):
+        return sink
+    if callable(sink):
+        return CallbackSink(sink)
+    raise TypeError(f"Not a response sink: {sink!r}")
@@ -0,0 +1,74 @@
+"""Lazy sources of choices for ChoiceSelect and MultiSelect.
+
+The choice widgets accept any sequence-like object: something with
+__len__ and a __getitem__ taking an integer index. Only the rows inside
+the visible window are ever looked up, so a source can fetch its labels
+on demand. PagedSource turns a paged callable (eg. an API listing or a
+database cursor) into such a sequence, keeping a few pages cached.
+
+Typeahead has to index every label up front, which would fetch every
+page, so the widgets only typeahead through choices held in a list or a
+tuple.
+
+"""
+from collections import OrderedDict
+
+
+class PagedSource(object):
+    """A read-only sequence of choices fetched one page at a time.
+
+    Args:
+        fetch (callable): fetch(offset, limit) returns the list of labels
+            from offset, at most limit long.
+        length (int or callable): The total number of choices, or a
+            function returning it; its answer is kept until invalidate().
+        page_size (int): How many labels are fetched per call.
+        cache_pages (int): How many pages are kept in memory.
+
+    """
+
+    def __init__(self, fetch, length, page_size=256, cache_pages=8):
+        self.fetch = fetch
+        self._length = length
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._pages = OrderedDict()
+        # the length answered by a length callable, until invalidate()
+        self._count = None
+
+    def __len__(self):
+        if not callable(self._length):
+            return self._length
+        if self._count is None:
+            self._count = self._length()
+        return self._count
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is None:
+            page = list(self.fetch(number * self.page_size, self.page_size))
+            self._pages[number] = page
+            if len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        return page
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PagedSource index out of range")
+        number, offset = divmod(index, self.page_size)
+        return self._page(number)[offset]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def invalidate(self):
+        """Drops the cached pages and length, eg. after the data changed."""
+        self._pages.clear()
+        self._count = None
@@ -0,0 +1,102 @@
+"""A gap buffer for the text of input fields.
+
+The characters are kept in a list with a gap at the last edit point, so
+typing or deleting at the cursor only touches the characters next to it
+instead of rebuilding the whole string on every key press.
+
+"""
+
+
+class GapBuffer(object):
+    """Editable sequence of characters backed by a list with a gap.
+
+    Attributes:
+        version (int): Incremented on every change; use it to cache
+            anything derived from the text.
+
+    """
+
+    def __init__(self, text="", gap=64):
+        self._buf = list(text) + [None] * gap
+        self._start = len(text)
+        self._end = len(self._buf)
+        self._text = (text, 0)
+        self.version = 0
+
+    def __len__(self):
+        return len(self._buf) - (self._end - self._start)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("GapBuffer index out of range")
+        if i < self._start:
+            return self._buf[i]
+        return self._buf[i + self._end - self._start]
+
+    def __str__(self):
+        return self.text()
+
+    def _move_gap(self, pos):
+        buf = self._buf
+        if pos < self._start:
+            n = self._start - pos
+            buf[self._end - n:self._end] = buf[pos:self._start]
+            self._start -= n
+            self._end -= n
+        elif pos > self._start:
+            n = pos - self._start
+            buf[self._start:pos] = buf[self._end:self._end + n]
+            self._start += n
+            self._end += n
+
+    def _grow(self, needed):
+        grow = max(needed, len(self._buf), 64)
+        self._buf[self._end:self._end] = [None] * grow
+        self._end += grow
+
+    def insert(self, pos, text):
+        n = len(text)
+        if not n:
+            return
+        self._move_gap(pos)
+        if self._end - self._start < n:
+            self._grow(n)
+        self._buf[self._start:self._start + n] = text
+        self._start += n
+        self.version += 1
+
+    def delete(self, start, end):
+        """Removes the characters in [start, end) and returns them."""
+        end = min(end, len(self))
+        if start >= end:
+            return ""
+        self._move_gap(start)
+        removed = "".join(self._buf[self._end:self._end + end - start])
+        self._end += end - start
+        self.version += 1
+        return removed
+
+    def iter_from(self, i):
+        """Yields the characters from position i onwards."""
+        buf, start, gap = self._buf, self._start, self._end - self._start
+        n = len(self)
+        while i < n:
+            yield buf[i] if i < start else buf[i + gap]
+            i += 1
+
+    def iter_back(self, i):
+        """Yields the characters before position i, nearest first."""
+        buf, start, gap = self._buf, self._start, self._end - self._start
+        while i > 0:
+            i -= 1
+            yield buf[i] if i < start else buf[i + gap]
+
+    def text(self):
+        # joined lazily and cached until the next change
+        if self._text[1] != self.version:
+            value = "".join(self._buf[:self._start]) + \
+                "".join(self._buf[self._end:])
+            self._text = (value, self.version)
+        return self._text[0]
@@ -0,0 +1,172 @@
+"""Compiled styles used to draw Questions.
+
+The config of a Question keeps colors as (fg, attr, bg) triplets and
+texts as (str, colormap) pairs with one triplet per character. Drawing
+them as is means zipping characters with colors and resolving fg | attr
+for every cell of every frame. A Theme compiles such a config once:
+
+* colors become interned Styles, with the pen (fg | attr) resolved;
+* (str, colormap) pairs become StyledTexts, ie. runs of characters that
+  share a Style, each drawn with a single cli.write().
+
+Themes are interned by config, so every Question with the same config
+(usually a whole form) draws from the same compiled Theme.
+
+"""
+import weakref
+from functools import lru_cache
+
+# (fg, attr, bg) -> Style
+_styles = {}
+# frozen config -> Theme
+_themes = weakref.WeakValueDictionary()
+
+
+class Style(object):
+    """An interned color, ready to be handed to the cli.
+
+    Attributes:
+        fg (int): Foreground color.
+        attr (int): Attribute bits (eg. bold), or'ed into the foreground.
+        bg (int): Background color.
+        pen (int): fg | attr, the foreground the cli expects.
+
+    """
+    __slots__ = ("fg", "attr", "bg", "pen")
+
+    def __init__(self, fg, attr, bg):
+        self.fg = fg
+        self.attr = attr
+        self.bg = bg
+        self.pen = fg | attr
+
+    @staticmethod
+    def of(color):
+        """Returns the Style of an (fg, attr, bg) or (fg, bg) color."""
+        style = _styles.get(color)
+        if style is None:
+            if len(color) == 2:
+                fg, bg = color
+                color = (fg, 0, bg)
+            style = _styles.get(color)
+            if style is None:
+                style = Style(*color)
+                _styles[color] = style
+        return style
+
+    def write(self, cli, x, y, text):
+        """Writes text at x, y and returns the column after it."""
+        cli.write(x, y, text, self.pen, self.bg)
+        return x + len(text)
+
+    def __repr__(self):
+        return f"Style({self.fg}, {self.attr}, {self.bg})"
+
+
+PLAIN = Style.of((0, 0, 0))
+
+
+def draw(cli, x, y, spans):
+    """Writes (text, Style) spans one after the other from x, y.
+
+    Returns the column after the last span.
+    """
+    for text, style in spans:
+        cli.write(x, y, text, style.pen, style.bg)
+        x += len(text)
+    return x
+
+
+class StyledText(object):
+    """Text kept as runs of characters sharing a Style.
+
+    Attributes:
+        text (str): The whole text.
+        spans (tuple): (text, Style) runs, in order.
+
+    """
+    __slots__ = ("text", "spans")
+
+    def __init__(self, spans):
+        self.spans = tuple(spans)
+        self.text = "".join(text for text, _ in self.spans)
+
+    @classmethod
+    def of(cls, text, colormap):
+        """Compiles a text and its colormap (one color per character).
+
+        Like zip(), characters past the end of the colormap are dropped.
+        """
+        spans = []
+        text = text[:len(colormap)]
+        start = 0
+        for i in range(1, len(text) + 1):
+            if i == len(text) or colormap[i] != colormap[start]:
+                spans.append((text[start:i], Style.of(tuple(colormap[start]))))
+                start = i
+        return cls(spans)
+
+    def __len__(self):
+        return len(self.text)
+
+    def draw(self, cli, x, y):
+        """Writes the runs from x, y and returns the column after them."""
+        return draw(cli, x, y, self.spans)
+
+    def __repr__(self):
+        return f"StyledText({self.spans!r})"
+
+
+@lru_cache(maxsize=4096)
+def styled(text, colormap):
+    """Returns the StyledText of text and its (frozen) colormap."""
+    return StyledText.of(text, colormap)
+
+
+def _is_color(value):
+    return type(value) is tuple and len(value) in (2, 3) and \
+        all(type(v) is int for v in value)
+
+
+def _is_styled(value):
+    return type(value) is tuple and len(value) == 2 and \
+        type(value[0]) is str and isinstance(value[1], (tuple, list))
+
+
+class Theme(object):
+    """The compiled config of a Question.
+
+    Indexing a Theme returns a StyledText for (str, colormap) entries, a
+    Style for colors, and any other entry (eg. linespace) as is.
+    """
+    __slots__ = ("_entries", "__weakref__")
+
+    def __init__(self, config):
+        entries = {}
+        for key, value in config.items():
+            if _is_color(value):
+                value = Style.of(value)
+            elif _is_styled(value):
+                value = styled(value[0], tuple(map(tuple, value[1])))
+            entries[key] = value
+        self._entries = entries
+
+    @classmethod
+    def compile(cls, config):
+        """Returns the interned Theme of a (frozen) config mapping."""
+        key = tuple(sorted(config.items()))
+        try:
+            theme = _themes.get(key)
+        except TypeError:
+            # unhashable values are compiled every time
+            return cls(config)
+        if theme is None:
+            theme = cls(config)
+            _themes[key] = theme
+        return theme
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __contains__(self, key):
+        return key in self._entries
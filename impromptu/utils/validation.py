@@ -0,0 +1,184 @@
+"""Incremental validation of text inputs.
+
+A Validator is compiled once per validation of a Question definition and
+shared with every spawned copy: regex conditions are compiled up front.
+Each run of the Question then gets a ValidationRun, which
+
+* only checks the conditions again when the text changed,
+* remembers the outcome of every condition by text, so that typing a
+  character and erasing it does not check anything again,
+* waits for the text to stay unchanged for the debounce interval of a
+  validation before checking it,
+* checks slow conditions (background=True, or async functions) off the
+  prompt thread, and drops or cancels the checks made stale by a newer
+  text. Such conditions still read the live Question, so their outcome
+  is only kept if the text did not change at all while they ran.
+
+"""
+import asyncio
+import inspect
+import re
+from collections import OrderedDict
+from functools import partial
+
+from impromptu.utils.executor import shared_loop, shared_pool
+
+
+class Validator(object):
+    """A condition and the handler to run when it holds.
+
+    Args:
+        condition: A regex (str or compiled) searched in the text, or a
+            function of the Question returning True when its input is
+            invalid. Async functions are awaited on the shared loop.
+        handler (callable): Called with the Question when the condition
+            holds.
+        debounce (float): Seconds the text has to stay unchanged before
+            the condition is checked.
+        background (bool): Check a function condition on the shared
+            thread pool instead of the prompt thread.
+
+    Calling a Validator calls its handler, so it can stand in for the
+    handler in lifecycle["validations"].
+    """
+    __slots__ = ("condition", "handler", "debounce", "background",
+                 "is_async", "_search")
+
+    def __init__(self, condition, handler, debounce=0.0, background=False):
+        self.condition = condition
+        self.handler = handler
+        self.debounce = debounce
+        self.background = background
+        self.is_async = inspect.iscoroutinefunction(condition)
+        if isinstance(condition, str):
+            self._search = re.compile(condition).search
+        elif isinstance(condition, re.Pattern):
+            self._search = condition.search
+        else:
+            self._search = None
+
+    def __call__(self, question, *args, **kwargs):
+        return self.handler(question, *args, **kwargs)
+
+    @property
+    def deferred(self):
+        """Whether the condition is checked off the prompt thread."""
+        return self._search is None and (self.background or self.is_async)
+
+    def check(self, question, text):
+        """Returns True if the condition holds, blocking until it is known."""
+        if self._search is not None:
+            return self._search(text) is not None
+        result = self.condition(question)
+        if inspect.isawaitable(result):
+            result = asyncio.run_coroutine_threadsafe(
+                result, shared_loop()).result()
+        return bool(result)
+
+    def start(self, question, text):
+        """Starts checking the condition off the prompt thread.
+
+        Returns a concurrent.futures Future of the outcome; cancelling it
+        also cancels an async condition that is still awaiting.
+        """
+        if self.is_async:
+            return asyncio.run_coroutine_threadsafe(
+                self._outcome(question), shared_loop())
+        return shared_pool("thread").submit(self.check, question, text)
+
+    async def _outcome(self, question):
+        return bool(await self.condition(question))
+
+
+class ValidationRun(object):
+    """The validations of one run of a TextInput.
+
+    Args:
+        question (TextInput): The Question validated; its loop runs the
+            debounce timers and the settling of deferred checks.
+        memo (int): How many (validation, text) outcomes are remembered.
+
+    Attributes:
+        text (str): The text the latest outcomes are for.
+        mark: Identifies the edit of the text that update() was last
+            called for; defaults to the text itself.
+        pending (dict): Validator -> the Timer or Future of its check.
+
+    """
+    __slots__ = ("question", "text", "mark", "pending", "_memo", "_size")
+
+    def __init__(self, question, memo=256):
+        self.question = question
+        self.text = None
+        self.mark = None
+        self.pending = {}
+        self._memo = OrderedDict()
+        self._size = memo
+
+    def update(self, text, validators, mark=None):
+        """Validates text, the new text of the Question.
+
+        mark tells edits apart that lead to the same text (eg. typing a
+        rune and erasing it), such as the version of the text buffer.
+        """
+        self.cancel()
+        self.text = text
+        self.mark = text if mark is None else mark
+        loop = self.question.loop
+        for validator in validators:
+            failed = self._memo.get((validator, text))
+            if failed is not None:
+                self._memo.move_to_end((validator, text))
+                self._settled(validator, text, failed)
+            elif validator.debounce > 0 and loop is not None:
+                self.pending[validator] = loop.call_later(
+                    validator.debounce, partial(self._start, validator, text))
+            else:
+                self._start(validator, text)
+
+    def _start(self, validator, text):
+        self.pending.pop(validator, None)
+        question = self.question
+        if not validator.deferred or question.loop is None:
+            self._checked(validator, text, validator.check(question, text))
+            return
+        future = validator.start(question, text)
+        self.pending[validator] = future
+        future.add_done_callback(
+            partial(self._finished, validator, text, self.mark))
+
+    def _finished(self, validator, text, mark, future):
+        # called on the thread that ran the check, settled on the loop
+        loop = self.question.loop
+        if not future.cancelled() and loop is not None:
+            loop.post(partial(self._done, validator, text, mark, future))
+
+    def _done(self, validator, text, mark, future):
+        if self.pending.get(validator) is future:
+            del self.pending[validator]
+        if mark != self.mark:
+            # the text was edited while the condition read it: whatever
+            # it found may be about another text, drop it
+            return
+        # raises what the condition raised, like a check on the loop
+        self._checked(validator, text, future.result())
+
+    def _checked(self, validator, text, failed):
+        self._memo[(validator, text)] = failed
+        if len(self._memo) > self._size:
+            self._memo.popitem(last=False)
+        self._settled(validator, text, failed)
+
+    def _settled(self, validator, text, failed):
+        # outcomes of a stale text are remembered but not acted upon
+        if failed and text == self.text:
+            question = self.question
+            # don't pile up error handlers while one is still showing
+            question._submit_handler(validator, partial(validator, question),
+                                     policy="skip")
+
+    def cancel(self):
+        """Cancels the timers and checks that have not finished yet."""
+        for pending in self.pending.values():
+            pending.cancel()
+        self.pending.clear()
@@ -0,0 +1,55 @@
+"""A cached oracle for the display width of runes.
+
+Asking the backend for the width of every rune on every cursor move and
+redraw means a call across the Intermezzo boundary per character. The
+oracle asks the backend once per rune and answers from its own tables
+afterwards, so its results are always the backend's results.
+
+"""
+from functools import lru_cache
+
+# a BMP rune that has not been asked for yet
+UNKNOWN = 255
+
+
+class WidthOracle(object):
+    """Caches the rune_width function of a backend.
+
+    ASCII and Latin-1 widths are read from the backend up front, the rest
+    of the BMP fills a flat table on demand and anything beyond the BMP
+    goes through an LRU cache.
+
+    Attributes:
+        rune_width (callable): The backend function being cached.
+
+    """
+
+    def __init__(self, rune_width, lru_size=4096):
+        self.rune_width = rune_width
+        self._table = bytearray([UNKNOWN]) * 0x10000
+        for o in range(0x100):
+            self._table[o] = rune_width(chr(o))
+        # whether printable ASCII is one cell per rune on this backend
+        self._ascii_ones = all(self._table[o] == 1 for o in range(32, 127))
+        self._astral = lru_cache(maxsize=lru_size)(rune_width)
+
+    def width(self, r):
+        o = ord(r)
+        if o < 0x10000:
+            w = self._table[o]
+            if w == UNKNOWN:
+                w = self._table[o] = self.rune_width(r)
+            return w
+        return self._astral(r)
+
+    def string_width(self, s):
+        """Returns the summed width of every rune in s."""
+        if self._ascii_ones and s.isascii() and s.isprintable():
+            return len(s)
+        table, width = self._table, self.width
+        total = 0
+        for r in s:
+            o = ord(r)
+            w = table[o] if o < 0x10000 else UNKNOWN
+            total += w if w != UNKNOWN else width(r)
+        return total
@@ -12,7 +12,7 @@ q1 = fields.PasswordInput(name="name", query="What is your name?")
 def validation(self):
     mzo = self.cli
     w, h = mzo.size()
-    error_msg = f"Error: This is an invalid answer | {len(self._threads)}"
+    error_msg = f"Error: This is an invalid answer | {self.executor.active}"
     for i in range(w):
         mzo.set_cell(i, h-3, "_", mzo.color("Red"), 0)
     for i, c in enumerate(error_msg):